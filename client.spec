@@ -6,9 +6,9 @@ block_cipher = None
 
 a = Analysis(
     ['client/src/client.py'],
-    pathex=['.', 'client/src'],
+    pathex=['.', 'client/src', 'server/src'],
     binaries=[],
-    datas=[('client/assets', 'assets')],
+    datas=[('client/assets', 'assets'), ('server/data', 'data')],
 )
 pyz = PYZ(a.pure, a.zipped_data, cipher=block_cipher)
 
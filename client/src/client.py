@@ -3,6 +3,7 @@ import os
 import sys
 
 sys.path.insert(1, os.path.join(sys.path[0], '..', '..'))  # fix common imports
+sys.path.append(os.path.join(sys.path[0], '..', '..', 'server', 'src'))  # server imports for singleplayer games
 
 import json
 from pathlib import Path
@@ -12,31 +13,36 @@ from camera import *
 from config import ClientConfig
 from client_networking import ClientNetworking
 from client_renderer import ClientRenderer
+from map_cache import MapCache
 from common.src.map.map import Map
-from entities import ClientEntity
+from entities import ClientEntity, ClientPlayer
+from server import Server
 
 
 class Client:
     def __init__(self):
         pygame.init()  # we need to call init() before we can use pygame fonts for rendering
         self.clock = pygame.time.Clock()  # used for getting the delta time each frame
+        # cache of the maps we downloaded, so we don't have to download them again when reconnecting
+        self.map_cache = MapCache(os.path.join(Client.get_config_dir(), "maps"))
         self.networking = ClientNetworking(self)  # networking instance for sending and receiving packets
         self.config: ClientConfig = self._get_config()  # configuration of the client, loaded from config.json
         self.renderer = ClientRenderer(self)  # renderer instance for handling rendering
         self.map: Map | None = None  # the map we're currently on
+        self.server: Server | None = None  # the server of our singleplayer game, running in our main loop
         self.running = True  # whether the client game is running or not
         self.player = None  # gets assigned when we "get" our player from the server
-        self.player_uuid = None  # gets assigned when we "get" our player from the server; unique identifier of the player
-        self.entities: list[ClientEntity] = []  # other entities, can also be other players
+        self.player_id = None  # gets assigned when we "get" our player from the server; entity id of the player
+        self.entities: dict[int, ClientEntity] = {}  # other entities by their entity id, can also be other players
         # State of the client. See client_state.py for more info.
         self.state = client_state.MAIN_MENU  # the current state of the client; see client_state.py for more info
 
     @staticmethod
-    def get_config_file():
+    def get_config_dir():
         """
-        Gets the path of the config.json file. On Windows this is %localappdata%/TombstoneTunnels/config.json, on
-        Linux this is ~/.TombstoneTunnels/config.json. MacOS is not supported yet.
-        :return: The path to the config.json file, depending on the operating system.
+        Gets the directory of the client's files (config, map cache). On Windows this is
+        %localappdata%/TombstoneTunnels, on Linux this is ~/.TombstoneTunnels. MacOS is not supported yet.
+        :return: The path to the directory, depending on the operating system.
         """
         config_dir = os.getenv("localappdata")
         if not config_dir or not os.path.exists(config_dir):  # we're probably on linux - todo macos support?
@@ -48,7 +54,15 @@ class Client:
         if not os.path.exists(config_dir):
             # create the config directory if it doesn't exist
             os.makedirs(config_dir)
-        return os.path.join(config_dir, "config.json")
+        return config_dir
+
+    @staticmethod
+    def get_config_file():
+        """
+        Gets the path of the config.json file in the config directory (see get_config_dir()).
+        :return: The path to the config.json file, depending on the operating system.
+        """
+        return os.path.join(Client.get_config_dir(), "config.json")
 
     @staticmethod
     def _get_config():
@@ -92,11 +106,21 @@ class Client:
         except ValueError:
             pass
 
+    def start_singleplayer(self):
+        """
+        Start a singleplayer game: run a server without socket in our main loop and log in to it. The packets are
+        passed to the server (and back) in memory, without serializing them; see common/src/loopback.py.
+        """
+        self.server = Server(address=None)
+        self.state = client_state.CONNECTING
+        self.networking.login_loopback(self.server.connect_loopback())
+
     def _disconnect(self):
         """Reset variables. Note that networking.disconnect() has to be called separately (when necessary)."""
         self.state = client_state.MAIN_MENU
+        self.server = None  # stop the server of our singleplayer game
         self.player = None
-        self.player_uuid = None
+        self.player_id = None
         self.entities.clear()
 
     def run(self):
@@ -111,6 +135,8 @@ class Client:
                     self._disconnect()
             # tick the renderer and the client
             self.tick(events, dt)
+            if self.server:
+                self.server.tick()  # handles the packets we sent in this tick, e.g. our inputs
             self.renderer.tick(self.state, events, dt)
 
     def tick(self, events, dt):
@@ -129,6 +155,9 @@ class Client:
                 elif event.key == pygame.K_F3:
                     # toggle debugger
                     self.renderer.debugger.enabled = not self.renderer.debugger.enabled
+                elif event.key == pygame.K_TAB and self.networking.spectating:
+                    # spectators switch to the next player
+                    self.follow_next_player()
                 elif event.key == pygame.K_ESCAPE:
                     # escape key pressed; either disconnect from server or exit the game
                     if self.state == client_state.MAIN_MENU:
@@ -142,12 +171,28 @@ class Client:
         if self.player:
             # update the player
             self.player.update(dt, self.renderer.tilemap, events)
+        elif self.networking.spectating:
+            target = self.renderer.camera.target
+            if not target or self.entities.get(target.entity_id) is not target:
+                # we don't follow a player yet, or the player left
+                self.follow_next_player()
 
-        for entity in (self.entities + [self.player]):
+        for entity in (list(self.entities.values()) + [self.player]):
             if entity:
                 # tick all entities
                 entity.tick(dt, events)
 
+    def follow_next_player(self):
+        """Spectators: let the camera follow the next player (ordered by entity id), if there are players."""
+        players = sorted((entity for entity in self.entities.values() if isinstance(entity, ClientPlayer)),
+                         key=lambda player: player.entity_id)
+        if not players:
+            return
+        target = self.renderer.camera.target
+        following = next((index for index, player in enumerate(players) if player is target), -1)
+        self.renderer.camera.target = players[(following + 1) % len(players)]
+        print(f"Spectating {self.renderer.camera.target.name}.")
+
     def update_player(self, player):
         """Set our player and advise the camera to target the player."""
         self.player = player
@@ -8,12 +8,19 @@ from socket import socket, AF_INET, SOCK_DGRAM
 import requests as requests
 
 import client_state
-from common.src import networking
+from common.src import compression, networking
+from common.src.loopback import Loopback
+from common.src.map.generation import GENERATOR_VERSIONS, MapSeed, generate_map
 from common.src.map.map import Map
+from common.src.map.transfer import MapDownload, encode_map, hash_map_data
+from common.src.router import PacketRouter
+from common.src.snapshots import EntityState, apply_delta, decode_world, hash_entity_ids
 from entities import *
 
 PING_INTERVAL = 1  # we send a ping packet every second
 PONG_TIMEOUT = 5  # we wait 5 seconds for a pong packet before we assume that the connection to the server is lost
+RESUME_TIMEOUT = 20  # seconds we try to resume our session after the connection was lost, before we give up
+HELLO_RETRY_INTERVAL = 1  # seconds between the HelloPackets while we try to resume our session
 
 
 class ClientNetworking:
@@ -22,7 +29,8 @@ class ClientNetworking:
     logging in, disconnecting, etc. This class is used by the Client class. Every tick we check if we have received
     any packets from the server and handle them accordingly. We also send a ping packet every second to the server
     and wait for a pong packet. If we don't receive a pong packet within 5 seconds, we assume that the connection
-    to the server is lost and disconnect.
+    to the server is lost and try to resume our session for a while, keeping our game state; if that doesn't work,
+    we disconnect.
     """
     DEFAULT_SERVER_PORT = 5857
 
@@ -32,9 +40,28 @@ class ClientNetworking:
         self.global_address = self.get_public_address()
         self.current_address = self.global_address
         self.socket.setblocking(False)  # don't block the current thread when receiving packets
-        self.token = None  # auth token that we get from the server when it accepts our HelloPacket
+        self.loopback: Loopback | None = None  # connection to the server of a singleplayer game instead of the socket
+        self.spectating = False  # whether we only watch the game, without a player; see HelloPacket.spectator
+        # session that we get from the server when it accepts our HelloPacket; we sign our datagrams with it
+        self.session_id = 0  # 0 if we are not logged in
+        self.session_key: bytes | None = None
+        self.resume_token = b""  # token for resuming our session after the connection broke off
+        self.resume_started: float | None = None  # time we started to resume our session; None if we don't
+        self.last_hello = 0  # time we sent the last HelloPacket
+        self.codec = networking.CODEC_JSON  # packet codec; negotiated with the server in the HelloPacket handshake
+        self.compressed = False  # whether we compress big packets; negotiated in the handshake, too
+        self.channel = networking.ReliableChannel()  # reliable channel to the server, see networking.py
         self.last_ping = time()
         self.last_server_pong = time()
+        self.snapshot_tick = 0  # tick of the newest entity snapshot we applied
+        self.snapshots: dict[int, dict[int, EntityState]] = {}  # entity snapshots the server may use as baseline
+        self.map_download: MapDownload | None = None  # download of the current map, while it is not complete
+        self.map_hash = ""  # hash of the current map as the server announced it, i.e. without the tile changes
+        self.pending_tile_changes: list[tuple[int, int, str]] = []  # tile changes received during the map download
+        self.join_snapshot_parts: list[bytes] = []  # parts of the join snapshot received so far
+        # router dispatching received packets to our handler for the packet type
+        self.router = PacketRouter()
+        self._register_handlers()
 
     @staticmethod
     def get_public_address():
@@ -50,16 +77,20 @@ class ClientNetworking:
             print(e)
             return "localhost"
 
-    def try_login(self, custom: bool = False):
+    def try_login(self, custom: bool = False, spectate: bool = False):
         """
         Try to connect/authorize to the server. This sends a HelloPacket to the server. If the server accepts our login,
-        it will send us a HelloReplyPacket with our auth token. We save this token and use it for all future packets
-        where we need to be authorized, e.g. when we send a PlayerMovePacket.
+        it will send us a HelloReplyPacket with our session. We save it and sign all future datagrams with it, so the
+        server accepts the packets where we need to be authorized, e.g. when we send a ChangeInputPacket.
 
         :param custom: If True, we try to connect to the custom server address that the user has entered on the main
         menu (e.g. "localhost"). If False, we try to connect to the public server address.
+        :param spectate: If True, we log in as spectator: we get no player, but all entities of the game. The server
+        can also be a relay for spectators (see server/src/relay.py).
         """
         # todo try connect in thread + fix multiple connection tries when clicking fast
+        self.loopback = None
+        self.spectating = spectate
         if not self.socket:
             self.socket = socket(AF_INET, SOCK_DGRAM)
 
@@ -71,135 +102,365 @@ class ClientNetworking:
         try:
             self.socket.connect(self.current_address)
             self.socket.setblocking(False)
-
-            # Try to send a HelloPacket to the server.
-            packet = HelloPacket(self.client.config.player_name)
-            self.send_packet(packet)
-            self.last_server_pong = time()
-            print("Sent login packet.")
+            self._login()
         except Exception as e:
             # we could not connect to the server; go back to main menu
             print("Could not connect to server:")
             print(e)
             self.client.state = client_state.MAIN_MENU
 
+    def login_loopback(self, loopback: Loopback):
+        """
+        Log in to a server running in this process, e.g. for a singleplayer game, like to a server on the network
+        (see try_login()). The packets are exchanged with the loopback instead of the socket; see common/src/loopback.py.
+        """
+        print("Connecting to the local server")
+        self.spectating = False
+        if self.socket:
+            self.socket.close()
+            self.socket = None
+        self.loopback = loopback
+        self._login()
+
+    def _login(self):
+        """Start a new session with the server; see try_login()."""
+        self.resume_token = b""
+        self.resume_started = None
+        self.snapshot_tick = 0
+        self.snapshots.clear()
+        self._send_hello()
+        self.last_server_pong = time()
+        print("Sent login packet.")
+
+    def _reset_session(self):
+        """Forget the state of our session with the server before logging in (again)."""
+        self.codec = networking.CODEC_JSON
+        self.compressed = False
+        self.session_id = 0
+        self.session_key = None
+        self.channel = networking.ReliableChannel()
+        self.map_download = None
+        self.pending_tile_changes.clear()  # the server sends all tile changes again
+        self.join_snapshot_parts.clear()
+
+    def _send_hello(self):
+        """
+        Send a HelloPacket to the server, to log in or - while resume_started is set - to resume our session. It is
+        always sent as json; the server replies with the codec it picked from our supported codecs.
+        """
+        self._reset_session()
+        packet = HelloPacket(self.client.config.player_name, list(networking.CODECS), list(compression.COMPRESSIONS),
+                             self.client.map_cache.hashes()[:self.client.map_cache.MAX_ENTRIES],
+                             list(GENERATOR_VERSIONS), spectator=self.spectating)
+        if self.resume_started is not None:
+            # tell the server what we still have, so it only sends us what changed since
+            packet.resume_token = self.resume_token
+            packet.resume_snapshot = self.snapshot_tick
+            packet.resume_entities_hash = hash_entity_ids([*self.client.entities, self.client.player.entity_id])
+            packet.resume_map_hash = self.map_hash
+        self.send_packet(packet)
+        self.last_hello = time()
+
+    def _resume(self) -> bool:
+        """
+        Try to resume our session after the connection to the server broke off, e.g. after a short Wi-Fi outage.
+        Called every tick while we don't get pongs; sends a HelloPacket with our resume token every
+        HELLO_RETRY_INTERVAL seconds. Meanwhile, the game state is kept and the game goes on locally.
+        :return: False if we can't resume our session (anymore), i.e. we have to disconnect
+        """
+        if not self.resume_token or not self.client.player or self.loopback:
+            return False  # the server of a singleplayer game doesn't lose us; it stopped
+        now = time()
+        if self.resume_started is None:
+            print("Connection to server lost. Trying to resume our session...")
+            self.resume_started = now
+        elif now - self.resume_started > RESUME_TIMEOUT:
+            self.resume_started = None
+            return False
+        if now - self.last_hello >= HELLO_RETRY_INTERVAL:
+            # use a new socket, as our address may have changed (and the server will see a new port anyway)
+            self.socket.close()
+            self.socket = socket(AF_INET, SOCK_DGRAM)
+            self.socket.connect(self.current_address)
+            self.socket.setblocking(False)
+            self._send_hello()
+        return True
+
     def disconnect(self):
-        if self.token:
+        if self.session_id:
             # we are connected
             packet = DisconnectPacket()
             self.send_packet(packet)
             print("Sent disconnect packet.")
-        self.token = None
-        self.socket.shutdown(2)
-        self.socket = None
+        self._reset_session()
+        self.resume_token = b""
+        self.resume_started = None
+        if self.socket:
+            self.socket.shutdown(2)
+            self.socket = None
+        self.loopback = None
 
     def send_packet(self, packet: Packet):
         """
         Sends a packet to the server.
 
         Here we check if the packet is of type AuthorizedPacket. If this is the case,
-        we require the token variable to be set and add it to the packet.
+        we require to be logged in, as the server only accepts it in a datagram signed with our session.
         """
-        if isinstance(packet, AuthorizedPacket):
-            if self.token is None:
-                raise Exception("Token is not set but required for this packet.")
-            packet.token = self.token
+        if isinstance(packet, AuthorizedPacket) and not self.session_id:
+            if self.resume_started is not None:
+                return  # we are resuming our session; e.g. our inputs are sent again afterwards anyway
+            raise Exception("Session is not set but required for this packet.")
 
-        data = networking.serialize(packet)
-        self.socket.sendto(data, self.current_address)
+        if self.loopback:
+            self.loopback.to_server.append(packet)  # not serialized; see Loopback
+            return
+        frame_buffer = networking.FrameBuffer(self.channel)
+        frame_buffer.add(networking.encode(packet, self.codec, self.compressed).data, packet.reliable)
+        self._send_frames(frame_buffer)
 
-    def _handle_packet(self, packet: Packet):
+    def _send_frames(self, frame_buffer: networking.FrameBuffer):
         """
-        Handle a packet that was received from the server.
-
-        This method is called by the try_receive method for each packet that was received.
+        Send the frames of the buffer; they carry the acknowledgements of our reliable channel. When we are logged
+        in, they are signed with our session.
         """
-        if isinstance(packet, HelloReplyPacket):
-            # after we sent the HelloPacket, the server can reply with a HelloReplyPacket when it accepts the login
-            if packet.token is None:
-                print("Server rejected our login.")
-                self.disconnect()
-                self.client.state = client_state.MAIN_MENU
+        for frame in frame_buffer.flush():
+            if self.session_id:
+                frame = networking.sign_datagram(frame, self.session_id, self.session_key)
+            self.socket.sendto(frame, self.current_address)
+
+    def _register_handlers(self):
+        """Register the handlers for all packets the server can send us on the packet router."""
+        self.router.register(HelloReplyPacket, self._on_hello_reply)
+        self.router.register(PongPacket, self._on_pong)
+        self.router.register(PlayerSpawnPacket, self._on_player_spawn)
+        self.router.register(EntitySpawnPacket, self._on_entity_spawn)
+        self.router.register(JoinSnapshotPacket, self._on_join_snapshot)
+        self.router.register(EntitySnapshotPacket, self._on_entity_snapshot)
+        self.router.register(EntityRemovePacket, self._on_entity_remove)
+        self.router.register(MapChangePacket, self._on_map_change)
+        self.router.register(MapChunkPacket, self._on_map_chunk)
+        self.router.register(TileChangePacket, self._on_tile_change)
+
+    def _find_entity(self, entity_id: int) -> ClientEntity | None:
+        """:return: the entity (or our player) with the specified entity id, or None if there is no such entity"""
+        if self.client.player and self.client.player.entity_id == entity_id:
+            return self.client.player
+        return self.client.entities.get(entity_id)
+
+    def _on_hello_reply(self, packet: HelloReplyPacket):
+        # after we sent the HelloPacket, the server can reply with a HelloReplyPacket when it accepts the login
+        if not packet.session_id:
+            print("Server rejected our login.")
+            self.disconnect()
+            self.client.state = client_state.MAIN_MENU
+        else:
+            if packet.resumed:
+                print("Server resumed our session.")
             else:
                 print("Server accepted our login.")
-                self.token = packet.token
-                self.client.player_uuid = packet.player_uuid
-                self.client.state = client_state.IN_GAME
-        elif isinstance(packet, PongPacket):
-            # pong packet should be sent by the server every second; after 5 seconds without a pong packet, we assume
-            # that the connection to the server is lost
-            print("Received pong packet.")
+                if self.resume_started is not None:
+                    # our old session expired; we start from scratch with a new player
+                    self.client.player = None
+                    self.client.entities.clear()
+                    self.snapshots.clear()
+                    self.snapshot_tick = 0
+            self.resume_started = None
+            self.resume_token = packet.resume_token
             self.last_server_pong = time()
-        elif isinstance(packet, PlayerSpawnPacket):
-            # the server sends us a PlayerSpawnPacket when a new player joins the game or when we join the game. When
-            # the latter is the case we can update our player object with the data (position) from the packet.
-            print("Received player spawn packet.")
-            if self.client.player_uuid == packet.uuid:
-                # this is our player
-                self.client.update_player(ClientPlayer(self, packet.name, packet.uuid, packet.tile_position))
+            self.session_id = packet.session_id
+            self.session_key = packet.session_key
+            self.codec = packet.codec
+            self.compressed = packet.compression in compression.COMPRESSIONS
+            self.client.player_id = packet.player_id
+            self.client.state = client_state.IN_GAME
+
+    def _on_pong(self, packet: PongPacket):
+        # pong packet should be sent by the server every half second; after 5 seconds without a pong packet, we assume
+        # that the connection to the server is lost
+        self.last_server_pong = time()
+        # echo it immediately, so the server can measure the round trip time; this counts as our ping, too
+        self.send_packet(PingPacket(packet.sequence))
+        self.last_ping = time()
+
+    def _spawn_player(self, name: str, entity_id: int, tile_position: Vector2) -> ClientPlayer:
+        player = ClientPlayer(self, name, entity_id, tile_position)
+        if self.client.player_id == entity_id:
+            # this is our player
+            self.client.update_player(player)
+        else:
+            # this is another player, add to entities
+            self.client.entities[entity_id] = player
+        return player
+
+    def _spawn_entity(self, entity_id: int, entity_type: str, tile_position: Vector2, health: int) -> ClientEntity:
+        entity = ClientEntity(entity_id, EntityType(entity_type), tile_position, health, hostile=True)
+        self.client.entities[entity_id] = entity
+        return entity
+
+    def _on_player_spawn(self, packet: PlayerSpawnPacket):
+        # the server sends us a PlayerSpawnPacket when another player comes near our player. (When we join the game,
+        # our player is part of the JoinSnapshotPacket.)
+        print("Received player spawn packet.")
+        player = self._spawn_player(packet.name, packet.entity_id, packet.tile_position)
+        self._apply_latest_state(player)
+
+    def _on_entity_spawn(self, packet: EntitySpawnPacket):
+        # the server sends us an EntitySpawnPacket when a new entity is spawned near our player (or comes near it).
+        # We can add this entity to our entities list. The entities list contains all entities including the players.
+        print("Received entity spawn packet.")
+        entity = self._spawn_entity(packet.entity_id, packet.entity_type, packet.tile_position, packet.health)
+        self._apply_latest_state(entity)
+
+    def _on_join_snapshot(self, packet: JoinSnapshotPacket):
+        # the server sends us all entities around our player (and our player) when we joined; the parts arrive in
+        # order, as the packet is reliable
+        if packet.index != len(self.join_snapshot_parts):
+            return  # part of an earlier login attempt
+        self.join_snapshot_parts.append(packet.data)
+        if len(self.join_snapshot_parts) < packet.count:
+            return
+        world = decode_world(b"".join(self.join_snapshot_parts))
+        self.join_snapshot_parts.clear()
+        print(f"Received join snapshot with {len(world)} entities.")
+        # set up the whole world at once
+        self.client.entities.clear()
+        for world_entity in world:
+            position = Vector2(world_entity.state.x, world_entity.state.y)
+            if world_entity.name:
+                entity = self._spawn_player(world_entity.name, world_entity.entity_id, position)
             else:
-                # this is another player, add to entities
-                self.client.entities.append(ClientPlayer(self, packet.name, packet.uuid, packet.tile_position))
-        elif isinstance(packet, EntitySpawnPacket):
-            # the server sends us an EntitySpawnPacket when a new entity is spawned in the game. We can add this entity
-            # to our entities list. The entities list contains all entities including the players.
-            print("Received entity spawn packet.")
-            self.client.entities.append(ClientEntity(packet.uuid, EntityType(packet.entity_type), packet.tile_position, packet.health, hostile=True))
-
-        elif isinstance(packet, EntityMovePacket):
-            # find entity in entities and update position
-            for entity in (self.client.entities + [self.client.player]):
-                if not entity:
-                    continue
-                if entity.uuid == packet.uuid:
-                    entity.tile_position = Vector2(packet.tile_position[0], packet.tile_position[1])
-                    break
-        elif isinstance(packet, EntityDirectionPacket):
-            # find entity in entities and update direction
-            for entity in (self.client.entities + [self.client.player]):
-                if not entity:
-                    continue
-                if entity.uuid == packet.uuid:
-                    entity.direction = Dir2(packet.direction)
-                    if entity.direction != Dir2.ZERO:
-                        entity.last_direction = entity.direction
-                    if entity.direction == Dir2.LEFT:
-                        entity.flip_image = True
-                    elif entity.direction == Dir2.RIGHT:
-                        entity.flip_image = False
-                    break
-        elif isinstance(packet, EntityRemovePacket):
-            # find player in entities and remove it
-            # get entity first to prevent concurrent modification?
-            client_entity = next((entity for entity in self.client.entities if entity.uuid == packet.uuid), None)
-            if client_entity:
-                self.client.entities.remove(client_entity)
-        elif isinstance(packet, EntityHealthPacket):
-            # find entity in entities and update health
-            for entity in (self.client.entities + [self.client.player]):
-                if not entity:
-                    continue
-                if entity.uuid == packet.uuid:
-                    if entity.health > packet.health:
-                        # damage animation
-                        entity.damage_animation_time = time()
-                        pass
-                    entity.health = packet.health
-                    break
-
-        elif isinstance(packet, MapChangePacket):
-            new_map = Map(packet.name, packet.tiles)
-            print(f"Received map change packet with map {new_map}.")
+                entity = self._spawn_entity(world_entity.entity_id, world_entity.entity_type, position,
+                                            world_entity.state.health)
+            self._apply_entity_state(entity, world_entity.state)
+
+    def _on_entity_snapshot(self, packet: EntitySnapshotPacket):
+        # the server sends us the changes from the last snapshot we acknowledged to its newest snapshot
+        if packet.tick <= self.snapshot_tick:
+            return  # we already applied this or a newer snapshot (the packet arrived late)
+        base = self.snapshots.get(packet.base_tick) if packet.base_tick else {}
+        if base is None:
+            return  # we no longer know the baseline; the server will send a delta against a newer one
+        snapshot, changed = apply_delta(base, packet.delta)
+        # the server only uses our acknowledged snapshots as baselines, and acknowledgements only move forward, so
+        # we don't need the snapshots older than this baseline anymore
+        self.snapshots = {tick: old for tick, old in self.snapshots.items() if tick >= packet.base_tick}
+        self.snapshots[packet.tick] = snapshot
+        self.snapshot_tick = packet.tick
+        self.send_packet(SnapshotAckPacket(packet.tick))
+
+        for entity_id in changed:
+            entity = self._find_entity(entity_id)
+            if entity:
+                self._apply_entity_state(entity, snapshot[entity_id])
+
+    def _apply_latest_state(self, entity: ClientEntity):
+        """Apply the state of a newly spawned entity, if a snapshot containing it arrived before its spawn packet."""
+        state = self.snapshots.get(self.snapshot_tick, {}).get(entity.entity_id)
+        if state:
+            self._apply_entity_state(entity, state)
+
+    def _apply_entity_state(self, entity: ClientEntity, state: EntityState):
+        """Update a client entity with its state from an entity snapshot."""
+        entity.tile_position = Vector2(state.x, state.y)
+        if entity.health > state.health:
+            # damage animation
+            entity.damage_animation_time = time()
+        entity.health = state.health
+        if entity is self.client.player:
+            return  # we know the direction and attacking state of our own player better than the server
+        entity.direction = Dir2(state.direction)
+        if entity.direction != Dir2.ZERO:
+            entity.last_direction = entity.direction
+        if entity.direction == Dir2.LEFT:
+            entity.flip_image = True
+        elif entity.direction == Dir2.RIGHT:
+            entity.flip_image = False
+        entity.attacking = state.attacking
+
+    def _on_entity_remove(self, packet: EntityRemovePacket):
+        # remove the player/entity from our entities
+        self.client.entities.pop(packet.entity_id, None)
+
+    def _on_map_change(self, packet: MapChangePacket):
+        # the server announces a new map; its chunks follow in MapChunkPackets
+        print(f"Received map change packet with map {packet.name} ({packet.chunk_count} chunks).")
+        self.map_download = None
+        self.map_hash = ""
+        self.pending_tile_changes.clear()
+        new_map = self._generate_map(packet)
+        if new_map:
+            print(f"Generated map {new_map} from seed {packet.seed}.")
+        else:
+            new_map = self.client.map_cache.load(packet.name, packet.map_hash)
+            if new_map:
+                print(f"Loaded map {new_map} from cache.")
+        if new_map:
             self.client.map = new_map
-            # todo animate map change
-        elif isinstance(packet, EntityAttackPacket):
-            # attack animation
-            for entity in (self.client.entities + [self.client.player]):
-                if not entity:
-                    continue
-                if entity.uuid == packet.uuid:
-                    entity.attacking = packet.attacking
-                    break
+            self.map_hash = packet.map_hash
+            return
+        self.map_download = MapDownload(packet.name, packet.map_hash, packet.chunk_count)
+
+    @staticmethod
+    def _generate_map(packet: MapChangePacket) -> Map | None:
+        """
+        Generate the map announced by the server from its seed.
+        :return: the map, or None if it wasn't generated with a supported generator or the result differs from the
+        server's map (checked with the map hash); the map has to be loaded from the cache or downloaded in that case
+        """
+        if packet.generator_version not in GENERATOR_VERSIONS:
+            return None
+        new_map = generate_map(MapSeed(packet.seed, packet.size, packet.generator_version), packet.name)
+        if hash_map_data(encode_map(new_map)) != packet.map_hash:
+            print(f"Generated map {new_map} does not match the server's map; downloading it instead.")
+            return None
+        return new_map
+
+    def _on_map_chunk(self, packet: MapChunkPacket):
+        if not self.map_download or packet.map_hash != self.map_download.map_hash:
+            return  # chunk of a map we don't (or no longer) download
+        self.map_download.add_chunk(packet.index, packet.data)
+        if self.map_download.complete:
+            new_map = self.map_download.assemble()
+            if new_map:
+                print(f"Received map {new_map}.")
+                self.client.map = new_map
+                self.map_hash = packet.map_hash
+                self.client.map_cache.store(packet.map_hash, self.map_download.data)
+                self.map_download = None
+                # the tile changes the server sent us after the map change apply to the map as it was announced
+                self._apply_tile_changes(self.pending_tile_changes)
+                self.pending_tile_changes.clear()
+                # todo animate map change
+
+    def _on_tile_change(self, packet: TileChangePacket):
+        changes = zip(packet.xs, packet.ys, packet.tiles)
+        if self.map_download:
+            # the changes apply to the map we are still downloading
+            self.pending_tile_changes.extend(changes)
+            return
+        self._apply_tile_changes(changes)
+
+    def _apply_tile_changes(self, changes):
+        """Change the tiles of our map; only the changed regions of the map are rendered again."""
+        game_map = self.client.map
+        if not game_map:
+            return
+        for x, y, tile in changes:
+            if game_map.in_bounds(x, y) and game_map.set_tile(x, y, tile):
+                self.client.renderer.tilemap.invalidate(x, y)
+
+    def _request_missing_map_chunks(self):
+        """Ask the server for the chunks of the map download that did not arrive in time."""
+        missing = self.map_download.missing()
+        print(f"Requesting {len(missing)} missing map chunks.")
+        self.send_packet(MapChunkRequestPacket(self.map_download.map_hash, missing))
+        self.map_download.last_progress = time()
+
+    def _dispatch(self, packet: Packet):
+        """Call our handler for the type of a received packet."""
+        if not self.router.dispatch(packet):
+            print(f"Received packet without handler: {packet.__class__.__name__}")
 
     def tick(self, events, dt) -> bool:
         """Handle incoming packets and send ping packet.
@@ -209,12 +470,11 @@ class ClientNetworking:
         :return True if the connection to the server is still alive, False otherwise
         """
         # Check server connection
-        if (time() - self.last_server_pong) > PONG_TIMEOUT:
+        if (time() - self.last_server_pong) > PONG_TIMEOUT and not self._resume():
             print("Connection to server lost.")
             return False
         # Maybe ping server
         if (time() - self.last_ping) > PING_INTERVAL:
-            print("Sending ping packet.")
             try:
                 self.send_packet(PingPacket())
             except Exception as e:
@@ -222,17 +482,27 @@ class ClientNetworking:
                 self.socket = None
                 return False
             self.last_ping = time()
+        # Maybe request map chunks that got lost
+        if self.map_download and self.map_download.is_stalled():
+            self._request_missing_map_chunks()
+
+        if self.loopback:
+            while self.loopback and self.loopback.to_client:  # a handler can disconnect us
+                self._dispatch(self.loopback.to_client.popleft())
+            return True
 
         while True:  # we want to be able to receive multiple packets per tick
             try:
                 data = self.socket.recv(8192)
-                if len(data) > 512:
+                if len(data) > networking.DEFAULT_MTU:
                     print(f"Received big packet of size {len(data)} from {self.global_address}")
-                packet = networking.deserialize(data)
-                if not isinstance(packet, Packet):
-                    print(f"Received invalid packet: {packet}")
-                    continue
-                self._handle_packet(packet)
+                # the server coalesces the packets it sends us in one tick into frames
+                for packet_data in networking.split_datagram(data, self.channel):
+                    packet = networking.deserialize(packet_data)
+                    if not isinstance(packet, Packet):
+                        print(f"Received invalid packet: {packet}")
+                        continue
+                    self._dispatch(packet)
             except BlockingIOError:
                 break  # no more packets to receive; return
             except Exception as e:
@@ -240,4 +510,7 @@ class ClientNetworking:
                 self.socket = None
                 return False  # return false to indicate that the connection was lost
 
+        # acknowledge received reliable packets and resend ours if necessary, in case we didn't send anything else
+        if self.socket and (self.channel.ack_pending or self.channel.unacked):
+            self._send_frames(networking.FrameBuffer(self.channel))
         return True
@@ -82,7 +82,7 @@ class ClientRenderer:
             self.client.player.render(self.camera, dt)
 
         # render other entities
-        for entity in self.client.entities:
+        for entity in self.client.entities.values():
             entity.render(self.camera, dt)
 
         # render hud
@@ -90,6 +90,10 @@ class ClientRenderer:
 
         # if debug is enabled print the current frame count to the screen
         self.debugger.debug(int(self.client.clock.get_fps()))
+        if self.debugger.enabled:
+            # show the packet handlers that took the most time so far
+            for stats in self.client.networking.router.hot_handlers(3):
+                self.debugger.debug(stats)
 
         self.camera.update(dt, self.debugger)
 
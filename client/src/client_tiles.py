@@ -40,28 +40,61 @@ class ClientTileManager:
 
 
 class ClientTileMap:
-    """Client side tile map class for rendering the current map. Gets the tiles with the ClientTileManager."""
+    """
+    Client side tile map class for rendering the current map. Gets the tiles with the ClientTileManager.
+
+    The map is rendered in square regions of REGION_SIZE tiles: each region is drawn onto its own surface once, and
+    only the surfaces of the regions in the camera view are drawn every frame. When tiles change (see invalidate()),
+    only the regions containing them are drawn again.
+    """
+    REGION_SIZE = 8  # width and height of a region in tiles
 
     def __init__(self, client, tile_size: int, pos: Vector2 = Vector2(0, 0)):
         self.client = client
         self.tile_size = tile_size
         self.position = pos
         self.tiles = ClientTileManager()
+        self._map = None  # the map the regions were drawn from
+        self._regions: Dict[tuple[int, int], Surface] = {}  # (region x, region y) -> surface of the region
 
-    def render(self, camera):  # unoptimised rendering, assuming tilemap is relatively small
-        if not self.client.map:
-            return
-        for y, row in enumerate(self.client.map.tiles):
-            for x, tile in enumerate(row):
+    def invalidate(self, x: int, y: int):
+        """Draw the region containing the tile at the tile position again, e.g. because the tile changed."""
+        self._regions.pop((x // self.REGION_SIZE, y // self.REGION_SIZE), None)
+
+    def _draw_region(self, region_x: int, region_y: int) -> Surface:
+        """:return: a new surface with the tiles of the region"""
+        game_map = self.client.map
+        size = self.REGION_SIZE * self.tile_size
+        surface = Surface((size, size), pygame.SRCALPHA)
+        left, top = region_x * self.REGION_SIZE, region_y * self.REGION_SIZE
+        for y in range(top, min(top + self.REGION_SIZE, game_map.height)):
+            for x, tile in enumerate(game_map.tiles[y][left:left + self.REGION_SIZE]):
                 if tile == "":  # ignore empty tiles
                     continue
-                # get the absolute position of the tile (tile pos * tile size)
-                abs_pos = abs_from_tile_pos(Vector2(x, y))
-                # render all tiles to the render texture, calculating in the current camera offset
-                camera.renderTexture.blit(
-                    self.tiles.get_image(tile),
-                    (
-                        self.position.x + abs_pos.x - camera.position.x,
-                        self.position.y + abs_pos.y - camera.position.y
-                    )
-                )
+                surface.blit(self.tiles.get_image(tile), (x * self.tile_size, (y - top) * self.tile_size))
+        return surface
+
+    def render(self, camera):
+        game_map = self.client.map
+        if not game_map:
+            return
+        if game_map is not self._map:
+            # we are on a new map; the regions of the old one are useless
+            self._map = game_map
+            self._regions.clear()
+        # the position of the map on the render texture, calculating in the current camera offset
+        offset = self.position - camera.position
+        region_size = self.REGION_SIZE * self.tile_size
+        view_width, view_height = camera.renderTexture.get_size()
+        # only the regions in the camera view are rendered
+        first_x, first_y = max(int(-offset.x // region_size), 0), max(int(-offset.y // region_size), 0)
+        last_x = min(int((view_width - offset.x) // region_size), (game_map.width - 1) // self.REGION_SIZE)
+        last_y = min(int((view_height - offset.y) // region_size), (game_map.height - 1) // self.REGION_SIZE)
+        for region_y in range(first_y, last_y + 1):
+            for region_x in range(first_x, last_x + 1):
+                region = self._regions.get((region_x, region_y))
+                if region is None:
+                    region = self._regions[(region_x, region_y)] = self._draw_region(region_x, region_y)
+                # get the absolute position of the region (tile pos of its top left tile * tile size)
+                abs_pos = abs_from_tile_pos(Vector2(region_x, region_y) * self.REGION_SIZE)
+                camera.renderTexture.blit(region, (offset.x + abs_pos.x, offset.y + abs_pos.y))
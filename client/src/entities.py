@@ -1,6 +1,7 @@
 # This file contains the client-side entity/player classes with methods for rendering
 import math
 import random
+from collections import deque
 from time import time
 
 import pygame
@@ -18,14 +19,14 @@ class ClientEntity:
     Represents a client-sided entity in the game world. Can be a player or hostile creature.
     There are different classes for entities on the server, as they have different jobs. For example,
     on the client we only render entities and handle animations, while on the server we handle movement and
-    other logic (see server/src/entities.py).
+    other logic (see server/src/server_entities.py).
     """
     ANIMATION_SPEED = 10  # how fast the animation is played
     DAMAGE_ANIMATION_DURATION = 0.2  # seconds
 
-    def __init__(self, uuid: str, entity_type: EntityType, tile_position: Vector2 = Vector2(), health: int = 50,
+    def __init__(self, entity_id: int, entity_type: EntityType, tile_position: Vector2 = Vector2(), health: int = 50,
                  hostile: bool = False):
-        self.uuid = uuid  # unique identifier of entity
+        self.entity_id = entity_id  # unique identifier of entity
         self.entity_type = entity_type  # type of entity -> used for sprites, animations etc.
         self.health = health  # health points of entity (10 = 1 heart)
         self.tile_position: Vector2 = tile_position  # tile position of entity
@@ -96,11 +97,25 @@ class ClientPlayer(ClientEntity):
     movement and attacking and sends the corresponding packets to the server. The name is rendered above the
     player's head after the sprite is rendered in the above class (ClientEntity).
     """
-    def __init__(self, client, name, uuid, tile_position: Vector2 = Vector2(), health: int = 50):
-        ClientEntity.__init__(self, uuid, EntityType.KNIGHT, tile_position, health)
+    INPUT_HISTORY_SIZE = 8  # number of (newest) inputs sent in every ChangeInputPacket
+    INPUT_RESEND_INTERVAL = 0.1  # seconds between resends of the inputs while a key is held
+
+    def __init__(self, client, name, entity_id, tile_position: Vector2 = Vector2(), health: int = 50):
+        ClientEntity.__init__(self, entity_id, EntityType.KNIGHT, tile_position, health)
         self.client = client
         self.name = name
         self.pressed_keys = set()
+        self.input_sequence = 0  # sequence number of the newest input
+        self.input_history: deque[tuple[Dir2, bool]] = deque(maxlen=self.INPUT_HISTORY_SIZE)  # newest first
+        self.input_resends = 0  # number of resends left after the last input change
+        self.last_input_send_time = 0
+
+    def send_inputs(self):
+        """Send the newest inputs to the server (see ChangeInputPacket)."""
+        self.client.send_packet(ChangeInputPacket(self.input_sequence,
+                                                  [direction.value for direction, _ in self.input_history],
+                                                  [attacking for _, attacking in self.input_history]))
+        self.last_input_send_time = time()
 
     def update(self, delta_time, tile_map, pygame_events):
         """
@@ -134,10 +149,13 @@ class ClientPlayer(ClientEntity):
         attacking = pygame.K_SPACE in self.pressed_keys
 
         if attacking != self.attacking or direction != self.direction:
-            # send packet to server; this is only necessary if the player's state has changed
+            # send packet to server immediately if the player's state has changed
             # (e.g. the player started moving, changed direction or started attacking)
-            packet = ChangeInputPacket(direction.value, attacking)
-            self.client.send_packet(packet)
+            self.input_sequence += 1
+            self.input_history.appendleft((direction, attacking))
+            # resend the change a few times even if the player stops moving, so that stopping doesn't get lost
+            self.input_resends = self.INPUT_HISTORY_SIZE // 2
+            self.send_inputs()
 
             # only flip image when necessary, we don't want the texture to flip back when the player stops moving
             if direction == Dir2.LEFT:
@@ -151,6 +169,11 @@ class ClientPlayer(ClientEntity):
                 # (e.g. if the player is moving left and attacks, the attack animation should be left)
                 self.last_direction = self.direction
             self.attacking = attacking
+        elif time() - self.last_input_send_time >= self.INPUT_RESEND_INTERVAL \
+                and (self.pressed_keys or self.input_resends > 0):
+            # resend the inputs in case the last packets got lost; the server ignores the inputs it already has
+            self.input_resends = max(self.input_resends - 1, 0)
+            self.send_inputs()
 
     def render(self, camera, dt):
         super().render(camera, dt)  # this renders the player's sprite
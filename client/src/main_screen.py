@@ -6,6 +6,7 @@ import pygame_gui
 import client_state
 from assets import Assets
 from common.src.common import VERSION
+from common.src.packets import MAX_NAME_LENGTH
 
 
 class MainScreen:
@@ -65,6 +66,26 @@ class MainScreen:
             initial_text=custom_server_text
         )
 
+        # button for watching the game on the custom server (or relay) as spectator
+        spectate_rect = pygame.Rect(0, 0, 120, 50)
+        spectate_rect.bottomright = (0, 0)
+        self.spectate_button = pygame_gui.elements.UIButton(
+            relative_rect=spectate_rect,
+            text='SPECTATE',
+            manager=self.manager,
+            anchors={'right': 'right', 'bottom': 'bottom', 'right_target': self.custom_server_button},
+        )
+
+        # singleplayer button; the game runs on a server in the client itself
+        bottom_left = pygame.Rect(0, 0, 200, 50)
+        bottom_left.bottomleft = (0, 0)
+        self.singleplayer_button = pygame_gui.elements.UIButton(
+            relative_rect=bottom_left,
+            text='SINGLEPLAYER',
+            manager=self.manager,
+            anchors={'left': 'left', 'bottom': 'bottom'},
+        )
+
         # quit and fullscreen buttons
         top_right = pygame.Rect(0, 0, 50, 50)
         top_right.topright = (0, 0)
@@ -101,6 +122,15 @@ class MainScreen:
                     print('Logging in (custom)...')
                     self.renderer.client.state = client_state.CONNECTING
                     self.renderer.client.networking.try_login(True)
+                elif event.ui_element == self.spectate_button:
+                    # watch the game on the custom server
+                    print('Spectating (custom)...')
+                    self.renderer.client.state = client_state.CONNECTING
+                    self.renderer.client.networking.try_login(True, spectate=True)
+                elif event.ui_element == self.singleplayer_button:
+                    # start a singleplayer game
+                    print('Starting singleplayer game...')
+                    self.renderer.client.start_singleplayer()
                 elif event.ui_element == self.fullscreen_button:
                     # toggle fullscreen
                     print('Toggling fullscreen...')
@@ -112,7 +142,7 @@ class MainScreen:
             elif event.type == pygame_gui.UI_TEXT_ENTRY_CHANGED:
                 if event.ui_element == self.name_entry:
                     # change player name
-                    name = event.text[:20]
+                    name = event.text[:MAX_NAME_LENGTH]
                     print('Changing name to', name)
                     self.name_entry.text = name
                     self.renderer.client.config.player_name = name
@@ -0,0 +1,80 @@
+"""
+On-disk cache of the maps we downloaded from servers.
+
+Maps are stored by their content hash (see common/src/map/transfer.py), so when a server announces a map we already
+have, we don't have to download it again - e.g. when reconnecting to the same game. The cache keeps the
+MAX_ENTRIES most recently used maps; the modification time of a file is used as its last use.
+"""
+import os
+import re
+from time import time
+
+from common.src.map.map import Map
+from common.src.map.transfer import load_map_data
+
+_MAP_HASH = re.compile(r"[0-9a-f]{16}")  # see hash_map_data(); the hash is sent by the server, so it is checked
+
+
+
+class MapCache:
+    MAX_ENTRIES = 16  # number of maps kept in the cache; also the number of hashes announced in the HelloPacket
+
+    def __init__(self, directory: str):
+        self.directory = directory  # directory the maps are stored in, one file per map
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, map_hash: str) -> str | None:
+        """:return: the path of the file of the map, or None if the hash is invalid (e.g. a path itself)"""
+        if not isinstance(map_hash, str) or not _MAP_HASH.fullmatch(map_hash):
+            return None
+        return os.path.join(self.directory, f"{map_hash}.map")
+
+    def hashes(self) -> list[str]:
+        """:return: the hashes of the cached maps, most recently used first"""
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".map")]
+        except OSError:
+            return []
+        entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        return [entry.name[:-len(".map")] for entry in entries if _MAP_HASH.fullmatch(entry.name[:-len(".map")])]
+
+    def load(self, name: str, map_hash: str) -> Map | None:
+        """:return: the cached map with the specified hash, or None if it is not cached (or the file is corrupt)"""
+        path = self._path(map_hash)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        game_map = load_map_data(name, map_hash, data)
+        if game_map is None:
+            print(f"Cached map {map_hash} is corrupt. Removing it...")
+            self._remove(path)
+            return None
+        now = time()
+        os.utime(path, (now, now))  # mark as recently used
+        return game_map
+
+    def store(self, map_hash: str, data: bytes):
+        """Store the compressed map data (see MapTransfer.data) and evict the least recently used maps."""
+        path = self._path(map_hash)
+        if path is None:
+            print(f"Not caching map with invalid hash {map_hash!r}")
+            return
+        try:
+            with open(path, "wb") as f:
+                f.write(data)
+        except OSError as e:
+            print(f"Could not cache map {map_hash}: {e}")
+            return
+        for old_hash in self.hashes()[self.MAX_ENTRIES:]:
+            self._remove(self._path(old_hash))
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
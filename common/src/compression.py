@@ -0,0 +1,71 @@
+"""
+Compression of big serialized packets, negotiated per connection in the HelloPacket handshake.
+
+Packets of at least COMPRESSION_THRESHOLD bytes are compressed with zlib (raw deflate) and a preset dictionary; the
+compressed packet starts with the COMPRESSED_MARKER byte instead of a packet id, so deserialize() (see networking.py)
+can tell it apart. A packet that doesn't get smaller is sent as it is. Every packet is compressed on its own, as
+datagrams can get lost or arrive out of order; the preset dictionary makes up for most of the context a stream would
+have. It contains the vocabulary our packets are made of: the tile names of the maps, the entity types and the
+packet/field names of the json codec.
+
+Both sides need the same dictionary, so the name of the compression contains its checksum; a client built with a
+different vocabulary just doesn't get compressed packets.
+"""
+import zlib
+
+from common.src.entities import EntityType
+from common.src.packets import packet_classes
+
+COMPRESSED_MARKER = 0xF2  # first byte of every compressed packet
+COMPRESSION_THRESHOLD = 128  # smaller packets are not worth compressing
+MAX_PACKET_SIZE = 0xFFFF  # maximum size of a decompressed packet; we don't decompress anything bigger
+
+# tile names of the map generation (see map/wfc.py), most common ones last; they make up most of a map's palette
+_TILE_NAMES = (
+    "wall_corner_left_end", "wall_edge_right_end", "wall_edge_top_left_end", "wall_edge_top_right_end",
+    "swall_edge_corner_left_down", "swall_bottom_left_end", "swall_bottom_right_end", "swall_bottom_missing_brick",
+    "swall_bottom_hole", "swall_bottom_flag_red", "swall_full_left_end", "swall_full_right_end", "floor_ladder",
+    "sfloor_pillar", "floor_cracked_1", "floor_cracked_2", "floor_cracked_3", "floor_cracked_4", "floor_cracked_5",
+    "swall_full_middle", "swall_edge_left_straight", "swall_edge_right_straight", "wall_edge_top_middle",
+    "swall_bottom_middle", "floor_clear",
+)
+
+
+def _build_dictionary() -> bytes:
+    """
+    :return: the preset dictionary; zlib finds matches at the end of the dictionary with the shortest distances, so
+    the most common strings are put last
+    """
+    json_vocabulary = []
+    for name, clazz in packet_classes:
+        if "packet_id" in clazz.__dict__:
+            json_vocabulary.append(f'{{"type": "{name}"' + "".join(f', "{field}": ' for field, _ in clazz.fields))
+    entity_types = [entity_type.value for entity_type in EntityType]
+    return "".join(json_vocabulary + entity_types + list(_TILE_NAMES)).encode()
+
+
+_DICTIONARY = _build_dictionary()
+COMPRESSION_ZLIB = f"zlib-{zlib.adler32(_DICTIONARY):08x}"  # name of the compression, negotiated in the handshake
+COMPRESSIONS = (COMPRESSION_ZLIB,)  # all supported compressions, in order of preference
+
+
+def compress(data: bytes) -> bytes:
+    """:return: the compressed packet, or the packet itself if it is too small or doesn't get smaller"""
+    if len(data) < COMPRESSION_THRESHOLD:
+        return data
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=_DICTIONARY)
+    compressed = bytes((COMPRESSED_MARKER,)) + compressor.compress(data) + compressor.flush()
+    return compressed if len(compressed) < len(data) else data
+
+
+def decompress(data) -> bytes:
+    """
+    :param data: a compressed packet (starting with the COMPRESSED_MARKER)
+    :return: the serialized packet
+    :raises zlib.error: if the data is corrupt or decompresses to more than MAX_PACKET_SIZE bytes
+    """
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS, zdict=_DICTIONARY)
+    packet = decompressor.decompress(memoryview(data)[1:], MAX_PACKET_SIZE)
+    if decompressor.unconsumed_tail or not decompressor.eof:
+        raise zlib.error("Compressed packet is truncated or too big")
+    return packet
@@ -0,0 +1,24 @@
+"""
+In-memory transport between a client and a server in the same process, e.g. for singleplayer games.
+"""
+from collections import deque
+
+from common.src.packets import Packet
+
+LOOPBACK_ADDRESS = ("loopback", 0)  # the address the server knows the client of the loopback by
+
+
+class Loopback:
+    """
+    Connects a client to a server running in the same process. Both sides put the Packet instances they send into a
+    queue of the other side, which handles them with its next tick, just like the packets it received from its socket.
+
+    The packets are not serialized, coalesced into frames, signed or compressed, and they can't get lost, duplicated
+    or reordered; so the reliable channel, the session and the send budget of the UDP path are skipped, too. Both sides
+    pass the packet instances on as they are, so a packet must not be changed after it was sent, and its fields have
+    to hold what the receiver would decode on the UDP path (e.g. a Vector2 for a vec2 field, not a tuple).
+    """
+
+    def __init__(self):
+        self.to_server: deque[Packet] = deque()  # packets sent by the client, not yet handled by the server
+        self.to_client: deque[Packet] = deque()  # packets sent by the server, not yet handled by the client
@@ -0,0 +1,48 @@
+"""
+Seed-deterministic map generation, shared by the server and the client.
+
+A generated map is fully described by its MapSeed: the seed of the random number generator, the size of the map and
+the version of the generator. The server only announces these (see MapChangePacket) and the client generates the
+same map locally, instead of downloading all of its tiles.
+
+IMPORTANT: Any change to the generation that changes the generated tiles (e.g. different tiles, another order of
+random calls) must increase GENERATOR_VERSION, so clients with another version download the map instead.
+"""
+import random
+from typing import NamedTuple
+
+from common.src.map import wfc
+from common.src.map.map import Map
+
+GENERATOR_VERSION = 1  # version of the map generation below; 0 means that a map was not generated
+GENERATOR_VERSIONS = (GENERATOR_VERSION,)  # generator versions we can reproduce, announced in the HelloPacket
+
+
+class MapSeed(NamedTuple):
+    """Everything needed to generate a map again."""
+    seed: int  # seed of the random number generator, u32
+    size: int  # size of the basic platform
+    version: int = GENERATOR_VERSION  # version of the generator
+
+
+def generate_map(map_seed: MapSeed, name: str = "generated") -> Map:
+    """
+    Generate a map using our wfc (wave function collapse) utilities. As wfc does not make that much sense for our
+    project, we will probably use our own (simpler) method in the future.
+    :param map_seed: seed, size and generator version of the map
+    :param name: name of the map
+    :return: the generated Map instance; always the same tiles for the same map seed
+    """
+    if map_seed.version not in GENERATOR_VERSIONS:
+        raise ValueError(f"Unsupported map generator version {map_seed.version}")
+    rng = random.Random(map_seed.seed)
+    size = map_seed.size
+
+    # generate basic platform
+    gen_map = [["floor_clear"] * size for _ in range(size)]
+
+    # generate structures with wfc
+    gen_map = wfc.fill_walls(gen_map, size)
+    wfc.wfc_fill(gen_map, size, rng)
+
+    return Map(name, gen_map, map_seed)
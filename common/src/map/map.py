@@ -1,13 +1,15 @@
 class Map:
     """Represents a map of tiles."""
 
-    def __init__(self, name: str, tiles: list[list[str]]):
+    def __init__(self, name: str, tiles: list[list[str]], seed=None):
         """
         :param name: The name of the map.
         :param tiles: A 2D list of tiles. IMPORTANT: The first index is y, the second index is the x coordinate.
+        :param seed: The MapSeed the map was generated with (see generation.py), or None if it wasn't generated.
         """
         self.name = name
         self.tiles: list[list[str]] = tiles
+        self.seed = seed
 
     @property
     def width(self) -> int:
@@ -19,5 +21,30 @@ class Map:
     def height(self) -> int:
         return len(self.tiles)
 
+    def in_bounds(self, x: int, y: int) -> bool:
+        """:return: whether the tile position is on the map"""
+        return 0 <= y < self.height and 0 <= x < self.width
+
+    def get_tile(self, x: int, y: int) -> str:
+        """
+        :return: the name of the tile at the position; "" for an empty tile
+        :raises IndexError: if the position is not on the map
+        """
+        if not self.in_bounds(x, y):
+            raise IndexError(f"Tile position ({x}, {y}) is not on {self}")
+        return self.tiles[y][x]
+
+    def set_tile(self, x: int, y: int, tile: str) -> bool:
+        """
+        Change a tile of the map, e.g. to open a door or break a wall.
+        :param tile: the name of the new tile; "" for an empty tile
+        :return: whether the tile changed, i.e. it was a different tile before
+        :raises IndexError: if the position is not on the map
+        """
+        if self.get_tile(x, y) == tile:
+            return False
+        self.tiles[y][x] = tile
+        return True
+
     def __str__(self):
         return f"Map({self.name})"
@@ -0,0 +1,133 @@
+"""
+Encoding of maps for the transfer from the server to the clients.
+
+A map is encoded as a palette of the distinct tile names and a grid of indices into that palette (one byte per tile,
+two bytes if there are more than 256 distinct tiles). The content hash of a map is computed from this encoding. For
+the transfer, the encoding is compressed with zlib and split into numbered chunks that fit into a single datagram.
+The client collects the chunks with a MapDownload and asks the server to send the chunks that are still missing
+after a while again (see MapChunkRequestPacket).
+
+Encoded format (little endian): u16 width, u16 height, u16 palette size, the palette names
+(u8 length + utf-8 each) and the index grid row by row (y, then x).
+"""
+import hashlib
+import struct
+import zlib
+from time import time
+
+from common.src.map.map import Map
+
+MAP_CHUNK_SIZE = 1024  # maximum bytes of encoded map data per chunk; chunk packets have to fit into one datagram
+MAP_CHUNK_TIMEOUT = 0.5  # seconds without a new chunk after which the client requests the missing chunks again
+
+_header = struct.Struct("<HHH")
+
+
+def encode_map(game_map: Map) -> bytes:
+    """:return: the palette encoding of the map's tiles"""
+    palette: dict[str, int] = {}  # tile name -> index
+    for row in game_map.tiles:
+        for tile in row:
+            if tile not in palette:
+                palette[tile] = len(palette)
+    out = bytearray(_header.pack(game_map.width, game_map.height, len(palette)))
+    for tile in palette:
+        raw = tile.encode()
+        out.append(len(raw))
+        out += raw
+    index_format = "B" if len(palette) <= 256 else "H"
+    for row in game_map.tiles:
+        out += struct.pack(f"<{len(row)}{index_format}", *(palette[tile] for tile in row))
+    return bytes(out)
+
+
+def decode_map(name: str, raw: bytes) -> Map:
+    """:return: the map decoded from its palette encoding (see encode_map())"""
+    width, height, palette_size = _header.unpack_from(raw, 0)
+    offset = _header.size
+    palette = []
+    for _ in range(palette_size):
+        length = raw[offset]
+        palette.append(str(raw[offset + 1:offset + 1 + length], "utf-8"))
+        offset += 1 + length
+    row_struct = struct.Struct(f"<{width}{'B' if palette_size <= 256 else 'H'}")
+    tiles = []
+    for _ in range(height):
+        tiles.append([palette[index] for index in row_struct.unpack_from(raw, offset)])
+        offset += row_struct.size
+    return Map(name, tiles)
+
+
+def hash_map_data(raw: bytes) -> str:
+    """:return: the content hash of an encoded map (see encode_map()), used to verify and identify it"""
+    return hashlib.blake2b(raw, digest_size=8).hexdigest()
+
+
+def load_map_data(name: str, map_hash: str, data: bytes) -> Map | None:
+    """
+    Decompress and decode transferred map data (see MapTransfer.data).
+    :return: the map, or None if the data is corrupt or doesn't match the hash
+    """
+    try:
+        raw = zlib.decompress(data)
+    except zlib.error:
+        return None
+    if hash_map_data(raw) != map_hash:
+        return None
+    return decode_map(name, raw)
+
+
+class MapTransfer:
+    """A map prepared for sending it to clients: encoded and hashed once, compressed and split into chunks."""
+
+    def __init__(self, game_map: Map, chunk_size: int = MAP_CHUNK_SIZE):
+        self.map = game_map
+        raw = encode_map(game_map)
+        self.map_hash = hash_map_data(raw)
+        self.data = zlib.compress(raw, 9)
+        self.chunks = [self.data[start:start + chunk_size] for start in range(0, len(self.data), chunk_size)]
+
+
+class MapDownload:
+    """Client-side reassembly of the chunks of a map announced with a MapChangePacket."""
+
+    def __init__(self, name: str, map_hash: str, chunk_count: int):
+        self.name = name
+        self.map_hash = map_hash
+        self.chunks: list[bytes | None] = [None] * chunk_count
+        self.last_progress = time()  # time the last new chunk arrived (or the download was started/re-requested)
+
+    @property
+    def complete(self) -> bool:
+        return None not in self.chunks
+
+    def add_chunk(self, index: int, data: bytes):
+        """Store a received chunk; duplicates and invalid indices are ignored."""
+        if 0 <= index < len(self.chunks) and self.chunks[index] is None:
+            self.chunks[index] = data
+            self.last_progress = time()
+
+    def missing(self) -> list[int]:
+        """:return: the indices of the chunks that did not arrive yet"""
+        return [index for index, chunk in enumerate(self.chunks) if chunk is None]
+
+    def is_stalled(self) -> bool:
+        """:return: whether no chunk arrived for MAP_CHUNK_TIMEOUT seconds, i.e. missing chunks should be requested"""
+        return not self.complete and time() - self.last_progress > MAP_CHUNK_TIMEOUT
+
+    @property
+    def data(self) -> bytes:
+        """:return: the compressed map data of the complete download (see MapTransfer.data)"""
+        return b"".join(self.chunks)
+
+    def assemble(self) -> Map | None:
+        """
+        Decode the map from the complete chunks.
+        :return: the map, or None if the data doesn't match the announced hash; the download is reset in that case
+        """
+        game_map = load_map_data(self.name, self.map_hash, self.data)
+        if game_map is None:
+            print(f"Map {self.name} does not match its hash; downloading it again.")
+            self.chunks = [None] * len(self.chunks)
+            self.last_progress = time()
+        return game_map
@@ -2,7 +2,8 @@
 Helper file containing functions for generating maps with the Wave Function Collapse algorithm.
 
 In our case, we create a rectangle of tiles with a given size and then fill the map with
-randomly generated walls and structures.
+randomly generated walls and structures. All randomness comes from the passed random.Random instance, so the
+same seed always results in the same map (see generation.py).
 """
 import random
 
@@ -47,12 +48,13 @@ def fill_walls(gmap, size):
     return gmap
 
 
-def wfc_fill(gmap, size):
+def wfc_fill(gmap, size, rng: random.Random):
     """
     Helper function to fill the map with randomly generated structures. Here we assume the map already consists of a
     basic rectangle platform. The letter "s" at the beginning of a tile name stands for "solid".
     :param gmap: map to fill
     :param size: size of basic platform
+    :param rng: the seeded random number generator to use
     :return: the filled map
     """
     structures = {
@@ -65,27 +67,27 @@ def wfc_fill(gmap, size):
     for rowIndex, row in enumerate(gmap):
         for tileIndex, tile in enumerate(row):
             if tile == "floor_clear":
-                if random.randint(0, 7) == 1:
-                    gmap[rowIndex][tileIndex] = random.choice(
+                if rng.randint(0, 7) == 1:
+                    gmap[rowIndex][tileIndex] = rng.choice(
                         ["floor_cracked_" + str(x) for x in range(1, 6)] + ["floor_ladder"])
 
-                if random.randint(0, 24) == 1:
+                if rng.randint(0, 24) == 1:
                     gmap[rowIndex][tileIndex] = "sfloor_pillar"
 
             elif tile == "swall_bottom_middle":
-                if random.randint(0, 12) == 1:
-                    gmap[rowIndex][tileIndex] = random.choice(
+                if rng.randint(0, 12) == 1:
+                    gmap[rowIndex][tileIndex] = rng.choice(
                         ["swall_bottom_missing_brick", "swall_bottom_hole", "swall_bottom_flag_red"])
 
     # add structures
 
     for x in range(3):  # amount of structures
-        structure = random.choice(list(structures.values()))
+        structure = rng.choice(list(structures.values()))
 
         placed = False
         while not placed:
-            random_origin_x = random.randint(2, size - 2)
-            random_origin_y = random.randint(2, size - 2)
+            random_origin_x = rng.randint(2, size - 2)
+            random_origin_y = rng.randint(2, size - 2)
 
             for y_offset, row in enumerate(structure):
                 for x_offset, tile in enumerate(row):
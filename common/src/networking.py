@@ -1,70 +1,618 @@
 """
 File for managing common networking stuff such as serialization and deserialization of packets.
+
+There are two codecs for serializing packets:
+- binary: compact struct-based encoding compiled from the `fields` schema of each packet class (see packets.py).
+  The first byte is the packet id, followed by the field values in schema order without any field names.
+- json: the packet's properties as a json object with an additional "type" key. Much bigger and slower than the
+  binary codec, but human-readable; kept as a fallback for debugging.
+
+The codec used for a session is negotiated in the HelloPacket handshake. The HelloPacket itself is always sent as
+json, as the client doesn't know which codecs the server supports yet. As binary packets never start with "{",
+deserialize() can always tell the codecs apart by looking at the first byte.
+
+To save syscalls and per-datagram overhead, multiple serialized packets can be coalesced into one datagram, called a
+frame (see FrameBuffer): the FRAME_MARKER byte and the acknowledgements of the reliable channel (u16 ack, u32 ack
+bits), followed by the packets, each prefixed with its length (u16). Packet classes with `reliable = True` are sent
+over the reliable channel (see ReliableChannel): their length has the highest bit set and is followed by their
+sequence number (u16). split_datagram() returns the packets of a frame, or the datagram itself if it is a single
+packet.
+
+Big packets can be compressed if both sides support it (negotiated in the handshake, see compression.py); a
+compressed packet starts with the COMPRESSED_MARKER byte.
+
+Once logged in, clients prefix their datagrams with a session header: the SESSION_MARKER byte, the session id (u32)
+the server assigned in the HelloReplyPacket and a MAC (4 bytes) of the rest of the datagram, keyed with the session
+key. The server finds the client with a dict lookup by session id and drops datagrams with a wrong MAC before
+decoding any packet.
 """
+import base64
+import hashlib
+import hmac
 import json
+import struct
+import zlib
 from json import JSONDecodeError
+from time import time
+from typing import NamedTuple
 
 import pygame
 
+from common.src import compression
 from common.src.packets import *
 
+CODEC_BINARY = "binary"
+CODEC_JSON = "json"
+CODECS = (CODEC_BINARY, CODEC_JSON)  # all supported codecs, in order of preference
+
+JSON_MARKER = ord("{")  # first byte of every json packet; packet ids have to be lower than this
+FRAME_MARKER = 0xF0  # first byte of every frame (multiple packets in one datagram)
+SESSION_MARKER = 0xF1  # first byte of every datagram with a session header (see sign_datagram())
+DEFAULT_MTU = 1200  # maximum frame size in bytes; small enough to not be fragmented on common internet paths
+
+
+class FieldType:
+    """
+    Base class for the types a packet field can have on the wire (see Packet.fields).
+
+    Fixed-size types set `fmt` to their struct format; consecutive fixed-size fields of a packet are packed with a
+    single struct call. Variable-size types leave `fmt` as None and override encode() and decode().
+    """
+    fmt: str | None = None  # struct format characters (without byte order) for fixed-size types
+
+    def __init__(self):
+        if self.fmt is not None:
+            self.struct = struct.Struct("<" + self.fmt)
+            self.width = len(self.fmt)  # number of struct values the type uses
+
+    def pack(self, value) -> tuple:
+        """Convert a value of a fixed-size type to a tuple of struct values."""
+        return value,
+
+    def unpack(self, values: tuple):
+        """Convert a tuple of struct values (see pack()) back to a value of a fixed-size type."""
+        return values[0]
+
+    def encode(self, value, out: bytearray):
+        """Append the encoded value to the output buffer."""
+        out += self.struct.pack(*self.pack(value))
+
+    def decode(self, data, offset: int):
+        """
+        Decode a value from the data.
+        :return: the decoded value and the offset of the first byte after the value
+        """
+        return self.unpack(self.struct.unpack_from(data, offset)), offset + self.struct.size
+
+    def to_json(self, value):
+        """Convert a value to a json-serializable value."""
+        return value
+
+    def from_json(self, value):
+        """Convert a json value back to the value used in the packet."""
+        return value
+
+
+class _ScalarField(FieldType):
+    """A number or bool that is packed as a single struct value."""
+
+    def __init__(self, fmt: str):
+        self.fmt = fmt
+        super().__init__()
+
+
+class _Vec2Field(FieldType):
+    """A 2D position; accepts pygame.Vector2 and (x, y) tuples/lists and decodes to pygame.Vector2."""
+    fmt = "ff"
+
+    def pack(self, value) -> tuple:
+        return value[0], value[1]
+
+    def unpack(self, values: tuple):
+        return pygame.Vector2(values[0], values[1])
+
+    def to_json(self, value):
+        return value[0], value[1]
+
+    def from_json(self, value):
+        return pygame.Vector2(value[0], value[1])
+
+
+class _StringField(FieldType):
+    """An utf-8 string, prefixed with its length in bytes."""
+    _length = struct.Struct("<H")
+
+    def encode(self, value, out: bytearray):
+        raw = value.encode()
+        out += self._length.pack(len(raw))
+        out += raw
+
+    def decode(self, data, offset: int):
+        length, = self._length.unpack_from(data, offset)
+        offset += self._length.size
+        if offset + length > len(data):
+            raise struct.error("string exceeds packet size")
+        return str(data[offset:offset + length], "utf-8"), offset + length
+
+
+class _BytesField(FieldType):
+    """Raw bytes, prefixed with their length; encoded as base64 string in json."""
+    _length = struct.Struct("<H")
+
+    def encode(self, value, out: bytearray):
+        out += self._length.pack(len(value))
+        out += value
+
+    def decode(self, data, offset: int):
+        length, = self._length.unpack_from(data, offset)
+        offset += self._length.size
+        if offset + length > len(data):
+            raise struct.error("bytes exceed packet size")
+        return bytes(data[offset:offset + length]), offset + length
+
+    def to_json(self, value):
+        return base64.b64encode(value).decode()
+
+    def from_json(self, value):
+        return base64.b64decode(value)
+
+
+class _ListField(FieldType):
+    """A list of values of another field type, prefixed with the number of items."""
+    _count = struct.Struct("<H")
+
+    def __init__(self, item_type: FieldType):
+        super().__init__()
+        self.item_type = item_type
+
+    def encode(self, value, out: bytearray):
+        out += self._count.pack(len(value))
+        for item in value:
+            self.item_type.encode(item, out)
+
+    def decode(self, data, offset: int):
+        count, = self._count.unpack_from(data, offset)
+        offset += self._count.size
+        items = []
+        for _ in range(count):
+            item, offset = self.item_type.decode(data, offset)
+            items.append(item)
+        return items, offset
+
+    def to_json(self, value):
+        return [self.item_type.to_json(item) for item in value]
+
+    def from_json(self, value):
+        return [self.item_type.from_json(item) for item in value]
+
+
+class _OptionalField(FieldType):
+    """A value of another field type that may be None, prefixed with a presence flag."""
+
+    def __init__(self, item_type: FieldType):
+        super().__init__()
+        self.item_type = item_type
+
+    def encode(self, value, out: bytearray):
+        if value is None:
+            out.append(0)
+        else:
+            out.append(1)
+            self.item_type.encode(value, out)
+
+    def decode(self, data, offset: int):
+        if data[offset] == 0:
+            return None, offset + 1
+        return self.item_type.decode(data, offset + 1)
+
+    def to_json(self, value):
+        return None if value is None else self.item_type.to_json(value)
+
+    def from_json(self, value):
+        return None if value is None else self.item_type.from_json(value)
+
+
+_FIELD_TYPES = {
+    "bool": _ScalarField("?"),
+    "u8": _ScalarField("B"),
+    "u16": _ScalarField("H"),
+    "u32": _ScalarField("I"),
+    "i16": _ScalarField("h"),
+    "i32": _ScalarField("i"),
+    "f32": _ScalarField("f"),
+    "f64": _ScalarField("d"),
+    "str": _StringField(),
+    "bytes": _BytesField(),
+    "vec2": _Vec2Field(),
+}
+
+
+def parse_field_type(name: str) -> FieldType:
+    """
+    Get the FieldType for a type name used in a packet schema, e.g. "u8", "str?" or "list[list[str]]".
+    """
+    if name.endswith("?"):
+        return _OptionalField(parse_field_type(name[:-1]))
+    if name.startswith("list[") and name.endswith("]"):
+        return _ListField(parse_field_type(name[5:-1]))
+    try:
+        return _FIELD_TYPES[name]
+    except KeyError:
+        raise ValueError(f"Unknown field type: {name}")
+
+
+class PacketCodec:
+    """
+    Binary encoder and decoder for one packet class, compiled from its `fields` schema.
 
-def serialize(packet: Packet) -> bytes:
+    The fields are split into steps: runs of consecutive fixed-size fields are merged into one struct.Struct, so they
+    are packed/unpacked with a single call. Variable-size fields (strings, lists, optionals) get a step of their own.
     """
-    Serialize a packet to json bytes.
+
+    def __init__(self, clazz):
+        self.clazz = clazz
+        self.header = bytes((clazz.packet_id,))
+        self.fields = [(name, parse_field_type(type_name)) for name, type_name in clazz.fields]
+        # list of (struct.Struct | None, [(name, FieldType), ...]); struct is None for a variable-size field
+        self.steps = []
+        fixed = []
+        for name, field_type in self.fields:
+            if field_type.fmt is not None:
+                fixed.append((name, field_type))
+                continue
+            self._add_fixed_step(fixed)
+            fixed = []
+            self.steps.append((None, [(name, field_type)]))
+        self._add_fixed_step(fixed)
+
+    def _add_fixed_step(self, fixed: list):
+        if fixed:
+            self.steps.append((struct.Struct("<" + "".join(field_type.fmt for _, field_type in fixed)), fixed))
+
+    def encode(self, packet: Packet) -> bytes:
+        """Encode the packet to bytes, starting with its packet id."""
+        out = bytearray(self.header)
+        values = packet.__dict__
+        for fixed_struct, fields in self.steps:
+            if fixed_struct:
+                struct_values = []
+                for name, field_type in fields:
+                    struct_values.extend(field_type.pack(values[name]))
+                out += fixed_struct.pack(*struct_values)
+            else:
+                name, field_type = fields[0]
+                field_type.encode(values[name], out)
+        return bytes(out)
+
+    def decode(self, data) -> Packet:
+        """Decode a packet from the data (including the packet id byte)."""
+        values = {}
+        offset = len(self.header)
+        for fixed_struct, fields in self.steps:
+            if fixed_struct:
+                struct_values = fixed_struct.unpack_from(data, offset)
+                offset += fixed_struct.size
+                index = 0
+                for name, field_type in fields:
+                    values[name] = field_type.unpack(struct_values[index:index + field_type.width])
+                    index += field_type.width
+            else:
+                name, field_type = fields[0]
+                values[name], offset = field_type.decode(data, offset)
+        if offset != len(data):
+            raise struct.error(f"{len(data) - offset} unexpected trailing bytes")
+        # the schema covers all properties of the packet, so we don't need to call __init__
+        instance = self.clazz.__new__(self.clazz)
+        instance.__dict__.update(values)
+        return instance
+
+
+def _compile_codecs() -> (dict[type, PacketCodec], dict[int, PacketCodec], dict[str, PacketCodec]):
+    """Compile the codecs of all packet classes and index them by class, packet id and class name."""
+    by_class, by_id, by_name = {}, {}, {}
+    for name, clazz in packet_classes:
+        if "packet_id" not in clazz.__dict__:
+            continue  # base classes like AuthorizedPacket are never sent on their own
+        if not 0 <= clazz.packet_id < JSON_MARKER:
+            raise ValueError(f"Packet id of {name} must be between 0 and {JSON_MARKER - 1}")
+        if clazz.packet_id in by_id:
+            raise ValueError(f"Duplicate packet id {clazz.packet_id}: {name} and {by_id[clazz.packet_id].clazz}")
+        codec = PacketCodec(clazz)
+        by_class[clazz] = by_id[clazz.packet_id] = by_name[name] = codec
+    return by_class, by_id, by_name
+
+
+_codecs_by_class, _codecs_by_id, _codecs_by_name = _compile_codecs()
+
+
+def serialize(packet: Packet, codec: str = CODEC_JSON) -> bytes:
+    """
+    Serialize a packet to bytes. The packet itself is not modified, so it can be serialized multiple times.
     :param packet: the packet instance to serialize
-    :return: the serialized packet as json bytes
+    :param codec: the codec to use; CODEC_JSON (default; used for the handshake) or CODEC_BINARY
+    :return: the serialized packet as bytes
+    """
+    packet_codec = _codecs_by_class[packet.__class__]
+    if codec == CODEC_BINARY:
+        return packet_codec.encode(packet)
+
+    # the type is used for finding the packet class upon deserialization
+    packet_dict = {"type": packet.__class__.__name__}
+    values = packet.__dict__
+    for name, field_type in packet_codec.fields:
+        packet_dict[name] = field_type.to_json(values[name])
+    return json.dumps(packet_dict).encode()
+
+
+class EncodedPacket(NamedTuple):
+    """
+    Immutable serialized form of a packet (see encode()). Sending the same EncodedPacket to multiple clients reuses
+    its bytes instead of serializing the packet again for every recipient.
     """
-    packet_type = packet.__class__.__name__
-    # add type to dict
-    packet.__dict__["type"] = packet_type
+    packet_type: type  # class of the packet that was encoded
+    codec: str  # codec the packet was serialized with
+    data: bytes  # the serialized packet
 
-    # custom serialization
-    for key, value in packet.__dict__.items():
-        if isinstance(value, pygame.Vector2):
-            packet.__dict__[key] = (value.x, value.y)
 
-    return json.dumps(packet.__dict__).encode()
+def encode(packet: Packet, codec: str, compressed: bool = False) -> EncodedPacket:
+    """
+    Serialize a packet once into an immutable EncodedPacket.
+    :param compressed: whether to compress the packet if it is big (see compression.py); only if the peer supports it
+    """
+    data = serialize(packet, codec)
+    return EncodedPacket(packet.__class__, codec, compression.compress(data) if compressed else data)
 
 
 def deserialize(data: str | bytes) -> Packet | None:
     """
-    Try to deserialize a packet from a json string. If the packet could not be deserialized, None is returned.
+    Try to deserialize a packet from binary or json data. The codec is detected from the first byte.
+    If the packet could not be deserialized, None is returned.
 
-    :param data: the json string or json bytes to deserialize
+    :param data: the json string or the binary/json bytes (or memoryview) to deserialize
     :return: the deserialized packet or None if it could not be deserialized
     """
     try:
-        packet_dict = json.loads(data)
-        # get type from dict
-        packet_type = packet_dict["type"]
-        clazz = [clazz for name, clazz in packet_classes if name == packet_type][0]
-        del packet_dict["type"]  # remove type from dict; type was included upon serialization
-        # handle token; if the packet is an instance of AuthorizedPacket, it must have a token
-        token = None
-        if issubclass(clazz, AuthorizedPacket):
-            token = packet_dict["token"]
-            del packet_dict["token"]
-
-        # custom deserialization
-        for key, value in packet_dict.items():
-            if _is_valid_position(value):
-                packet_dict[key] = pygame.Vector2(value[0], value[1])
-
-        # noinspection PyArgumentList
-        instance = clazz(**packet_dict)
-        if token:
-            instance.token = token
-        return instance
-    except (JSONDecodeError, KeyError, IndexError) as e:
+        if not isinstance(data, str) and data[0] == compression.COMPRESSED_MARKER:
+            data = compression.decompress(data)
+        if isinstance(data, str) or data[0] == JSON_MARKER:
+            return _deserialize_json(data)
+        return _codecs_by_id[data[0]].decode(data)
+    except (JSONDecodeError, KeyError, IndexError, TypeError, ValueError, struct.error, zlib.error) as e:
+        # UnicodeDecodeError is a subclass of ValueError
         print(f"Could not deserialize packet:", e)
 
 
-def _is_valid_position(pos):
+def _deserialize_json(data: str | bytes) -> Packet:
+    """Deserialize a json packet. The schema of the packet class is used for restoring e.g. Vector2 fields."""
+    packet_dict = json.loads(data if isinstance(data, (str, bytes)) else bytes(data))
+    codec = _codecs_by_name[packet_dict["type"]]
+    instance = codec.clazz.__new__(codec.clazz)
+    for name, field_type in codec.fields:
+        value = packet_dict.get(name) if isinstance(field_type, _OptionalField) else packet_dict[name]
+        instance.__dict__[name] = field_type.from_json(value)
+    return instance
+
+
+_frame_header = struct.Struct("<HI")  # ack and ack bits of the reliable channel, after the FRAME_MARKER
+_frame_item_header = struct.Struct("<H")  # length of a packet in a frame; the highest bit marks reliable packets
+_frame_item_seq = struct.Struct("<H")  # sequence number of a reliable packet, after the item header
+_RELIABLE_FLAG = 0x8000
+_SEQ_MODULO = 1 << 16  # sequence numbers are u16 and wrap around
+# bytes a frame adds to a reliable packet; a packet of up to the MTU minus this is sent in a single frame
+RELIABLE_FRAME_OVERHEAD = 1 + _frame_header.size + _frame_item_header.size + _frame_item_seq.size
+RESEND_TIMEOUT = 0.2  # seconds after which an unacknowledged reliable packet is sent again
+
+
+def _seq_distance(newer: int, older: int) -> int:
+    """:return: how many sequence numbers newer is ahead of older; >= 2^15 if newer is actually older"""
+    return (newer - older) % _SEQ_MODULO
+
+
+class ReliableChannel:
+    """
+    State of the reliability layer for one peer, used for packets that opt in with `reliable = True`.
+
+    Reliable packets get increasing sequence numbers and are kept until the peer acknowledges them; if that takes
+    longer than RESEND_TIMEOUT, they are sent again with the next frame. The receiver delivers them in sequence
+    order, holding back packets that arrive before a missing one. Acknowledgements are piggybacked on every frame
+    in the other direction (see FrameBuffer): the sequence number up to which all packets were received, plus a bit
+    field of the 32 following ones that were received out of order, so only the lost packets are sent again.
+    """
+
+    def __init__(self):
+        self.next_seq = 0  # sequence number of the next reliable packet we send
+        self.unacked: dict[int, list] = {}  # seq -> [serialized packet, last send time] of sent reliable packets
+        self.next_expected = 0  # sequence number of the next reliable packet we deliver
+        self._received: dict[int, bytes] = {}  # reliable packets received ahead of next_expected; seq -> packet
+        self.ack_pending = False  # whether we received reliable packets the peer doesn't know are acknowledged yet
+
+    def track(self, data: bytes) -> int:
+        """
+        Keep a reliable packet for resending it until it is acknowledged.
+        :return: the sequence number of the packet
+        """
+        seq = self.next_seq
+        self.next_seq = (seq + 1) % _SEQ_MODULO
+        self.unacked[seq] = [data, time()]
+        return seq
+
+    def due_resends(self) -> list[tuple[int, bytes]]:
+        """:return: (seq, packet) of the unacknowledged packets that have to be sent again now"""
+        now = time()
+        due = []
+        for seq, entry in self.unacked.items():
+            if now - entry[1] >= RESEND_TIMEOUT:
+                entry[1] = now
+                due.append((seq, entry[0]))
+        return due
+
+    @property
+    def ack(self) -> int:
+        """:return: the sequence number up to which we received all reliable packets"""
+        return (self.next_expected - 1) % _SEQ_MODULO
+
+    @property
+    def ack_bits(self) -> int:
+        """:return: bit i is set if we received the reliable packet with seq ack + 2 + i (see ack) already"""
+        bits = 0
+        for seq in self._received:
+            distance = _seq_distance(seq, self.next_expected) - 1
+            if 0 <= distance < 32:
+                bits |= 1 << distance
+        return bits
+
+    def on_ack(self, ack: int, ack_bits: int):
+        """Forget the sent packets the peer acknowledged (see ack and ack_bits)."""
+        if not self.unacked:
+            return
+        for seq in list(self.unacked):
+            distance = _seq_distance(seq, ack)
+            if distance >= _SEQ_MODULO // 2 or distance == 0:
+                del self.unacked[seq]  # seq <= ack
+            elif distance >= 2 and ack_bits & (1 << (distance - 2)):
+                del self.unacked[seq]
+
+    def receive(self, seq: int, data) -> list:
+        """
+        Handle a received reliable packet.
+        :return: the packets that can be delivered now, in order; empty if the packet is a duplicate or arrived early
+        """
+        self.ack_pending = True
+        if _seq_distance(seq, self.next_expected) >= _SEQ_MODULO // 2 or seq in self._received:
+            return []  # duplicate; the peer didn't get our ack yet
+        self._received[seq] = bytes(data)  # copied, as it may be held back longer than the datagram
+        delivered = []
+        while self.next_expected in self._received:
+            delivered.append(self._received.pop(self.next_expected))
+            self.next_expected = (self.next_expected + 1) % _SEQ_MODULO
+        return delivered
+
+
+class FrameBuffer:
+    """
+    Outbound buffer for one peer that coalesces serialized packets into as few datagrams (frames) as possible.
+
+    Packets are appended to the current frame until the next one would exceed the MTU; then a new frame is started.
+    A packet that is bigger than the MTU on its own gets a frame of its own (and will be fragmented by IP).
+    Every frame starts with the acknowledgements of the peer's ReliableChannel; due resends of reliable packets are
+    added when the buffer is flushed.
+    """
+
+    def __init__(self, channel: ReliableChannel, mtu: int = DEFAULT_MTU):
+        self.channel = channel
+        self.mtu = mtu
+        self._frames: list[bytearray] = []  # full frames, waiting for the next flush
+        self._current = self._new_frame()  # frame packets are currently appended to
+
+    @staticmethod
+    def _new_frame() -> bytearray:
+        # the ack header is filled in when flushing, so it is as recent as possible
+        return bytearray((FRAME_MARKER,)) + bytes(_frame_header.size)
+
+    def add(self, data: bytes, reliable: bool = False):
+        """
+        Append a serialized packet to the buffer.
+        :param reliable: whether the packet is sent over the reliable channel (see Packet.reliable)
+        """
+        self._add_item(data, self.channel.track(data) if reliable else None)
+
+    def _add_item(self, data: bytes, seq: int | None):
+        item_size = _frame_item_header.size + len(data) + (_frame_item_seq.size if seq is not None else 0)
+        if len(self._current) > 1 + _frame_header.size and len(self._current) + item_size > self.mtu:
+            # packet doesn't fit in the current frame anymore
+            self._frames.append(self._current)
+            self._current = self._new_frame()
+        if seq is None:
+            self._current += _frame_item_header.pack(len(data))
+        else:
+            self._current += _frame_item_header.pack(len(data) | _RELIABLE_FLAG)
+            self._current += _frame_item_seq.pack(seq)
+        self._current += data
+
+    def flush(self) -> list[bytearray]:
+        """
+        Finish the current frame and empty the buffer.
+        :return: the frames (datagrams) to send, in order; a frame without packets if only acks are pending
+        """
+        for seq, data in self.channel.due_resends():
+            self._add_item(data, seq)
+        if len(self._current) > 1 + _frame_header.size or (self.channel.ack_pending and not self._frames):
+            self._frames.append(self._current)
+            self._current = self._new_frame()
+        frames, self._frames = self._frames, []
+        for frame in frames:
+            _frame_header.pack_into(frame, 1, self.channel.ack, self.channel.ack_bits)
+        if frames:
+            self.channel.ack_pending = False
+        return frames
+
+
+def split_datagram(data: bytes, channel: ReliableChannel) -> list:
     """
-    Helper function to check if the given object is a valid position (tuple/list of two numbers).
+    Get the serialized packets contained in a received datagram, and process the acknowledgements of a frame.
+    :param data: the datagram; either a frame (see FrameBuffer) or a single serialized packet
+    :param channel: the reliable channel of the peer that sent the datagram
+    :return: list of the serialized packets (bytes or memoryview slices of the datagram) that can be handled now;
+    reliable packets are returned in order and only once
     """
-    return isinstance(pos, list) \
-        and len(pos) == 2 \
-        and isinstance(pos[0], (float, int)) \
-        and isinstance(pos[1], (float, int))
+    if not data or data[0] != FRAME_MARKER:
+        return [data]
+    view = memoryview(data)
+    if len(view) < 1 + _frame_header.size:
+        print("Received truncated frame")
+        return []
+    channel.on_ack(*_frame_header.unpack_from(view, 1))
+    packets = []
+    offset = 1 + _frame_header.size
+    while offset < len(view):
+        if offset + _frame_item_header.size > len(view):
+            print("Received truncated frame")
+            break
+        length, = _frame_item_header.unpack_from(view, offset)
+        offset += _frame_item_header.size
+        seq = None
+        if length & _RELIABLE_FLAG:
+            length &= ~_RELIABLE_FLAG
+            if offset + _frame_item_seq.size > len(view):
+                print("Received truncated frame")
+                break
+            seq, = _frame_item_seq.unpack_from(view, offset)
+            offset += _frame_item_seq.size
+        if offset + length > len(view):
+            print("Received truncated frame")
+            break
+        if seq is None:
+            packets.append(view[offset:offset + length])
+        else:
+            packets.extend(channel.receive(seq, view[offset:offset + length]))
+        offset += length
+    return packets
+
+
+_session_header = struct.Struct("<I4s")  # session id and MAC, after the SESSION_MARKER
+SESSION_KEY_SIZE = 16
+
+
+def _mac(key: bytes, data) -> bytes:
+    return hashlib.blake2s(data, key=key, digest_size=4).digest()
+
+
+def sign_datagram(data: bytes, session_id: int, key: bytes) -> bytes:
+    """:return: the datagram prefixed with the session header (see module docstring)"""
+    return bytes((SESSION_MARKER,)) + _session_header.pack(session_id, _mac(key, data)) + data
+
+
+def read_session_header(data) -> tuple[int, bytes, memoryview] | None:
+    """
+    Split a received datagram into its session header and the signed datagram.
+    :return: the session id, the MAC and the signed datagram, or None if the datagram has no (complete) session header
+    """
+    if len(data) < 1 + _session_header.size or data[0] != SESSION_MARKER:
+        return None
+    session_id, mac = _session_header.unpack_from(data, 1)
+    return session_id, mac, memoryview(data)[1 + _session_header.size:]
+
+
+def verify_mac(key: bytes, mac: bytes, data) -> bool:
+    """:return: whether the MAC of the session header matches the signed datagram"""
+    return hmac.compare_digest(_mac(key, data), mac)
@@ -12,105 +12,179 @@ The packets are divided into two main categories:
         Example: HelloPacket, RequestInfoPacket (currently not implemented), etc.
 - Server to client (s2c)
 
-Serialization works using json due to pickle being unsafe (possible arbitrary code execution). This means that
-the packets must only use types that are supported by json (dict, list, int, float, str, bool, None), so no
-custom classes are allowed/custom classes must be converted when creating the packet or reading its content.
+Serialization works using a schema instead of pickle, as pickle is unsafe (possible arbitrary code execution).
+Every packet declares a unique numeric packet_id and a `fields` schema: a tuple of (name, type) pairs listing the
+properties that are sent over the network, in wire order. From this schema, networking.py compiles struct-based
+binary encoders and decoders. The json codec (kept as a fallback for debugging) uses the same schema.
+
+Available field types: bool, u8, u16, u32, i16, i32, f32, f64, str, bytes, vec2 (pygame.Vector2 or (x, y) tuple),
+list[<type>] and optional types (<type>?, e.g. "str?"). Packet ids must be lower than 123 (the ascii code of "{"),
+so that binary packets can be told apart from json packets by their first byte.
 """
 
 
+# Send priorities of the server (see server/src/send_scheduler.py); lower values are sent first
+PRIORITY_HIGH = 0  # packets that must arrive, like spawns and removes (the reliable packets), and connection probes
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2  # frequent updates that are replaced by the next one anyway; dropped first on slow connections
+
+MAX_NAME_LENGTH = 20  # characters of the name in a HelloPacket
+
+
 # Base class
 class Packet:
     """Base class for all packets.
 
     The subclasses should have only the properties that should be sent over the network.
     """
-    pass
+    packet_id: int  # unique numeric identifier of the packet type on the wire
+    fields: tuple[tuple[str, str], ...] = ()  # schema: (name, type) pairs of the properties sent over the network
+    # whether the packet is sent over the reliable channel: resent until acknowledged and handled in order (see
+    # networking.ReliableChannel); for packets that must not get lost, like spawns. Frequent updates (inputs, entity
+    # snapshots) stay unreliable, as a newer packet replaces a lost one anyway.
+    reliable: bool = False
+    # when the bandwidth budget of a client is exhausted, packets with a lower priority value are sent first; the
+    # remaining unreliable packets are dropped, the remaining reliable ones sent later (see send_scheduler.py)
+    priority: int = PRIORITY_NORMAL
 
 
 # Client to server
 class AuthorizedPacket(Packet):
-    def __init__(self):
-        self.token = None
-
     """Baseclass for all packets that are sent when the client is already authorized.
 
-    Example: PlayerMovePacket, PlayerAttackEntityPacket, etc.
+    Example: ChangeInputPacket, DisconnectPacket, etc.
 
-    In the send logic of the client, it should check if a packet is an instance of this class, and if so,
-    add the client token to the packet (or complain if the client is not authorized).
+    These packets are only accepted in datagrams with a valid session header (see networking.sign_datagram()); the
+    client signs all its datagrams once it got its session from the HelloReplyPacket.
     """
-    pass
+    fields = ()
 
 
-class ChangeInputPacket(AuthorizedPacket):
-    """Sent by the client to the server to indicate that the player's input has changed."""
+class PlayerPacket(AuthorizedPacket):
+    """Baseclass for the packets that control the player of the client, e.g. ChangeInputPacket.
+
+    Spectators are authorized too, but have no player; the server drops these packets from their sessions.
+    """
+    fields = AuthorizedPacket.fields
+
 
-    def __init__(self, direction: int, attacking: bool):
+class ChangeInputPacket(PlayerPacket):
+    """Sent by the client to the server to indicate that the player's input has changed.
+
+    Every input state gets a sequence number. The packet carries the newest input states (newest first: the input
+    with index i has the sequence number `sequence - i`), and the client sends it again at a fixed rate while a key is
+    held, so a lost packet is covered by the next one without waiting for a resend. The server handles every sequence
+    number only once (see PlayerActions.on_change_input()).
+    """
+
+    packet_id = 1
+    fields = PlayerPacket.fields + (("sequence", "u32"), ("directions", "list[u8]"), ("attacking", "list[bool]"))
+
+    def __init__(self, sequence: int, directions: list[int], attacking: list[bool]):
         super().__init__()
-        self.direction = direction
-        self.attacking = attacking
+        self.sequence = sequence  # sequence number of the newest input
+        self.directions = directions  # movement direction of each input, newest first
+        self.attacking = attacking  # whether the player attacks, for each input, newest first
 
 
 class DisconnectPacket(AuthorizedPacket):
     """Sent by the client to the server to tell it that it wants to quit."""
-    pass
+
+    packet_id = 2
 
 
 class HelloPacket(Packet):
     """Sent by the client to the server to login.
 
-    If the server accepts this, it will send a HelloReplyPacket back with our token for this session/game.
+    If the server accepts this, it will send a HelloReplyPacket back with our session for this game.
+
+    After its connection broke off, a client can resume its session by sending the resume token of the session and
+    the state it still has (the resume_* fields). If the server still keeps the player (see
+    PlayerManager.RESUME_GRACE_PERIOD), the client gets its player back and only the changes since that state.
+
+    A spectator logs in without a player: it gets all entities of the game and can't send inputs. Spectators usually
+    log in to a relay (see server/src/relay.py), which logs in to the game server as a spectator itself.
 
     name = unique? todo name servers/login method?
     """
 
-    def __init__(self, name):
+    packet_id = 3
+    fields = (("name", "str"), ("codecs", "list[str]"), ("compressions", "list[str]"), ("map_hashes", "list[str]"),
+              ("generator_versions", "list[u8]"), ("resume_token", "bytes"), ("resume_snapshot", "u32"),
+              ("resume_entities_hash", "bytes"), ("resume_map_hash", "str"), ("spectator", "bool"))
+
+    def __init__(self, name, codecs: list[str], compressions: list[str], map_hashes: list[str],
+                 generator_versions: list[int], resume_token: bytes = b"", resume_snapshot: int = 0,
+                 resume_entities_hash: bytes = b"", resume_map_hash: str = "", spectator: bool = False):
         self.name = name
+        self.codecs = codecs  # packet codecs supported by the client, in order of preference (see networking.py)
+        self.compressions = compressions  # packet compressions supported by the client (see compression.py)
+        self.map_hashes = map_hashes  # content hashes of the maps the client has cached; these aren't sent again
+        # map generator versions the client can reproduce; generated maps with these versions aren't sent either
+        self.generator_versions = generator_versions
+        self.resume_token = resume_token  # resume token of the session to resume; empty for a new session
+        self.resume_snapshot = resume_snapshot  # tick of the last entity snapshot the client applied
+        # digest of the ids of the entities the client has, including its player (see snapshots.hash_entity_ids());
+        # just the digest, so the packet stays small however many entities the client has
+        self.resume_entities_hash = resume_entities_hash
+        self.resume_map_hash = resume_map_hash  # hash of the map the client has
+        self.spectator = spectator  # whether the client only watches the game, without a player
 
 
 class PingPacket(Packet):
-    """Sent by the client to the server to announce that it is still alive."""
-    pass
+    """Sent by the client to the server to announce that it is still alive.
 
-
-# Server to client
-class EntityDirectionPacket(Packet):
-    """
-    Sent by the server to clients to indicate that an entity changed their looking direction.
-    This is needed for updating the player sprites on the other clients.
+    The client also sends one immediately for every PongPacket, echoing its sequence number, so the server can measure
+    the round trip time (see server/src/connection_stats.py).
     """
 
-    def __init__(self, uuid: str, direction: int):
-        self.uuid = uuid  # unique identifier of the player that moved
-        self.direction = direction  # new direction of the player
+    packet_id = 4
+    fields = (("sequence", "u16"),)
+
+    def __init__(self, sequence: int = 0):
+        self.sequence = sequence  # sequence number of the echoed PongPacket; 0 for a periodic ping
 
 
-class EntityMovePacket(Packet):
-    """Sent by the server to clients to indicate that an entity moved to the new specified *tile* position."""
+class SnapshotAckPacket(AuthorizedPacket):
+    """Sent by the client to the server to acknowledge that it applied the entity snapshot with the specified tick."""
 
-    def __init__(self, uuid: str, tile_position: (int, int)):
-        self.uuid = uuid  # unique identifier of the player that moved
-        self.tile_position = tile_position  # new position of the player in tile coordinates
+    packet_id = 5
+    fields = AuthorizedPacket.fields + (("tick", "u32"),)
 
+    def __init__(self, tick: int):
+        super().__init__()
+        self.tick = tick
 
-class EntityHealthPacket(Packet):
-    """Sent by the server to clients to indicate that an entity's health changed."""
 
-    def __init__(self, uuid: str, health: int):
-        self.uuid = uuid  # unique identifier of the player that moved
-        self.health = health  # new health of the player
+class MapChunkRequestPacket(AuthorizedPacket):
+    """Sent by the client to the server to request chunks of the current map that did not arrive (again)."""
 
+    packet_id = 6
+    fields = AuthorizedPacket.fields + (("map_hash", "str"), ("indices", "list[u16]"))
 
-class EntityAttackPacket(Packet):
+    def __init__(self, map_hash: str, indices: list[int]):
+        super().__init__()
+        self.map_hash = map_hash  # content hash of the map
+        self.indices = indices  # indices of the missing chunks
+
+
+# Server to client
+class EntitySnapshotPacket(Packet):
     """
-    Sent by the server to clients to indicate the attacking state of an entity changed.
+    Sent by the server to clients with the state (position, health, direction, attacking) of the entities.
 
-    Currently, there is only one attack method for each entity, so the client will know what animation to play.
+    Contains the delta from the snapshot with the tick base_tick (the last one the client acknowledged; 0 for none)
+    to the snapshot with the specified tick. See common/src/snapshots.py for the format of the delta.
     """
 
-    def __init__(self, uuid: str, attacking: bool):
-        self.uuid = uuid  # unique identifier of the entity that is attacking
-        self.attacking = attacking  # new attacking state of the entity
+    packet_id = 27
+    priority = PRIORITY_LOW  # the next snapshot contains the changes of a dropped one, too
+    fields = (("tick", "u32"), ("base_tick", "u32"), ("delta", "bytes"))
+
+    def __init__(self, tick: int, base_tick: int, delta: bytes):
+        self.tick = tick  # tick of the snapshot the client has after applying the delta
+        self.base_tick = base_tick  # tick of the snapshot the delta is based on
+        self.delta = delta  # encoded delta
 
 
 class HelloReplyPacket(Packet):
@@ -119,14 +193,29 @@ class HelloReplyPacket(Packet):
     This will be the case if the server/game is not yet full (and has not yet started!).
     """
 
-    def __init__(self, token, player_uuid):
-        self.token = token
-        self.player_uuid = player_uuid
+    packet_id = 20
+    reliable = True
+    priority = PRIORITY_HIGH
+    fields = (("session_id", "u32"), ("session_key", "bytes"), ("player_id", "u32"), ("codec", "str"),
+              ("compression", "str"), ("resume_token", "bytes"), ("resumed", "bool"))
+
+    def __init__(self, session_id: int, session_key: bytes, player_id: int, codec: str, compression: str = "",
+                 resume_token: bytes = b"", resumed: bool = False):
+        self.session_id = session_id  # identifies the client in the session header; 0 if the login was rejected
+        self.session_key = session_key  # key for the MACs in the session header
+        self.player_id = player_id  # entity id of the client's player; 0 for a spectator
+        self.codec = codec  # packet codec chosen by the server; used by both sides for the rest of the session
+        self.compression = compression  # packet compression chosen by the server; "" if packets aren't compressed
+        self.resume_token = resume_token  # secret for resuming the session after the connection broke off
+        self.resumed = resumed  # whether an earlier session was resumed; the client keeps its state then
 
 
 class InfoReplyPacket(Packet):
     """Sent by the server to the client to reply to a RequestInfoPacket."""
 
+    packet_id = 21
+    fields = (("motd", "str"), ("player_count", "u16"), ("state", "u8"))
+
     def __init__(self, motd: str, player_count: int, state):
         self.motd = motd
         self.player_count = player_count
@@ -137,30 +226,89 @@ class MapChangePacket(Packet):
     """
     Sent by the server to clients to indicate that the map changed,
     e.g. when match-making is over and the game starts.
+
+    If the map was generated and the client supports the generator version, the client generates the map from the
+    seed itself (see common/src/map/generation.py). Otherwise, the map is sent in MapChunkPacket chunks, see
+    common/src/map/transfer.py.
     """
 
-    def __init__(self, name: str, tiles: list[list[str]]):
+    packet_id = 22
+    reliable = True
+    priority = PRIORITY_HIGH
+    fields = (("name", "str"), ("map_hash", "str"), ("chunk_count", "u16"),
+              ("seed", "u32"), ("size", "u16"), ("generator_version", "u8"))
+
+    def __init__(self, name: str, map_hash: str, chunk_count: int, seed: int = 0, size: int = 0,
+                 generator_version: int = 0):
         """
         :param name: the name of the new map
-        :param tiles: the new map (list of lists of tile names - y, x)
+        :param map_hash: the content hash of the encoded map
+        :param chunk_count: the number of chunks the encoded map is split into
+        :param seed: the seed the map was generated with
+        :param size: the size the map was generated with
+        :param generator_version: the version of the map generator; 0 if the map was not generated
         """
         self.name = name
-        self.tiles = tiles
+        self.map_hash = map_hash
+        self.chunk_count = chunk_count
+        self.seed = seed
+        self.size = size
+        self.generator_version = generator_version
+
+
+class MapChunkPacket(Packet):
+    """Sent by the server to clients with one chunk of the encoded map announced with a MapChangePacket."""
+
+    packet_id = 28
+    fields = (("map_hash", "str"), ("index", "u16"), ("data", "bytes"))
+
+    def __init__(self, map_hash: str, index: int, data: bytes):
+        self.map_hash = map_hash  # content hash of the map the chunk belongs to
+        self.index = index  # index of the chunk
+        self.data = data  # chunk of the encoded map
+
+
+class TileChangePacket(Packet):
+    """
+    Sent by the server to clients with the tiles of the current map that changed, e.g. an opened door or a broken
+    wall: the changes of one tick, batched (see TileManager). A client that gets the map also gets all changes since
+    the map was announced this way, right after the MapChangePacket.
+    """
+
+    packet_id = 30
+    reliable = True  # the changes of a tile have to be applied in order
+    priority = PRIORITY_HIGH
+    fields = (("xs", "list[u16]"), ("ys", "list[u16]"), ("tiles", "list[str]"))
+
+    def __init__(self, xs: list[int], ys: list[int], tiles: list[str]):
+        self.xs = xs  # x coordinates of the changed tiles
+        self.ys = ys  # y coordinates of the changed tiles
+        self.tiles = tiles  # names of the new tiles, "" for an empty tile
 
 
 class EntityRemovePacket(Packet):
     """Sent by the server to clients to indicate that a player/entity was removed from the current world / left."""
 
-    def __init__(self, uuid):
-        self.uuid = uuid  # unique identifier of the player that left
+    packet_id = 23
+    reliable = True
+    priority = PRIORITY_HIGH
+    fields = (("entity_id", "u32"),)
+
+    def __init__(self, entity_id: int):
+        self.entity_id = entity_id  # id of the entity that left
 
 
 class PlayerSpawnPacket(Packet):
     """Sent by the server to clients to indicate that a player spawned at the specified tile position."""
 
-    def __init__(self, name: str, uuid: str, tile_position: (int, int), health: int):
+    packet_id = 24
+    reliable = True
+    priority = PRIORITY_HIGH
+    fields = (("name", "str"), ("entity_id", "u32"), ("tile_position", "vec2"), ("health", "i16"))
+
+    def __init__(self, name: str, entity_id: int, tile_position: (int, int), health: int):
         self.name = name  # name of the player that spawned
-        self.uuid = uuid  # unique identifier of the player that spawned
+        self.entity_id = entity_id  # entity id of the player that spawned
         self.tile_position = tile_position  # position of the player in tile coordinates
         self.health = health  # health of the player
 
@@ -168,16 +316,49 @@ class PlayerSpawnPacket(Packet):
 class EntitySpawnPacket(Packet):
     """Sent by the server to clients to indicate that a hostile entity spawned at the specified tile position."""
 
-    def __init__(self, uuid: str, entity_type: str, tile_position: (int, int), health: int):
-        self.uuid = uuid  # unique identifier of the entity that spawned
+    packet_id = 25
+    reliable = True
+    priority = PRIORITY_HIGH
+    fields = (("entity_id", "u32"), ("entity_type", "str"), ("tile_position", "vec2"), ("health", "i16"))
+
+    def __init__(self, entity_id: int, entity_type: str, tile_position: (int, int), health: int):
+        self.entity_id = entity_id  # id of the entity that spawned
         self.entity_type = entity_type  # type of the entity that spawned
         self.tile_position = tile_position  # position of the entity in tile coordinates
         self.health = health  # health of the entity
 
 
+class JoinSnapshotPacket(Packet):
+    """
+    Sent by the server to a client that joined: all entities around its player (including the player itself) with
+    their state, encoded as world snapshot (see common/src/snapshots.py). Big worlds are split into multiple packets;
+    the client applies the snapshot when it received the last one.
+    """
+
+    packet_id = 29
+    reliable = True  # the parts arrive in order
+    priority = PRIORITY_HIGH
+    fields = (("index", "u16"), ("count", "u16"), ("data", "bytes"))
+
+    def __init__(self, index: int, count: int, data: bytes):
+        self.index = index  # index of this part
+        self.count = count  # number of parts
+        self.data = data  # part of the encoded world snapshot
+
+
 class PongPacket(Packet):
-    """Sent by the server to clients to announce that it is still alive and the respective client is still connected."""
-    pass
+    """Sent by the server to clients to announce that it is still alive and the respective client is still connected.
+
+    Sent to each client every ConnectionStats.PROBE_INTERVAL seconds; the client echoes the sequence number back with
+    a PingPacket.
+    """
+
+    packet_id = 26
+    priority = PRIORITY_HIGH  # a delayed probe would measure our own queue
+    fields = (("sequence", "u16"),)
+
+    def __init__(self, sequence: int):
+        self.sequence = sequence  # sequence number of the probe, never 0
 
 
 # Used for deserialization so that we don't have to hardcode the packet types
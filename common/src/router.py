@@ -0,0 +1,72 @@
+"""
+Packet routing used by both the server and the client.
+
+Handlers are registered for a packet class and received packets are dispatched to them with a single dict lookup,
+so code that is not interested in a packet type never sees it. For every handler, the router records how often it
+was called and how much time it took, so we can see which handlers are hot.
+"""
+from time import perf_counter
+
+from common.src.packets import Packet
+
+
+class HandlerStats:
+    """Call count and accumulated run time of one registered handler."""
+
+    def __init__(self, name: str):
+        self.name = name  # qualified name of the handler, e.g. PlayerManager.on_hello
+        self.calls = 0  # number of packets handled
+        self.total_time = 0.0  # accumulated time spent in the handler, in seconds
+
+    @property
+    def average_time(self) -> float:
+        """:return: the average time per call in seconds"""
+        return self.total_time / self.calls if self.calls else 0.0
+
+    def __str__(self):
+        return f"{self.name}: {self.calls} calls, {self.total_time * 1000:.2f} ms total, " \
+               f"{self.average_time * 1e6:.1f} µs avg"
+
+
+class PacketRouter:
+    """
+    Dispatches packets to the handlers registered for their exact packet class.
+
+    Handlers are called with the packet and the extra arguments passed to dispatch(), e.g. the client address on the
+    server. Multiple handlers can be registered for the same packet class; they are called in registration order.
+    """
+
+    def __init__(self):
+        # packet class -> list of (handler, HandlerStats)
+        self._handlers: dict[type, list[tuple]] = {}
+        self.stats: list[HandlerStats] = []  # statistics of all registered handlers
+
+    def register(self, packet_class: type, handler):
+        """
+        Register a handler for a packet class.
+        :param packet_class: the (concrete) packet class to handle; subclasses are not matched
+        :param handler: callable taking the packet and the extra arguments passed to dispatch()
+        """
+        stats = HandlerStats(getattr(handler, "__qualname__", repr(handler)))
+        self.stats.append(stats)
+        self._handlers.setdefault(packet_class, []).append((handler, stats))
+
+    def dispatch(self, packet: Packet, *args) -> bool:
+        """
+        Call all handlers registered for the class of the packet.
+        :return: True if at least one handler was registered for the packet, False otherwise
+        """
+        handlers = self._handlers.get(packet.__class__)
+        if not handlers:
+            return False
+        for handler, stats in handlers:
+            start = perf_counter()
+            handler(packet, *args)
+            stats.total_time += perf_counter() - start
+            stats.calls += 1
+        return True
+
+    def hot_handlers(self, count: int | None = None) -> list[HandlerStats]:
+        """:return: the statistics of the handlers that took the most time in total, most expensive first"""
+        hot = sorted((stats for stats in self.stats if stats.calls), key=lambda stats: stats.total_time, reverse=True)
+        return hot[:count] if count is not None else hot
@@ -0,0 +1,179 @@
+"""
+Entity state snapshots, shared by the server (building deltas) and the client (applying them).
+
+A snapshot maps the entity id of every entity to its EntityState. The server numbers its snapshots with an increasing
+tick and sends each client only the delta between the newest snapshot and the last snapshot that client
+acknowledged (its baseline). As the baseline only moves forward when the client confirms it has applied a snapshot,
+a lost datagram is simply covered by the next delta, without resending everything.
+
+Delta format (all integers little endian):
+- u16 number of changed entities, then for each: the entity id (u32), a u8 bit mask of the changed fields
+  (bit i = i-th field of EntityState) and the values of the changed fields
+- u16 number of removed entities, then their entity ids
+
+When a client joins, it gets all entities around its player at once with a world snapshot (see encode_world()): the
+spawn information and state of each entity, so the client can set up the world in one step.
+
+World snapshot format: u16 number of entities, then for each: the entity id (u32), the entity type and the player name
+(empty for other entities; both u16 length + utf-8) and all fields of its EntityState.
+"""
+import hashlib
+import struct
+from typing import NamedTuple
+
+
+class EntityState(NamedTuple):
+    """The part of an entity's state that is synchronized with snapshots."""
+    x: int  # tile position
+    y: int
+    health: int
+    direction: int  # Dir2 value of the entity's input direction
+    attacking: bool
+
+
+_FIELD_STRUCTS = (
+    struct.Struct("<h"),  # x
+    struct.Struct("<h"),  # y
+    struct.Struct("<h"),  # health
+    struct.Struct("<B"),  # direction
+    struct.Struct("<?"),  # attacking
+)
+_ALL_FIELDS = (1 << len(_FIELD_STRUCTS)) - 1
+_EMPTY_STATE = EntityState(0, 0, 0, 0, False)
+_count = struct.Struct("<H")
+_entity_id = struct.Struct("<I")
+_str_length = struct.Struct("<H")
+
+
+def _write_id(out: bytearray, entity_id: int):
+    out += _entity_id.pack(entity_id)
+
+
+def _read_id(data, offset: int) -> (int, int):
+    return _entity_id.unpack_from(data, offset)[0], offset + _entity_id.size
+
+
+def _write_str(out: bytearray, value: str):
+    raw = value.encode()
+    out += _str_length.pack(len(raw))
+    out += raw
+
+
+def _read_str(data, offset: int) -> (str, int):
+    length, = _str_length.unpack_from(data, offset)
+    offset += _str_length.size
+    return str(data[offset:offset + length], "utf-8"), offset + length
+
+
+def hash_entity_ids(entity_ids) -> bytes:
+    """
+    :return: a short digest of a set of entity ids; e.g. a resuming client sends the digest of the entities it has, so
+    the server can check whether they are the ones it thinks the client has
+    """
+    out = bytearray()
+    for entity_id in sorted(set(entity_ids)):
+        _write_id(out, entity_id)
+    return hashlib.blake2b(out, digest_size=8).digest()
+
+
+def encode_delta(base: dict[int, EntityState], current: dict[int, EntityState]) -> bytes | None:
+    """
+    Encode the changes from the base snapshot to the current snapshot.
+    :param base: the snapshot the receiver already has; empty dict for a full snapshot
+    :param current: the snapshot the receiver should end up with
+    :return: the encoded delta, or None if the snapshots are equal
+    """
+    out = bytearray(_count.size)
+    changed = 0
+    for entity_id, state in current.items():
+        old = base.get(entity_id)
+        if old == state:
+            continue
+        mask = _ALL_FIELDS
+        if old is not None:
+            mask = 0
+            for index in range(len(_FIELD_STRUCTS)):
+                if state[index] != old[index]:
+                    mask |= 1 << index
+        _write_id(out, entity_id)
+        out.append(mask)
+        for index, field_struct in enumerate(_FIELD_STRUCTS):
+            if mask & (1 << index):
+                out += field_struct.pack(state[index])
+        changed += 1
+    _count.pack_into(out, 0, changed)
+
+    removed = [entity_id for entity_id in base if entity_id not in current]
+    if not changed and not removed:
+        return None
+    out += _count.pack(len(removed))
+    for entity_id in removed:
+        _write_id(out, entity_id)
+    return bytes(out)
+
+
+def apply_delta(base: dict[int, EntityState], data) -> (dict[int, EntityState], list[int]):
+    """
+    Apply an encoded delta (see encode_delta()) to the base snapshot. The base snapshot is not modified.
+    :return: the new snapshot and the entity ids of the entities whose state changed
+    """
+    snapshot = dict(base)
+    changed = []
+    count, = _count.unpack_from(data, 0)
+    offset = _count.size
+    for _ in range(count):
+        entity_id, offset = _read_id(data, offset)
+        mask = data[offset]
+        offset += 1
+        values = list(snapshot.get(entity_id, _EMPTY_STATE))
+        for index, field_struct in enumerate(_FIELD_STRUCTS):
+            if mask & (1 << index):
+                values[index], = field_struct.unpack_from(data, offset)
+                offset += field_struct.size
+        snapshot[entity_id] = EntityState(*values)
+        changed.append(entity_id)
+
+    count, = _count.unpack_from(data, offset)
+    offset += _count.size
+    for _ in range(count):
+        entity_id, offset = _read_id(data, offset)
+        snapshot.pop(entity_id, None)
+    return snapshot, changed
+
+
+class WorldEntity(NamedTuple):
+    """An entity in a world snapshot: everything the client needs to spawn it."""
+    entity_id: int
+    entity_type: str  # EntityType value
+    name: str  # name of the player; empty for other entities
+    state: EntityState
+
+
+def encode_world(entities: list[WorldEntity]) -> bytes:
+    """Encode a world snapshot, e.g. for a joining client."""
+    out = bytearray(_count.pack(len(entities)))
+    for entity in entities:
+        _write_id(out, entity.entity_id)
+        _write_str(out, entity.entity_type)
+        _write_str(out, entity.name)
+        for index, field_struct in enumerate(_FIELD_STRUCTS):
+            out += field_struct.pack(entity.state[index])
+    return bytes(out)
+
+
+def decode_world(data) -> list[WorldEntity]:
+    """Decode a world snapshot (see encode_world())."""
+    entities = []
+    count, = _count.unpack_from(data, 0)
+    offset = _count.size
+    for _ in range(count):
+        entity_id, offset = _read_id(data, offset)
+        entity_type, offset = _read_str(data, offset)
+        name, offset = _read_str(data, offset)
+        values = []
+        for field_struct in _FIELD_STRUCTS:
+            value, = field_struct.unpack_from(data, offset)
+            values.append(value)
+            offset += field_struct.size
+        entities.append(WorldEntity(entity_id, entity_type, name, EntityState(*values)))
+    return entities
@@ -0,0 +1,96 @@
+"""
+Estimates of the quality of the connection to a client, and the bandwidth we send to it with.
+"""
+from time import time
+
+
+class ConnectionStats:
+    """
+    Round trip time, jitter and loss of the connection to a client, measured with probes: the server sends a
+    PongPacket with a sequence number every PROBE_INTERVAL seconds, and the client echoes the sequence number back
+    immediately with a PingPacket. The send times stay on the server, so a client can't fake its round trip time.
+
+    - rtt: smoothed round trip time in seconds (like TCP, RFC 6298)
+    - jitter: smoothed difference between consecutive round trip times in seconds (like RTP, RFC 3550)
+    - loss: smoothed fraction of the probes that were not echoed within PROBE_TIMEOUT seconds
+
+    From these, the bandwidth budget of the client is derived (additive increase, multiplicative decrease, like TCP):
+    it grows slowly while the probes come back in time, and is halved when a probe gets lost or its round trip time
+    grows far above the lowest one (i.e. the datagrams queue up somewhere on the path). The send scheduler of the
+    server (see send_scheduler.py) only sends as much to the client as the budget allows.
+    """
+    PROBE_INTERVAL = 0.5  # seconds between two probes
+    PROBE_TIMEOUT = 2  # seconds after which a probe that was not echoed counts as lost
+    LOSS_WEIGHT = 0.1  # weight of a single probe in the smoothed loss
+
+    MIN_BANDWIDTH = 4_000  # bytes per second; the budget is never lower than this
+    MAX_BANDWIDTH = 128_000  # bytes per second; the budget is never higher than this
+    INITIAL_BANDWIDTH = 32_000  # bytes per second, until we know better
+    BANDWIDTH_INCREASE = 4_000  # bytes per second added for each probe that came back in time
+    QUEUEING_DELAY = 0.05  # seconds a round trip time may exceed twice the lowest one before we send less
+
+    def __init__(self):
+        self.rtt: float | None = None  # None until the first probe came back
+        self.rtt_variance = 0.0
+        self.min_rtt: float | None = None  # lowest round trip time measured; the rtt without queueing
+        self.jitter = 0.0
+        self.loss = 0.0
+        self.bandwidth = self.INITIAL_BANDWIDTH  # bytes per second we may send to the client
+        self.last_probe_time = 0.0
+        self._last_rtt_sample: float | None = None
+        self._next_sequence = 1  # sequence 0 means "no probe" in PingPackets
+        self._pending: dict[int, float] = {}  # sequence -> send time of the probes that were not echoed yet
+
+    def probe_due(self) -> bool:
+        return time() - self.last_probe_time >= self.PROBE_INTERVAL
+
+    def start_probe(self) -> int:
+        """
+        Remember the send time of a new probe, and count the probes that timed out as lost.
+        :return: the sequence number for the PongPacket
+        """
+        now = time()
+        for sequence, sent in list(self._pending.items()):
+            if now - sent > self.PROBE_TIMEOUT:
+                del self._pending[sequence]
+                self._update_loss(True)
+                self._decrease_bandwidth()
+        sequence = self._next_sequence
+        self._next_sequence = sequence % 0xFFFF + 1  # u16, skipping 0
+        self._pending[sequence] = now
+        self.last_probe_time = now
+        return sequence
+
+    def on_echo(self, sequence: int):
+        """Update the estimates with the echo of a probe; unknown, late and duplicate echoes are ignored."""
+        sent = self._pending.pop(sequence, None)
+        if sent is None:
+            return
+        sample = time() - sent
+        if self.rtt is None:
+            self.rtt = sample
+            self.rtt_variance = sample / 2
+        else:
+            self.rtt_variance += (abs(self.rtt - sample) - self.rtt_variance) / 4
+            self.rtt += (sample - self.rtt) / 8
+        if self._last_rtt_sample is not None:
+            self.jitter += (abs(sample - self._last_rtt_sample) - self.jitter) / 16
+        self._last_rtt_sample = sample
+        self.min_rtt = sample if self.min_rtt is None else min(self.min_rtt, sample)
+        self._update_loss(False)
+
+        if sample > 2 * self.min_rtt + self.QUEUEING_DELAY:
+            self._decrease_bandwidth()
+        else:
+            self.bandwidth = min(self.bandwidth + self.BANDWIDTH_INCREASE, self.MAX_BANDWIDTH)
+
+    def _update_loss(self, lost: bool):
+        self.loss += ((1.0 if lost else 0.0) - self.loss) * self.LOSS_WEIGHT
+
+    def _decrease_bandwidth(self):
+        self.bandwidth = max(self.bandwidth / 2, self.MIN_BANDWIDTH)
+
+    def __str__(self):
+        rtt = f"{self.rtt * 1000:.0f} ms" if self.rtt is not None else "unknown"
+        return (f"rtt {rtt}, jitter {self.jitter * 1000:.0f} ms, loss {self.loss:.0%}, "
+                f"bandwidth {self.bandwidth / 1000:.0f} kB/s")
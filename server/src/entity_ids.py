@@ -0,0 +1,38 @@
+"""
+Allocation of the numeric ids that identify entities on the server and the clients.
+"""
+
+
+class EntityIdAllocator:
+    """
+    Hands out small integer entity ids: the low 16 bits are an index that is recycled when the entity is removed,
+    the high 16 bits are a generation counter that is increased every time the index is reused. So ids stay small
+    (and the ids of the current entities dense), while an id of a removed entity, e.g. in a late packet, never refers
+    to the new entity with the same index. Index 0 is never used, so 0 can mean "no entity".
+    """
+    INDEX_BITS = 16
+    INDEX_MASK = (1 << INDEX_BITS) - 1
+    GENERATION_MASK = 0xFFFF
+
+    def __init__(self):
+        self._generations: list[int] = [0]  # current generation of each index; index 0 is reserved
+        self._free: list[int] = []  # indices of released ids, reused first
+
+    def allocate(self) -> int:
+        """:return: a new entity id"""
+        if self._free:
+            index = self._free.pop()
+        else:
+            index = len(self._generations)
+            if index > self.INDEX_MASK:
+                raise RuntimeError("Too many entities")
+            self._generations.append(0)
+        return self._generations[index] << self.INDEX_BITS | index
+
+    def release(self, entity_id: int):
+        """Release the id of a removed entity, so its index can be reused (with the next generation)."""
+        index = entity_id & self.INDEX_MASK
+        if self._generations[index] != entity_id >> self.INDEX_BITS:
+            return  # already released
+        self._generations[index] = (self._generations[index] + 1) & self.GENERATION_MASK
+        self._free.append(index)
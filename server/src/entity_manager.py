@@ -1,7 +1,6 @@
 """
 Spawn/remove entities based on player count.
 """
-import secrets
 from random import randint
 from time import time
 
@@ -9,8 +8,7 @@ from pygame import Vector2
 
 from common.src.entities import EntityType
 from common.src.map.tile import Tile
-from common.src.packets import EntitySpawnPacket, EntityHealthPacket, EntityMovePacket
-from entities import ServerEntity
+from server_entities import ServerEntity
 from mechanics import Mechanics
 
 
@@ -56,14 +54,15 @@ class EntityManager(Mechanics):
         else:
             return 0
 
-    def tick(self, _, __):
+    def tick(self):
         """
         Called every tick. Handles entity spawning/removing and movement.
         """
         # maybe spawn/remove entities
         if len(self.server.clients) == 0:
             # remove all entities when all players have left
-            self.server.entities.clear()
+            for entity in list(self.server.entities):
+                self.server.remove_entity(entity)
         else:
             # maybe move entities
             if time() - self.last_move_time >= self.ENTITY_MOVE_INTERVAL:
@@ -87,55 +86,36 @@ class EntityManager(Mechanics):
                         direction = Vector2(self.get_sign(direction.x), self.get_sign(direction.y))
                         new_position = entity.position + direction
                         if not Tile.from_coords(self.server, new_position).is_solid:
+                            # the new position (and health) reaches the clients with the next snapshot
                             entity.position = new_position
-                            # send entity move packet to all clients
-                            packet = EntityMovePacket(entity.uuid, entity.position)
-                            self.server.send_packet_to_all(packet)
                             if nearest_player.position == new_position:
                                 print("Entity hit player!")
                                 nearest_player.health -= 10
-                                packet = EntityHealthPacket(nearest_player.uuid, nearest_player.health)
-                                self.server.send_packet_to_all(packet)
                                 # death?
                                 if nearest_player.health <= 0:
                                     # when the player dies, we reset their health and position
                                     print("Player died!")
                                     nearest_player.health = 50
                                     nearest_player.position = Vector2(1, 2)
-                                    # send health and position packets to all clients
-                                    packet = EntityHealthPacket(nearest_player.uuid, nearest_player.health)
-                                    self.server.send_packet_to_all(packet)
-                                    packet = EntityMovePacket(nearest_player.uuid, nearest_player.position)
-                                    self.server.send_packet_to_all(packet)
 
             # difficulty scales with player count
             difficulty = len(self.server.clients)
             if time() - self.last_spawn_time >= self.ENTITY_SPAWN_INTERVAL:
                 self.last_spawn_time = time()
-                uuid = secrets.token_hex(16)
+                entity_id = self.server.entity_ids.allocate()
                 random_spawn = self._get_random_entity_spawn()
                 # Spawn a random hostile entity
                 entity_type = EntityType.GOBLIN if randint(0, 1) == 1 else EntityType.SKELETON
-                new_entity = ServerEntity(uuid, entity_type, random_spawn, 10 + difficulty * 10)
-                self.server.entities.append(new_entity)
-                # Send spawn packet to all clients
-                spawn_packet = EntitySpawnPacket(uuid, new_entity.entity_type.value,
-                                                 (new_entity.position.x, new_entity.position.y),
-                                                 new_entity.health)
-                print("Spawned entity: ", uuid, "with health", new_entity.health)
-                self.server.send_packet_to_all(spawn_packet)
+                new_entity = ServerEntity(entity_id, entity_type, random_spawn, 10 + difficulty * 10)
+                self.server.add_entity(new_entity)  # clients nearby get a spawn packet (see InterestManager)
+                print("Spawned entity: ", entity_id, "with health", new_entity.health)
 
             if time() - self.last_heart_spawn_time >= self.HEART_SPAWN_INTERVAL:
                 self.last_heart_spawn_time = time()
-                uuid = secrets.token_hex(16)
+                entity_id = self.server.entity_ids.allocate()
                 random_spawn = self._get_random_entity_spawn()
                 # Spawn a floating heart
-                new_entity = ServerEntity(uuid, EntityType.HEART, random_spawn, 10)
-                self.server.entities.append(new_entity)
-                # Send spawn packet to all clients
-                spawn_packet = EntitySpawnPacket(uuid, new_entity.entity_type.value,
-                                                 (new_entity.position.x, new_entity.position.y),
-                                                 new_entity.health)
-                print("Spawned heart entity: ", uuid, "with health", new_entity.health)
-                self.server.send_packet_to_all(spawn_packet)
+                new_entity = ServerEntity(entity_id, EntityType.HEART, random_spawn, 10)
+                self.server.add_entity(new_entity)  # clients nearby get a spawn packet (see InterestManager)
+                print("Spawned heart entity: ", entity_id, "with health", new_entity.health)
 
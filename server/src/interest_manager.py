@@ -0,0 +1,81 @@
+"""
+Area of interest: every client only knows the entities near its player.
+"""
+from time import time
+
+from pygame import Vector2
+
+from common.src.packets import EntityRemovePacket, EntitySpawnPacket, JoinSnapshotPacket, PlayerSpawnPacket
+from common.src.snapshots import EntityState, WorldEntity, encode_world
+from server_entities import ServerPlayer, ServerSpectator
+from mechanics import Mechanics
+
+
+class InterestManager(Mechanics):
+    """
+    Decides which entities each client knows about. An entity enters the area of interest of a client when it is
+    within the interest radius of the client's player, and leaves it when it is farther away or removed from the
+    server. Entering sends the client a spawn packet, leaving a remove packet; the entity snapshots only contain the
+    entities the client knows about (see SnapshotManager). So the traffic per client depends on the number of entities
+    around its player, not on the number of entities in the world.
+
+    A client that just joined gets all entities in its area of interest at once, with a JoinSnapshotPacket.
+    Spectators (see ServerSpectator) watch the whole world, so all entities are in their area of interest.
+
+    All spawn and remove packets are sent here; other mechanics just add entities to or remove them from the server.
+    """
+    UPDATE_INTERVAL = 0.05  # update the areas of interest 20 times per second, like the snapshots
+    DEFAULT_RADIUS = 16  # in tiles; a bit more than half the width of the client's camera view
+    JOIN_SNAPSHOT_CHUNK_SIZE = 1024  # maximum bytes of the world snapshot per JoinSnapshotPacket
+
+    def __init__(self, server, radius: float = DEFAULT_RADIUS):
+        super().__init__(server)
+        self.radius = radius
+        self.last_update_time = 0
+
+    @staticmethod
+    def _spawn_packet(entity):
+        """:return: the packet that spawns the entity on a client"""
+        # a copy of the position, as the packet is passed on as it is to a loopback client (see Server.send_packet())
+        if isinstance(entity, ServerPlayer):
+            return PlayerSpawnPacket(entity.name, entity.entity_id, Vector2(entity.position), entity.health)
+        return EntitySpawnPacket(entity.entity_id, entity.entity_type.value, Vector2(entity.position), entity.health)
+
+    def _send_join_snapshot(self, client, entities: list):
+        """Send the entities (and their state) to a client that just joined, split into as few packets as possible."""
+        data = encode_world([
+            WorldEntity(entity.entity_id, entity.entity_type.value, entity.name if isinstance(entity, ServerPlayer) else "",
+                        EntityState(int(entity.position.x), int(entity.position.y), entity.health,
+                                    entity.direction.value, entity.attacking))
+            for entity in entities
+        ])
+        size = self.JOIN_SNAPSHOT_CHUNK_SIZE
+        count = (len(data) + size - 1) // size
+        for index in range(count):
+            self.server.send_packet(JoinSnapshotPacket(index, count, data[index * size:(index + 1) * size]),
+                                    client.addr)
+
+    def tick(self):
+        if time() - self.last_update_time < self.UPDATE_INTERVAL:
+            return
+        self.last_update_time = time()
+
+        radius_squared = self.radius ** 2
+        entities = {entity.entity_id: entity for entity in self.server.entities}
+        for client in self.server.viewers:
+            if isinstance(client, ServerSpectator):
+                visible = set(entities)
+            else:
+                # the client's own player is always in its area of interest (distance 0), so it is spawned, too
+                visible = {entity_id for entity_id, entity in entities.items()
+                           if (entity.position - client.position).length_squared() <= radius_squared}
+            if not client.joined:
+                self._send_join_snapshot(client, [entities[entity_id] for entity_id in visible])
+                client.known_entities = visible
+                client.joined = True
+                continue
+            for entity_id in visible - client.known_entities:
+                self.server.send_packet(self._spawn_packet(entities[entity_id]), client.addr)
+            for entity_id in client.known_entities - visible:
+                self.server.send_packet(EntityRemovePacket(entity_id), client.addr)
+            client.known_entities = visible
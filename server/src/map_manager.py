@@ -1,6 +1,7 @@
 import os
+import random
 
-import wfc
+from common.src.map.generation import MapSeed, generate_map
 from common.src.map.map import Map
 
 # When using pyinstaller, the data folder is in the root location; otherwise it's in server/src/data
@@ -45,18 +46,13 @@ class MapManager:
         return maps
 
     @staticmethod
-    def generate_map(size: int = 20) -> Map:
+    def generate_map(size: int = 20, seed: int | None = None) -> Map:
         """
-        Method to generate a map using our wfc (wave function collapse) utilities. As wfc does not make that much sense
-        for our project, we will probably use our own (simpler) method in the future.
+        Method to generate a map using the shared map generation (see common/src/map/generation.py).
         :param size: size of basic platform
+        :param seed: seed for the generation; a random seed is used if None
         :return: the generated Map instance
         """
-        # generate basic platform
-        gen_map = t = [["floor_clear"] * size for i in range(size)]
-
-        # generate structures with wfc
-        gen_map = wfc.fill_walls(gen_map, size)
-        wfc.wfc_fill(gen_map, size)
-
-        return Map("generated", gen_map)
+        if seed is None:
+            seed = random.getrandbits(32)
+        return generate_map(MapSeed(seed, size))
@@ -1,7 +1,5 @@
 from abc import abstractmethod
 
-from common.src.packets import Packet
-
 
 class Mechanics:
     """
@@ -9,16 +7,18 @@ class Mechanics:
 
     This class is used to split up the server main loop code into multiple classes to
     improve the readability and maintainability of the code.
+
+    Mechanics that want to handle packets register their handlers for specific packet types on the server's packet
+    router (see common/src/router.py) in their constructor, so they are only called for packets they care about.
+    Handlers are called with the packet and the network address of the client (address, port).
     """
     def __init__(self, server):
         self.server = server
 
     @abstractmethod
-    def tick(self, packet: Packet | None, addr: tuple | None):
+    def tick(self):
         """
-        Called every tick by the server.
-
-        :param packet: The packet sent by the client or None if no packet was sent.
-        :param addr: The network address of the client (address, port) or None if packet is None.
+        Called every tick by the server (see server_loop.py for how often), after the packets received since the last
+        tick were dispatched to the handlers.
         """
         pass
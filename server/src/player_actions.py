@@ -13,11 +13,12 @@ from mechanics import Mechanics
 class PlayerActions(Mechanics):
     def __init__(self, server):
         super().__init__(server)
+        server.router.register(ChangeInputPacket, self.on_change_input)
 
     # players can only attack or move every 0.5 seconds (hostile entities can move every 1.5 seconds)
     ACTION_INTERVAL = 0.5
 
-    def tick(self, packet, client_addr):
+    def tick(self):
         # maybe move clients
         for user in self.server.clients:
             if time() - user.last_move_time >= self.ACTION_INTERVAL:
@@ -35,18 +36,15 @@ class PlayerActions(Mechanics):
                             continue
                         # damage entities on the attacked tile
                         for entity in self.server.entities:
-                            from entities import ServerPlayer
+                            from server_entities import ServerPlayer
                             if isinstance(entity, ServerPlayer):
                                 continue  # no friendly fire
                             if entity.position == attacked_tile:
-                                print("Attacked entity: ", entity.uuid)
-                                entity.health -= 10
-                                # update entity health on the clients
-                                self.server.send_packet_to_all(EntityHealthPacket(entity.uuid, entity.health))
+                                print("Attacked entity: ", entity.entity_id)
+                                entity.health -= 10  # the clients get the new health with the next snapshot
                                 if entity.health <= 0:
-                                    # entity died; remove it on the server and clients
-                                    self.server.entities.remove(entity)
-                                    self.server.send_packet_to_all(EntityRemovePacket(entity.uuid))
+                                    # entity died; remove it on the server (and clients, see InterestManager)
+                                    self.server.remove_entity(entity)
                     except IndexError:
                         # no tile found
                         continue
@@ -65,36 +63,39 @@ class PlayerActions(Mechanics):
                         if tile.is_solid:
                             # tile is solid
                             continue
-                    user.position = new_position  # set new pos on server
-                    # send new position to clients
-                    move_packet = EntityMovePacket(user.uuid, (user.position.x, user.position.y))
-                    self.server.send_packet_to_all(move_packet)
+                    user.position = new_position  # set new pos on server; clients get it with the next snapshot
 
             # check collision with hearts
             for heart in self.server.entities:
                 if heart.entity_type == EntityType.HEART:
                     if user.position == heart.position:
-                        # player collided with heart; remove it on the server and clients
-                        self.server.entities.remove(heart)
-                        self.server.send_packet_to_all(EntityRemovePacket(heart.uuid))
-                        # update player health on the server and clients
+                        # player collided with heart; remove it on the server (and clients, see InterestManager)
+                        self.server.remove_entity(heart)
+                        # update player health on the server; clients get it with the next snapshot
                         user.health = min(user.health + 10, user.max_health)
-                        self.server.send_packet_to_all(EntityHealthPacket(user.uuid, user.health))
 
+    def on_change_input(self, packet: ChangeInputPacket, client_addr):
+        """
+        Handle incoming packets from clients affecting player movement. The player has changed an input variable
+        like movement direction or whether the player wants to attack.
 
-        # handle incoming packets from clients affecting player movement (ChangeInputPacket)
-        if isinstance(packet, ChangeInputPacket):
-            # player has changed an input variable like movement direction or whether the player wants to attack
-            user = next((client for client in self.server.clients if client.token == packet.token), None)
-            user.direction = Dir2(packet.direction)
+        The packet contains the last few inputs of the client; the inputs we already applied (by their sequence
+        number) are skipped, the new ones are applied oldest first. Packets that arrive late only contain old inputs
+        and are ignored completely.
+        """
+        user = self.server.get_client(client_addr)
+        if user is None:
+            return  # not the session of a player (see PlayerPacket)
+        new_inputs = min(packet.sequence - user.input_sequence, len(packet.directions), len(packet.attacking))
+        if new_inputs <= 0:
+            return  # duplicate or outdated
+        user.input_sequence = packet.sequence
+        for index in reversed(range(new_inputs)):
+            try:
+                user.direction = Dir2(packet.directions[index])
+            except ValueError:
+                user.direction = Dir2.ZERO  # invalid direction
             if user.direction != Dir2.ZERO:
                 user.last_direction = user.direction
-            user.attacking = packet.attacking
-            # update direction of player for other clients (purely visual)
-            direction_packet = EntityDirectionPacket(user.uuid, user.direction.value)
-            attack_packet = EntityAttackPacket(user.uuid, user.attacking)
-            for client in self.server.clients:
-                # only send direction packet to other clients; the player that changed direction knows it
-                if client.addr != client_addr:
-                    self.server.send_packet(direction_packet, client.addr)
-                    self.server.send_packet(attack_packet, client.addr)
+            user.attacking = packet.attacking[index]
+        # the other clients get the new direction/attacking state (purely visual) with the next snapshot
@@ -6,8 +6,11 @@ from time import time
 
 from pygame import Vector2
 
+from common.src import networking
 from common.src.packets import *
-from entities import ServerPlayer
+from common.src.snapshots import hash_entity_ids
+from connection_stats import ConnectionStats
+from server_entities import ServerPlayer, ServerSpectator
 from mechanics import Mechanics
 
 
@@ -17,79 +20,202 @@ class PlayerManager(Mechanics):
     """
     def __init__(self, server):
         super().__init__(server)
-        self.last_pong = time()
+        server.router.register(HelloPacket, self.on_hello)
+        server.router.register(DisconnectPacket, self.on_disconnect)
+        server.router.register(PingPacket, self.on_ping)
+        server.router.register(MapChunkRequestPacket, self.on_map_chunk_request)
 
     PING_TIMEOUT = 5  # timeout clients after not pinging for 5 seconds
-    PONG_INTERVAL = 1  # send a pong packet every second
+    RESUME_GRACE_PERIOD = 30  # seconds a client that timed out can resume its session and get its player back
+    RESUME_TOKEN_SIZE = 16
 
-    def tick(self, packet, client_addr):
-        # maybe pong clients
-        if self.last_pong + self.PONG_INTERVAL < time():
-            self.server.send_packet_to_all(PongPacket())
-            print(f"Ponged {len(self.server.clients)} clients.")
-            self.last_pong = time()
+    def tick(self):
+        for client in self.server.viewers:
+            # maybe pong the client; the pong is a probe for measuring its connection (see ConnectionStats)
+            if client.connection.probe_due():
+                self.server.send_packet(PongPacket(client.connection.start_probe()), client.addr)
 
-        # check pings
-        for client in self.server.clients:
+            # check pings
             if client.last_ping + self.PING_TIMEOUT < time():
-                print(f"Client {client.name} timed out.")
-                self.server.entities.remove(client)
-                player_remove_packet = EntityRemovePacket(client.uuid)
-                self.server.send_packet_to_all(player_remove_packet)
-
-        # handle packets
-        if isinstance(packet, HelloPacket):
-            if packet.name in [client.name for client in self.server.clients]:
-                print(f"Client with name {packet.name} already exists.")
-                return
+                if isinstance(client, ServerSpectator):
+                    print(f"Spectator {client.name} timed out ({client.connection}).")
+                    self.server.remove_spectator(client)  # it just logs in again
+                    continue
+                print(f"Client {client.name} timed out ({client.connection}). Keeping its player for a resume.")
+                self.server.suspend_client(client)  # the other clients remove it (see InterestManager)
+
+        for client in list(self.server.suspended_clients.values()):
+            if client.suspended_since + self.RESUME_GRACE_PERIOD < time():
+                print(f"Session of client {client.name} expired.")
+                self.server.remove_client(client)
+
+    def send_map(self, client_addr, cached_hashes=(), generator_versions=()):
+        """
+        Announce the current map to the client and send all of its chunks.
+        :param cached_hashes: hashes of the maps the client has cached; the chunks are skipped if the map is one of them
+        :param generator_versions: map generator versions the client supports; the chunks are skipped if the map was
+        generated with one of them
+        """
+        transfer = self.server.map_transfer
+        seed = transfer.map.seed
+        map_packet = MapChangePacket(transfer.map.name, transfer.map_hash, len(transfer.chunks))
+        if seed:
+            map_packet.seed, map_packet.size, map_packet.generator_version = seed
+        self.server.send_packet(map_packet, client_addr)
+        if transfer.map_hash in cached_hashes or (seed and seed.version in generator_versions):
+            # the client generates the map or loads it from its cache (and requests the chunks if that fails)
+            return
+        for index, chunk in enumerate(transfer.chunks):
+            self.server.send_packet(MapChunkPacket(transfer.map_hash, index, chunk), client_addr)
+
+    def _new_session(self) -> tuple[int, bytes]:
+        """:return: the id and key of a new session"""
+        session_id = 0
+        while session_id == 0 or session_id in self.server.sessions:
+            session_id = secrets.randbits(32)
+        return session_id, secrets.token_bytes(networking.SESSION_KEY_SIZE)
+
+    def _send_hello_reply(self, packet: HelloPacket, client_addr, session_id: int, session_key: bytes,
+                          player_id: int = 0, resume_token: bytes = b"", resumed: bool = False):
+        """Accept the login: negotiate the codec and compression, and send the client its session."""
+        # use the first codec the client prefers that we support; json is always supported as a fallback
+        codec = next((codec for codec in packet.codecs if codec in self.server.codecs), networking.CODEC_JSON)
+        # same for the compression; without a common one, packets are sent uncompressed
+        compression = next((name for name in packet.compressions if name in self.server.compressions), "")
+        reply_packet = HelloReplyPacket(session_id, session_key, player_id, codec, compression, resume_token, resumed)
+        self.server.peer_codecs[client_addr] = codec
+        if compression:
+            self.server.compressed_peers.add(client_addr)
+        self.server.send_packet(reply_packet, client_addr)
+
+    def on_hello(self, packet: HelloPacket, client_addr):
+        """Log in a new client: create its player (unless it is a spectator) and send it the current game state."""
+        if not isinstance(packet.name, str) or not 0 < len(packet.name) <= MAX_NAME_LENGTH:
+            print(f"Client at {client_addr} can't log in with an invalid name.")
+            return
+        if not self.server.accepts_login(packet):
+            print(f"Client with name {packet.name} can't log in" + (" as spectator." if packet.spectator else "."))
+            return
+        old_spectator = self.server.spectators.get(client_addr)
+        if old_spectator:
+            # the spectator logs in again without having disconnected; its old session is replaced
+            self.server.remove_spectator(old_spectator)
+        if packet.spectator:
+            self._login_spectator(packet, client_addr)
+            return
+        resumed = self._find_resumable(packet)
+        old_client = self.server.get_client(client_addr)
+        if old_client and old_client is not resumed:
+            # the client logs in again without having disconnected; its old session is replaced
+            self.server.remove_client(old_client)
+        if resumed and resumed.suspended_since is None:
+            # the server didn't notice that the connection broke off yet (e.g. the client's address changed)
+            self.server.suspend_client(resumed)
+        if not resumed and packet.name in [client.name for client in self.server.clients]:
+            print(f"Client with name {packet.name} already exists.")
+            return
+        if not resumed and packet.name in [client.name for client in self.server.suspended_clients.values()]:
+            # only the resume token takes over a suspended session; the name is in use until the session expires
+            print(f"Client with name {packet.name} has a suspended session.")
+            return
+        self.server.forget_peer(client_addr)  # a new session starts; e.g. with fresh reliable sequence numbers
+        session_id, session_key = self._new_session()
+        if resumed:
+            print(f"Client with name {packet.name} resumed its session.")
+            user = resumed
+            user.addr, user.session_id, user.session_key = client_addr, session_id, session_key
+            self._restore_client_state(user, packet)
+            self.server.resume_client(user)
+        else:
             print(f"Client with name {packet.name} connected.")
-            token = secrets.token_hex(16)
-            player_uuid = secrets.token_hex(16)
-            user = ServerPlayer(packet.name, client_addr, player_uuid, token, position=Vector2(1, 2))
-            self.server.entities.append(user)
-            reply_packet = HelloReplyPacket(token, player_uuid)
-            self.server.send_packet(reply_packet, client_addr)
-
-            # set map for this client
-            map_packet = MapChangePacket(self.server.current_map.name, self.server.current_map.tiles)
-            self.server.send_packet(map_packet, client_addr)
-
-            # set own position for this client
-            move_packet = EntityMovePacket(player_uuid, (user.position.x, user.position.y))
-            self.server.send_packet(move_packet, client_addr)
-
-            # set own health for this client
-            health_packet = EntityHealthPacket(player_uuid, user.health)
-            self.server.send_packet(health_packet, client_addr)
-
-            # spawn other entities for this client
-            for entity in self.server.entities:
-                if entity.uuid != player_uuid:
-                    entity_spawn_packet = EntitySpawnPacket(entity.uuid, entity.entity_type.value,
-                                                            (entity.position.x, entity.position.y),
-                                                            entity.health)
-                    if isinstance(entity, ServerPlayer):
-                        # entity is player; send player spawn packet
-                        entity_spawn_packet = PlayerSpawnPacket(entity.name, entity.uuid,
-                                                                (entity.position.x, entity.position.y),
-                                                                entity.health)
-                    self.server.send_packet(entity_spawn_packet, client_addr)
-
-            # spawn player for all clients
-            player_spawn_packet = PlayerSpawnPacket(user.name, player_uuid, (user.position.x, user.position.y),
-                                                    user.health)
-            self.server.send_packet_to_all(player_spawn_packet)
-
-        elif isinstance(packet, DisconnectPacket):
-            print(f"Received disconnect packet from {client_addr}")
-            client = next((client for client in self.server.clients if client.token == packet.token), None)
-            self.server.entities.remove(client)
-            player_remove_packet = EntityRemovePacket(client.uuid)
-            self.server.send_packet_to_all(player_remove_packet)
-
-        elif isinstance(packet, PingPacket):
-            print(f"Received ping from {client_addr}")
-            for other_user in self.server.clients:
-                if other_user.addr == client_addr:
-                    other_user.last_ping = time()
-                    break
+            player_id = self.server.entity_ids.allocate()
+            user = ServerPlayer(packet.name, client_addr, player_id, session_id, session_key,
+                                secrets.token_bytes(self.RESUME_TOKEN_SIZE), position=Vector2(1, 2))
+            self.server.add_client(user)
+        self._send_hello_reply(packet, client_addr, session_id, session_key, user.entity_id, user.resume_token,
+                               resumed is not None)
+
+        # set map for this client, unless it resumed its session and still has the map
+        if not resumed or packet.resume_map_hash != self.server.map_transfer.map_hash:
+            self.send_map(client_addr, packet.map_hashes, packet.generator_versions)
+
+        # our player and the entities around it are spawned for this client, and our player for the clients
+        # around it, by the InterestManager; their state is sent with the entity snapshots (see SnapshotManager)
+
+    def _login_spectator(self, packet: HelloPacket, client_addr):
+        """Log in a spectator: it gets the current game state, but no player."""
+        old_client = self.server.get_client(client_addr)
+        if old_client:
+            # a client watches the game now instead of playing
+            self.server.remove_client(old_client)
+        print(f"Spectator with name {packet.name} connected.")
+        self.server.forget_peer(client_addr)
+        spectator = ServerSpectator(packet.name, client_addr, *self._new_session(), packet.map_hashes,
+                                    packet.generator_versions)
+        self.server.add_spectator(spectator)
+        self._send_hello_reply(packet, client_addr, spectator.session_id, spectator.session_key)
+        self.send_map(client_addr, spectator.map_hashes, spectator.generator_versions)
+        # all entities are spawned for the spectator by the InterestManager
+
+    def _find_resumable(self, packet: HelloPacket) -> ServerPlayer | None:
+        """:return: the player of the session the client wants to resume, or None if there is no such session"""
+        if not packet.resume_token:
+            return None
+        client = self.server.suspended_clients.get(packet.resume_token)
+        if client is None:
+            # maybe the server didn't notice that the connection broke off yet
+            client = next((client for client in self.server.clients
+                           if secrets.compare_digest(client.resume_token, packet.resume_token)), None)
+        return client if client and client.name == packet.name else None
+
+    @staticmethod
+    def _restore_client_state(client: ServerPlayer, packet: HelloPacket):
+        """
+        Continue from the state the resuming client still has: the InterestManager only spawns and removes the
+        entities that changed since, and the SnapshotManager sends a delta against the client's last snapshot.
+        """
+        client.last_ping = time()
+        client.connection = ConnectionStats()  # probably a different path
+        client.input_sequence = 0
+        client.tiles_synced = False  # the client might have missed tile changes; it gets all of them again
+        known_entities = client.known_entities | {client.entity_id}
+        if hash_entity_ids(known_entities) == packet.resume_entities_hash:
+            # the client has the entities we sent it, so the InterestManager doesn't send a join snapshot
+            client.known_entities = known_entities
+            client.joined = True
+            client.acked_snapshot = packet.resume_snapshot if packet.resume_snapshot in client.sent_snapshots else 0
+            client.sent_snapshots = {tick: snapshot for tick, snapshot in client.sent_snapshots.items()
+                                     if tick == client.acked_snapshot}
+        else:
+            # spawns or removals were lost when the connection broke off; the client gets all entities again
+            client.known_entities = set()
+            client.joined = False
+            client.acked_snapshot = 0
+            client.sent_snapshots = {}
+
+    def on_disconnect(self, packet: DisconnectPacket, client_addr):
+        """Remove the player of a client (or the spectator) that wants to quit."""
+        client = self.server.get_viewer(client_addr)
+        print(f"Received disconnect packet from {client_addr}" + (f" ({client.connection})" if client else ""))
+        if isinstance(client, ServerSpectator):
+            self.server.remove_spectator(client)
+            return
+        self.server.remove_client(client)  # the other clients remove it, too (see InterestManager)
+
+    def on_ping(self, packet: PingPacket, client_addr):
+        """Remember that the client is still alive, and measure its connection if the ping echoes a pong."""
+        client = self.server.get_viewer(client_addr)
+        if client:
+            client.last_ping = time()
+            if packet.sequence:
+                client.connection.on_echo(packet.sequence)
+
+    def on_map_chunk_request(self, packet: MapChunkRequestPacket, client_addr):
+        """Send the chunks of the current map that did not arrive at the client again."""
+        transfer = self.server.map_transfer
+        if packet.map_hash != transfer.map_hash:
+            return  # the map changed in the meantime; the client got a MapChangePacket for the new one
+        print(f"Resending {len(packet.indices)} map chunks to {client_addr}")
+        for index in packet.indices:
+            if 0 <= index < len(transfer.chunks):
+                self.server.send_packet(MapChunkPacket(transfer.map_hash, index, transfer.chunks[index]), client_addr)
@@ -0,0 +1,372 @@
+"""
+Relay (entrypoint) for spectators: passes the game of one game server on to many spectators.
+
+Usage: python server/src/relay.py <game server host>[:<port>] [--port <port>] [--json] [--no-compression] [--mtu <bytes>]
+[--tick-rate <ticks per second>] [--debug]
+
+Spectators log in to the relay instead of the game server (see HelloPacket.spectator). The relay logs in to the game
+server as a single spectator, so the game server sends the game once, however many people watch.
+"""
+import os
+import sys
+from time import time
+
+sys.path.insert(1, os.path.join(sys.path[0], '..', '..'))
+
+from socket import *
+
+from pygame import Vector2
+
+from common.src import compression, networking
+from common.src.direction import Dir2
+from common.src.entities import EntityType
+from common.src.map.generation import GENERATOR_VERSIONS, MapSeed, generate_map
+from common.src.map.map import Map
+from common.src.map.transfer import MapDownload, MapTransfer, encode_map, hash_map_data
+from common.src.packets import *
+from common.src.router import PacketRouter
+from common.src.snapshots import EntityState, apply_delta, decode_world
+from interest_manager import InterestManager
+from mechanics import Mechanics
+from player_manager import PlayerManager
+from server import SERVER_ADDRESS, Server
+from server_entities import ServerEntity, ServerPlayer
+import server_loop
+from snapshot_manager import SnapshotManager
+from tile_manager import TileManager
+
+RELAY_ADDRESS = ('0.0.0.0', 5858)
+
+
+class RelayUpstream(Mechanics):
+    """
+    The relay's connection to the game server. Logs in as a spectator and mirrors the game the game server sends into
+    the relay's world: the entities with their state, the map and its tile changes. The other mechanics of the relay
+    pass the world on to the relay's spectators, just like a game server passes its world on to its clients.
+
+    If the game server doesn't pong for PONG_TIMEOUT seconds, we log in again and start over.
+    """
+    PING_INTERVAL = 1  # seconds between our pings; the echoed pongs count as pings, too
+    PONG_TIMEOUT = 5  # seconds without a pong after which we assume that the connection to the game server is lost
+    HELLO_RETRY_INTERVAL = 1  # seconds between the HelloPackets while we are not logged in
+
+    def __init__(self, server, address: tuple):
+        super().__init__(server)
+        self.address = address  # address of the game server
+        self.socket = socket(AF_INET, SOCK_DGRAM)
+        self.socket.connect(address)
+        self.socket.setblocking(False)
+        # session with the game server, like the session of a client (see client_networking.py)
+        self.session_id = 0  # 0 if we are not logged in
+        self.session_key: bytes | None = None
+        self.codec = networking.CODEC_JSON
+        self.compressed = False
+        self.channel = networking.ReliableChannel()
+        self.last_hello = 0  # time we sent the last HelloPacket
+        self.last_ping = 0
+        self.last_pong = 0  # time of the last pong of the game server
+        # router dispatching the packets of the game server to our handlers; the server's router is for spectators
+        self.router = PacketRouter()
+        self._register_handlers()
+        # the mirrored game
+        self.ready = False  # whether we have the map of the game; spectators can't log in before
+        self.entities: dict[int, ServerEntity] = {}  # the entities of the game server by id; in server.entities, too
+        self.snapshot_tick = 0  # tick of the newest entity snapshot we applied
+        self.snapshots: dict[int, dict[int, EntityState]] = {}  # entity snapshots the game server may use as baseline
+        self.join_snapshot_parts: list[bytes] = []
+        self.map_download: MapDownload | None = None  # download of the game server's map, while it is not complete
+        self.map_seed: MapSeed | None = None  # seed of the map we download; passed on to the spectators
+        self.pending_tile_changes: list[tuple[int, int, str]] = []  # tile changes received during the map download
+
+    def _register_handlers(self):
+        self.router.register(HelloReplyPacket, self._on_hello_reply)
+        self.router.register(PongPacket, self._on_pong)
+        self.router.register(PlayerSpawnPacket, self._on_player_spawn)
+        self.router.register(EntitySpawnPacket, self._on_entity_spawn)
+        self.router.register(JoinSnapshotPacket, self._on_join_snapshot)
+        self.router.register(EntitySnapshotPacket, self._on_entity_snapshot)
+        self.router.register(EntityRemovePacket, self._on_entity_remove)
+        self.router.register(MapChangePacket, self._on_map_change)
+        self.router.register(MapChunkPacket, self._on_map_chunk)
+        self.router.register(TileChangePacket, self._on_tile_change)
+
+    def _send(self, packet: Packet):
+        """Send a packet to the game server; packets that need a session are dropped while we are not logged in."""
+        if isinstance(packet, AuthorizedPacket) and not self.session_id:
+            return
+        frame_buffer = networking.FrameBuffer(self.channel)
+        frame_buffer.add(networking.encode(packet, self.codec, self.compressed).data, packet.reliable)
+        self._send_frames(frame_buffer)
+
+    def _send_frames(self, frame_buffer: networking.FrameBuffer):
+        for frame in frame_buffer.flush():
+            if self.session_id:
+                frame = networking.sign_datagram(frame, self.session_id, self.session_key)
+            try:
+                self.socket.send(frame)
+            except OSError:
+                pass  # e.g. the game server isn't running (yet); we log in again later
+
+    def _send_hello(self):
+        """Log in to the game server as a spectator, with a new session."""
+        self.session_id = 0
+        self.session_key = None
+        self.codec = networking.CODEC_JSON
+        self.compressed = False
+        self.channel = networking.ReliableChannel()
+        self.map_download = None
+        self.pending_tile_changes.clear()
+        self.join_snapshot_parts.clear()
+        # we don't cache maps, but we can generate them
+        self._send(HelloPacket("relay", list(networking.CODECS), list(compression.COMPRESSIONS), [],
+                               list(GENERATOR_VERSIONS), spectator=True))
+        self.last_hello = time()
+
+    def tick(self):
+        now = time()
+        if now - self.last_pong > self.PONG_TIMEOUT:
+            if now - self.last_hello > self.HELLO_RETRY_INTERVAL:
+                if self.session_id:
+                    print("Connection to the game server lost. Logging in again...")
+                self._send_hello()
+        elif now - self.last_ping > self.PING_INTERVAL:
+            self._send(PingPacket())
+            self.last_ping = now
+
+        while True:
+            try:
+                data = self.socket.recv(65536)
+            except (BlockingIOError, ConnectionError):
+                break  # no more datagrams; or the game server isn't running (yet)
+            for packet_data in networking.split_datagram(data, self.channel):
+                packet = networking.deserialize(packet_data)
+                if isinstance(packet, Packet):
+                    self.router.dispatch(packet)
+
+        if self.map_download and self.map_download.is_stalled():
+            self._send(MapChunkRequestPacket(self.map_download.map_hash, self.map_download.missing()))
+            self.map_download.last_progress = now
+        # acknowledge received reliable packets and resend ours if necessary
+        if self.channel.ack_pending or self.channel.unacked:
+            self._send_frames(networking.FrameBuffer(self.channel))
+
+    def _on_hello_reply(self, packet: HelloReplyPacket):
+        if not packet.session_id:
+            print("The game server rejected our login.")
+            return
+        print(f"Logged in to the game server {self.address} as spectator.")
+        self.session_id = packet.session_id
+        self.session_key = packet.session_key
+        self.codec = packet.codec
+        self.compressed = packet.compression in compression.COMPRESSIONS
+        self.last_pong = time()
+        # the game server sends us everything again
+        for entity_id in list(self.entities):
+            self._remove(entity_id)
+        self.snapshots.clear()
+        self.snapshot_tick = 0
+
+    def _on_pong(self, packet: PongPacket):
+        self.last_pong = time()
+        self._send(PingPacket(packet.sequence))  # echo it, so the game server can measure our connection
+        self.last_ping = self.last_pong
+
+    # entities
+
+    def _spawn(self, entity_id: int, entity_type: str, name: str, position: Vector2, health: int):
+        """Add an entity of the game server to our world; the InterestManager spawns it for the spectators."""
+        self._remove(entity_id)
+        if name:
+            # only used for the spawn packets of the player; it has no connection to us
+            entity = ServerPlayer(name, None, entity_id, 0, b"", b"", Vector2(position), health)
+        else:
+            entity = ServerEntity(entity_id, EntityType(entity_type), Vector2(position), health)
+        state = self.snapshots.get(self.snapshot_tick, {}).get(entity_id)
+        if state:
+            # a snapshot containing the entity arrived before its spawn packet
+            self._apply_state(entity, state)
+        self.entities[entity_id] = entity
+        self.server.add_entity(entity)
+
+    def _remove(self, entity_id: int):
+        entity = self.entities.pop(entity_id, None)
+        if entity:
+            # not remove_entity(); the entity id belongs to the game server
+            self.server.entities.remove(entity)
+
+    @staticmethod
+    def _apply_state(entity: ServerEntity, state: EntityState):
+        entity.position = Vector2(state.x, state.y)
+        entity.health = state.health
+        entity.direction = Dir2(state.direction)
+        entity.attacking = state.attacking
+
+    def _on_player_spawn(self, packet: PlayerSpawnPacket):
+        self._spawn(packet.entity_id, EntityType.KNIGHT.value, packet.name, packet.tile_position, packet.health)
+
+    def _on_entity_spawn(self, packet: EntitySpawnPacket):
+        self._spawn(packet.entity_id, packet.entity_type, "", packet.tile_position, packet.health)
+
+    def _on_entity_remove(self, packet: EntityRemovePacket):
+        self._remove(packet.entity_id)
+
+    def _on_join_snapshot(self, packet: JoinSnapshotPacket):
+        if packet.index != len(self.join_snapshot_parts):
+            return  # part of an earlier login
+        self.join_snapshot_parts.append(packet.data)
+        if len(self.join_snapshot_parts) < packet.count:
+            return
+        world = decode_world(b"".join(self.join_snapshot_parts))
+        self.join_snapshot_parts.clear()
+        for entity_id in list(self.entities):
+            self._remove(entity_id)
+        for world_entity in world:
+            state = world_entity.state
+            self._spawn(world_entity.entity_id, world_entity.entity_type, world_entity.name,
+                        Vector2(state.x, state.y), state.health)
+            self._apply_state(self.entities[world_entity.entity_id], state)
+        print(f"Mirrored {len(world)} entities of the game server.")
+
+    def _on_entity_snapshot(self, packet: EntitySnapshotPacket):
+        # see ClientNetworking._on_entity_snapshot(); our SnapshotManager builds new snapshots for the spectators
+        if packet.tick <= self.snapshot_tick:
+            return
+        base = self.snapshots.get(packet.base_tick) if packet.base_tick else {}
+        if base is None:
+            return
+        snapshot, changed = apply_delta(base, packet.delta)
+        self.snapshots = {tick: old for tick, old in self.snapshots.items() if tick >= packet.base_tick}
+        self.snapshots[packet.tick] = snapshot
+        self.snapshot_tick = packet.tick
+        self._send(SnapshotAckPacket(packet.tick))
+        for entity_id in changed:
+            entity = self.entities.get(entity_id)
+            if entity:
+                self._apply_state(entity, snapshot[entity_id])
+
+    # map
+
+    def _on_map_change(self, packet: MapChangePacket):
+        self.map_download = None
+        self.pending_tile_changes.clear()
+        self.map_seed = MapSeed(packet.seed, packet.size, packet.generator_version) \
+            if packet.generator_version else None
+        if packet.generator_version in GENERATOR_VERSIONS:
+            game_map = generate_map(self.map_seed, packet.name)
+            if hash_map_data(encode_map(game_map)) == packet.map_hash:
+                self._set_map(game_map)
+                return
+        # the chunks follow; if the game server expected us to generate the map, we request them when the download
+        # stalls (see tick())
+        self.map_download = MapDownload(packet.name, packet.map_hash, packet.chunk_count)
+
+    def _on_map_chunk(self, packet: MapChunkPacket):
+        if not self.map_download or packet.map_hash != self.map_download.map_hash:
+            return
+        self.map_download.add_chunk(packet.index, packet.data)
+        if self.map_download.complete:
+            game_map = self.map_download.assemble()
+            if game_map:
+                game_map.seed = self.map_seed
+                self.map_download = None
+                self._set_map(game_map)
+
+    def _set_map(self, game_map: Map):
+        """Use the map of the game server, and announce it to our spectators."""
+        print(f"Mirrored map {game_map} of the game server.")
+        # the map as the game server announced it; so the spectators can generate it or load it from their cache, too
+        self.server.current_map = game_map
+        self.server.map_transfer = MapTransfer(game_map)
+        self.server.tile_changes.clear()
+        self.server.tile_manager.changes.clear()
+        for spectator in self.server.spectators.values():
+            self.server.player_manager.send_map(spectator.addr, spectator.map_hashes, spectator.generator_versions)
+            spectator.tiles_synced = False  # they get the tile changes of the new map
+        self.ready = True
+        self._apply_tile_changes(self.pending_tile_changes)
+        self.pending_tile_changes.clear()
+
+    def _on_tile_change(self, packet: TileChangePacket):
+        changes = zip(packet.xs, packet.ys, packet.tiles)
+        if self.map_download:
+            self.pending_tile_changes.extend(changes)
+            return
+        self._apply_tile_changes(changes)
+
+    def _apply_tile_changes(self, changes):
+        """Change the tiles of our map; the TileManager passes the changes on to the spectators."""
+        for x, y, tile in changes:
+            if self.server.current_map.in_bounds(x, y):
+                self.server.set_tile(x, y, tile)
+
+
+class RelayServer(Server):
+    """
+    A server for spectators that shows them the game of another server (see RelayUpstream) instead of running a game
+    itself. It handles the logins, join snapshots, map transfers, snapshot deltas and acknowledgements of its
+    spectators; the game server only has the relay as spectator, so its load doesn't depend on the number of people
+    watching. Clients can't log in with a player, as the relay can't simulate the game.
+    """
+
+    def __init__(self, upstream_address: tuple, address: tuple = RELAY_ADDRESS,
+                 codecs: tuple[str, ...] = networking.CODECS, mtu: int = networking.DEFAULT_MTU,
+                 compressions: tuple[str, ...] = compression.COMPRESSIONS):
+        """
+        :param upstream_address: address of the game server
+        :param address: address the relay's UDP socket is bound to
+        See Server for the other parameters.
+        """
+        self.upstream_address = upstream_address  # needed by _create_mechanics(), which is called by Server
+        super().__init__(codecs, mtu, compressions=compressions, address=address)
+
+    def _create_mechanics(self) -> tuple:
+        self.upstream = RelayUpstream(self, self.upstream_address)
+        self.player_manager = PlayerManager(self)
+        self.tile_manager = TileManager(self)
+        return (
+            self.upstream,  # mirrors the world of the game server
+            self.player_manager,  # handles the logins, pings and timeouts of the spectators
+            self.tile_manager,  # passes the tile changes on to the spectators
+            InterestManager(self),  # spawns/removes the entities on the spectators
+            SnapshotManager(self),  # sends the entity state changes to the spectators; has to be last
+        )
+
+    def is_idle(self) -> bool:
+        return False  # the upstream has to keep up with the game server, even while nobody watches
+
+    def accepts_login(self, packet: HelloPacket) -> bool:
+        # spectators only, and only as soon as there is something to watch
+        return packet.spectator and self.upstream.ready
+
+
+def main():
+    """The relay entry point; see the module docstring for the arguments."""
+    if len(sys.argv) < 2 or sys.argv[1].startswith("--"):
+        print(__doc__)
+        return
+    host, _, port = sys.argv[1].partition(":")
+    upstream_address = (host, int(port) if port else SERVER_ADDRESS[1])
+    debug = "--debug" in sys.argv
+    codecs = (networking.CODEC_JSON,) if "--json" in sys.argv else networking.CODECS
+    compressions = () if "--no-compression" in sys.argv else compression.COMPRESSIONS
+    mtu = int(sys.argv[sys.argv.index("--mtu") + 1]) if "--mtu" in sys.argv else networking.DEFAULT_MTU
+    port = int(sys.argv[sys.argv.index("--port") + 1]) if "--port" in sys.argv else RELAY_ADDRESS[1]
+    tick_rate = float(sys.argv[sys.argv.index("--tick-rate") + 1]) if "--tick-rate" in sys.argv \
+        else server_loop.ServerLoop.TICK_RATE
+
+    print(f"Relaying {upstream_address[0]}:{upstream_address[1]} on port {port}...")
+    try:
+        relay = RelayServer(upstream_address, (RELAY_ADDRESS[0], port), codecs, mtu, compressions)
+    except OSError as e:
+        print("Could not initialize relay. Is it already running?")
+        raise e
+
+    tick_stats = server_loop.run(relay, tick_rate, debug)
+
+    print("Shutting down...")
+    print(f"Ticks: {tick_stats}")
+    print(f"Traffic filter: {relay.traffic_filter}")
+
+
+if __name__ == '__main__':
+    main()
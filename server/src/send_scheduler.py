@@ -0,0 +1,70 @@
+"""
+Outbound packet scheduling of the server: priorities and a bandwidth budget per client.
+"""
+from time import time
+
+from common.src import networking
+
+
+class SendScheduler:
+    """
+    Outbound queue for one client address. The packets sent to the client during a tick are queued, and at the end of
+    the tick (see Server.flush()) as many of them as the bandwidth budget of the client allows are coalesced into
+    frames, in the order of their priority (see Packet.priority) and, within a priority, in the order they were sent.
+
+    The budget is a token bucket: it fills up with the bandwidth of the client (see ConnectionStats.bandwidth), up to
+    BURST_TIME seconds worth of it. Packets are sent while there are tokens left, so a big packet can overdraw the
+    bucket; the next ticks then send less. Packets that don't fit in the budget anymore are not kept in a growing
+    queue: unreliable packets are dropped (e.g. an entity snapshot; the next one contains its changes, too), only
+    reliable packets stay queued for the next tick. Resends of reliable packets and acknowledgements are always sent,
+    but they use up tokens as well.
+    """
+    BURST_TIME = 0.25  # seconds of bandwidth the bucket can hold
+
+    def __init__(self, channel: networking.ReliableChannel, mtu: int = networking.DEFAULT_MTU):
+        self.channel = channel
+        self.mtu = mtu
+        self._queue: list[tuple[int, int, bytes, bool]] = []  # (priority, order, data, reliable) of queued packets
+        self._order = 0  # increasing number, so packets with the same priority keep their order
+        self._tokens = float("inf")  # bytes we may send; filled up in flush(), starting with a full bucket
+        self._last_fill = time()
+        self.dropped = 0  # number of unreliable packets that were dropped because the budget was exhausted
+
+    @property
+    def pending(self) -> bool:
+        """:return: whether there are queued packets, unacknowledged reliable packets or pending acknowledgements"""
+        return bool(self._queue) or bool(self.channel.unacked) or self.channel.ack_pending
+
+    def add(self, data: bytes, priority: int, reliable: bool = False):
+        """Queue a serialized packet for the next flush()."""
+        self._queue.append((priority, self._order, data, reliable))
+        self._order += 1
+
+    def flush(self, bandwidth: float) -> list[bytearray]:
+        """
+        Take the packets that fit in the budget from the queue.
+        :param bandwidth: bytes per second we may send to the client
+        :return: the frames (datagrams) to send, in order
+        """
+        now = time()
+        self._tokens = min(self._tokens + bandwidth * (now - self._last_fill), bandwidth * self.BURST_TIME)
+        self._last_fill = now
+
+        self._queue.sort()
+        frame_buffer = networking.FrameBuffer(self.channel, self.mtu)
+        budget = self._tokens
+        deferred = []
+        for item in self._queue:
+            priority, order, data, reliable = item
+            if budget > 0:
+                frame_buffer.add(data, reliable)
+                budget -= len(data)
+            elif reliable:
+                deferred.append(item)
+            else:
+                self.dropped += 1
+        self._queue = deferred
+
+        frames = frame_buffer.flush()
+        self._tokens -= sum(len(frame) for frame in frames)
+        return frames
@@ -4,39 +4,107 @@ The server logic is divided into the following mechanics:
 - PlayerManager: Handles player connections and disconnections.
 - PlayerActions: Handles player actions (e.g. movement, attacking, etc.).
 - EntityManager: Handles all entities (players and hostile creatures) and their logic.
+- TileManager: Sends the tiles of the map that changed to the clients.
+- InterestManager: Spawns/removes the entities near each client's player on that client.
+- SnapshotManager: Synchronizes the entity state with the clients using delta snapshots.
+
+Besides the clients with a player, spectators can watch the game (see ServerSpectator); usually a relay (see
+relay.py), which passes the game on to many spectators.
 """
 import os
+import struct
 import sys
+from time import time
 
 sys.path.insert(1, os.path.join(sys.path[0], '..', '..'))
 
 from socket import *
-from entities import ServerPlayer
+from connection_stats import ConnectionStats
+from datagram_receiver import DatagramReceiver
+from server_entities import ServerEntity, ServerPlayer, ServerSpectator
+from entity_ids import EntityIdAllocator
 from entity_manager import EntityManager
+from interest_manager import InterestManager
 from player_manager import PlayerManager
 from player_actions import PlayerActions
 from map_manager import MapManager
+from send_scheduler import SendScheduler
+import server_loop
+from tile_manager import TileManager
+from traffic_filter import TrafficFilter
+from snapshot_manager import SnapshotManager
 from common.src.common import VERSION
-from common.src import networking
+from common.src import compression, networking
+from common.src.loopback import LOOPBACK_ADDRESS, Loopback
+from common.src.map.transfer import MapTransfer
+from common.src.router import PacketRouter
 from common.src.packets import *
 
 SERVER_ADDRESS = ('0.0.0.0', 5857)
+MAX_DATAGRAMS_PER_TICK = 1024  # the rest waits for the next tick, so a flood of datagrams can't stall the game
 
 
 class Server:
-    def __init__(self):
+    def __init__(self, codecs: tuple[str, ...] = networking.CODECS, mtu: int = networking.DEFAULT_MTU,
+                 interest_radius: float = InterestManager.DEFAULT_RADIUS,
+                 compressions: tuple[str, ...] = compression.COMPRESSIONS, address: tuple | None = SERVER_ADDRESS):
+        """
+        :param codecs: the packet codecs the server accepts in the handshake, in order of preference (see networking.py)
+        :param compressions: the packet compressions the server accepts in the handshake (see compression.py)
+        :param mtu: maximum size of the datagrams the packets sent in one tick are coalesced into
+        :param interest_radius: distance in tiles up to which clients get the entities around their player
+        :param address: address the UDP socket is bound to; None for a server without socket, which only has the
+        client of its loopback, e.g. the server of a singleplayer game (see connect_loopback())
+        """
         self.entities = []  # list of all entities (and players) except the player of this client
-        self.socket = socket(AF_INET, SOCK_DGRAM)  # UDP socket
-        self.socket.setblocking(False)  # we don't want the socket to block the main thread
-        self.socket.bind(SERVER_ADDRESS)  # bind the socket to the server address; see above
+        self.entity_ids = EntityIdAllocator()  # ids of the entities; see add_entity() and remove_entity()
+        self.socket: socket | None = None  # UDP socket
+        self.receiver: DatagramReceiver | None = None
+        if address:
+            self.socket = socket(AF_INET, SOCK_DGRAM)
+            self.socket.setblocking(False)  # we don't want the socket to block the main thread
+            self.socket.bind(address)  # bind the socket to the server address; see above
+            # receives the waiting datagrams; one byte more than allowed, so too big ones are noticed
+            self.receiver = DatagramReceiver(self.socket, TrafficFilter.MAX_DATAGRAM_SIZE + 1)
+        self.traffic_filter = TrafficFilter()  # drops oversized, malformed and excess datagrams before decoding them
+        self.loopback: Loopback | None = None  # in-memory connection to a client in this process; see connect_loopback()
         self.map_manager = MapManager()  # map manager for handling (and currently generating) maps
         self.current_map = self.map_manager.maps[0]  # the current map we're on
+        self.map_transfer = MapTransfer(self.current_map)  # the current map encoded and chunked for the clients
+        # tiles of the current map changed in this tick: (x, y) -> tile; see set_tile()
+        self.tile_changes: dict[tuple[int, int], str] = {}
+        self.codecs = codecs  # codecs that can be negotiated with clients
+        self.peer_codecs: dict[tuple, str] = {}  # negotiated codec for each client address; json if not yet known
+        self.compressions = compressions  # compressions that can be negotiated with clients
+        self.compressed_peers: set[tuple] = set()  # addresses of the clients that negotiated a compression
+        # logged in clients and spectators by their session id
+        self.sessions: dict[int, ServerPlayer | ServerSpectator] = {}
+        self.clients_by_addr: dict[tuple, ServerPlayer] = {}  # logged in clients by their address
+        self.spectators: dict[tuple, ServerSpectator] = {}  # logged in spectators by their address
+        # clients whose connection broke off by their resume token; see suspend_client()
+        self.suspended_clients: dict[bytes, ServerPlayer] = {}
+        # reliable channel for each client address, see networking.ReliableChannel
+        self.channels: dict[tuple, networking.ReliableChannel] = {}
+        self.mtu = mtu
+        # packets sent to each client address, sent by priority within its bandwidth budget at the end of the tick
+        self.schedulers: dict[tuple, SendScheduler] = {}
+
+        # router dispatching received packets to the handlers the mechanics registered for the packet type
+        self.router = PacketRouter()
 
         # Mechanics -> managers for specific server-sided tasks
-        self.mechanics = (
+        self.interest_radius = interest_radius
+        self.mechanics = self._create_mechanics()
+
+    def _create_mechanics(self) -> tuple:
+        """:return: the mechanics of the server, in the order they are ticked"""
+        return (
             EntityManager(self),  # handles all entities (players and hostile creatures) and their logic
             PlayerManager(self),  # handles player connections and disconnections
             PlayerActions(self),  # handles player actions (e.g. movement, attacking, etc.)
+            TileManager(self),  # sends the tile changes of this tick to the clients
+            InterestManager(self, self.interest_radius),  # spawns/removes entities on the clients near them
+            SnapshotManager(self),  # sends the entity state changes of this tick to the clients; has to be last
         )
 
     @property
@@ -44,62 +112,270 @@ class Server:
         """
         :return: list of all connected clients (ServerPlayer instances)
         """
-        return [ent for ent in self.entities if isinstance(ent, ServerPlayer)]
+        return list(self.clients_by_addr.values())
+
+    @property
+    def viewers(self) -> list:
+        """:return: list of everyone who gets the game state: the connected clients and the spectators"""
+        return self.clients + list(self.spectators.values())
+
+    def get_client(self, addr: tuple) -> ServerPlayer | None:
+        """:return: the logged in client with the address, or None"""
+        return self.clients_by_addr.get(addr)
+
+    def get_viewer(self, addr: tuple) -> ServerPlayer | ServerSpectator | None:
+        """:return: the logged in client or spectator with the address, or None"""
+        return self.clients_by_addr.get(addr) or self.spectators.get(addr)
+
+    def accepts_login(self, packet: HelloPacket) -> bool:
+        """:return: whether a client may log in (or resume its session) with the HelloPacket"""
+        return True
+
+    def add_entity(self, entity: ServerEntity):
+        """Add an entity (with an id from entity_ids) to the world."""
+        self.entities.append(entity)
+
+    def remove_entity(self, entity: ServerEntity):
+        """Remove an entity from the world and release its id."""
+        self.entities.remove(entity)
+        self.entity_ids.release(entity.entity_id)
+
+    def set_tile(self, x: int, y: int, tile: str):
+        """
+        Change a tile of the current map; the change is sent to the clients at the end of the tick (see TileManager).
+        :raises IndexError: if the position is not on the map
+        """
+        if self.current_map.set_tile(x, y, tile):
+            self.tile_changes[(x, y)] = tile
+
+    def add_client(self, client: ServerPlayer):
+        """Add the player of a client that logged in (or resumed its session)."""
+        self.add_entity(client)
+        self.sessions[client.session_id] = client
+        self.clients_by_addr[client.addr] = client
+
+    def remove_client(self, client: ServerPlayer):
+        """Remove the player of a client that disconnected (or whose suspended session expired), and its state."""
+        if client.suspended_since is not None:
+            # the player was already taken off the world; now its id is free, too
+            self.suspended_clients.pop(client.resume_token, None)
+            self.entity_ids.release(client.entity_id)
+            return
+        self.remove_entity(client)
+        self.sessions.pop(client.session_id, None)
+        self.clients_by_addr.pop(client.addr, None)
+        self.forget_peer(client.addr)
+
+    def add_spectator(self, spectator: ServerSpectator):
+        """Add a spectator that logged in."""
+        self.sessions[spectator.session_id] = spectator
+        self.spectators[spectator.addr] = spectator
+
+    def remove_spectator(self, spectator: ServerSpectator):
+        """Remove a spectator that disconnected or timed out, and its state."""
+        self.sessions.pop(spectator.session_id, None)
+        self.spectators.pop(spectator.addr, None)
+        self.forget_peer(spectator.addr)
+
+    def suspend_client(self, client: ServerPlayer):
+        """
+        Take the player of a client whose connection broke off (e.g. timed out) off the world, but keep it - and its
+        entity id - so the client can resume its session with its resume token (see PlayerManager.on_hello()).
+        """
+        self.entities.remove(client)
+        self.sessions.pop(client.session_id, None)
+        self.clients_by_addr.pop(client.addr, None)
+        self.forget_peer(client.addr)
+        client.suspended_since = time()
+        self.suspended_clients[client.resume_token] = client
+
+    def resume_client(self, client: ServerPlayer):
+        """Put the player of a suspended client back into the world; its addr and session have to be updated first."""
+        del self.suspended_clients[client.resume_token]
+        client.suspended_since = None
+        self.add_client(client)
+
+    def connect_loopback(self) -> Loopback:
+        """
+        Connect a client in this process to the server, e.g. for a singleplayer game. The client logs in with a
+        HelloPacket like every other client; the server knows it by the LOOPBACK_ADDRESS.
+        :return: the loopback the client sends and receives its packets with
+        """
+        self.loopback = Loopback()
+        return self.loopback
 
     def send_packet(self, packet, addr: tuple):
         """
-        Send a packet to a specific client address.
+        Send a packet to a specific client address. The packet is buffered and sent at the end of the tick,
+        together with the other packets for this client (see flush()).
         :param packet: Packet instance to send
         :param addr: client address to send the packet to (ip, port)
         """
-        data = networking.serialize(packet)  # serialize the packet to bytes
-        if len(data) > 1024:
-            print(f"Sending big packet of size {len(data)} to {addr}")
-        self.socket.sendto(data, addr)  # tell the UDP socket to send the data to the client
+        if addr == LOOPBACK_ADDRESS:
+            if self.loopback:
+                self.loopback.to_client.append(packet)  # not serialized; see Loopback
+            return
+        # serialize the packet to bytes using the codec (and compression) negotiated with the client
+        self._enqueue(networking.encode(packet, self.peer_codecs.get(addr, networking.CODEC_JSON),
+                                        addr in self.compressed_peers), addr)
+
+    def send_packet_to_all(self, packet, exclude: tuple = ()):
+        """
+        Send a packet to all connected clients and spectators. See send_packet.
+
+        The packet is serialized only once per codec (and compression), and the resulting bytes are reused for every
+        recipient.
+        :param packet: Packet instance to send
+        :param exclude: addresses of the clients that should not receive the packet, e.g. the sender of an update
+        """
+        encoded_packets: dict[tuple[str, bool], networking.EncodedPacket] = {}  # (codec, compressed) -> encoded packet
+        for client in self.viewers:
+            if client.addr in exclude:
+                continue
+            if client.addr == LOOPBACK_ADDRESS:
+                self.send_packet(packet, client.addr)
+                continue
+            key = (self.peer_codecs.get(client.addr, networking.CODEC_JSON), client.addr in self.compressed_peers)
+            encoded = encoded_packets.get(key)
+            if encoded is None:
+                encoded = encoded_packets[key] = networking.encode(packet, *key)
+            self._enqueue(encoded, client.addr)
+
+    def _enqueue(self, encoded: networking.EncodedPacket, addr: tuple):
+        """Add an encoded packet to the send scheduler of the client address; see flush()."""
+        if len(encoded.data) > self.mtu:
+            print(f"Sending big packet of size {len(encoded.data)} to {addr}")
+        scheduler = self.schedulers.get(addr)
+        if scheduler is None:
+            channel = self.channels.get(addr)
+            if channel is None:
+                channel = self.channels[addr] = networking.ReliableChannel()
+            scheduler = self.schedulers[addr] = SendScheduler(channel, self.mtu)
+        scheduler.add(encoded.data, encoded.packet_type.priority, encoded.packet_type.reliable)
+
+    def forget_peer(self, addr: tuple):
+        """Drop the connection state (codec, compression, reliable channel, queued packets) of a client address."""
+        self.peer_codecs.pop(addr, None)
+        self.compressed_peers.discard(addr)
+        self.channels.pop(addr, None)
+        self.schedulers.pop(addr, None)
 
-    def send_packet_to_all(self, packet):
+    def flush(self):
         """
-        Send a packet to all connected clients. See send_packet.
+        Send the packets queued for each client, coalesced into as few datagrams as possible, together with the due
+        resends of reliable packets and pending acknowledgements. Each client gets as much as its bandwidth budget
+        allows (see ConnectionStats and SendScheduler).
         """
-        for client1 in self.clients:
-            self.send_packet(packet, client1.addr)
+        for addr, channel in self.channels.items():
+            scheduler = self.schedulers.get(addr)
+            if scheduler is None:
+                scheduler = self.schedulers[addr] = SendScheduler(channel, self.mtu)
+            if not scheduler.pending:
+                continue  # nothing to send to this client
+            client = self.get_viewer(addr)  # spectators (e.g. a relay) have a budget, too
+            bandwidth = client.connection.bandwidth if client else ConnectionStats.INITIAL_BANDWIDTH
+            for frame in scheduler.flush(bandwidth):
+                self.socket.sendto(frame, addr)  # tell the UDP socket to send the data to the client
 
-    def _rcvfrom(self, bufsize: int) -> (Packet | None, tuple | None):
+    def _decode_datagram(self, data: bytes, addr: tuple) -> list[Packet]:
         """
-        Receive a packet from the UDP socket.
-        :param bufsize: the maximum size of the packet to receive
-        :return: the received Packet instance and the address it was received from (tuple) when a packet was received
+        Decode a received datagram.
+        :param data: the datagram (see DatagramReceiver)
+        :param addr: the address it was received from
+        :return: the received Packet instances (a frame can contain multiple packets)
         """
+        # check the size, the first byte and the rate of the sender, and authenticate the datagram before decoding
+        if not self.traffic_filter.accept(data, addr, addr in self.clients_by_addr or addr in self.spectators):
+            return []
+        authorized = False
+        player = False  # whether the session is the one of a player (not a spectator)
+        session_header = networking.read_session_header(data)
+        if session_header:
+            session_id, mac, data = session_header
+            client = self.sessions.get(session_id)
+            if client is None or client.addr != addr or not networking.verify_mac(client.session_key, mac, data):
+                self.traffic_filter.drop("invalid session", len(data))
+                return []
+            authorized = True
+            player = isinstance(client, ServerPlayer)
+        # clients we never sent anything to don't have a channel yet; their acks are meaningless then
+        channel = self.channels.get(addr) or networking.ReliableChannel()
         try:
-            data, addr = self.socket.recvfrom(bufsize)
-            if len(data) > 512:
-                print(f"Received big packet of size {len(data)} from {addr}")
-            packet = networking.deserialize(data)  # receive a packet from the UDP socket
+            packets_data = networking.split_datagram(data, channel)
+        except (struct.error, ValueError):
+            self.traffic_filter.drop("invalid datagram", len(data))
+            return []
+        packets = []
+        for packet_data in packets_data:
+            packet = networking.deserialize(packet_data)
             if not isinstance(packet, Packet):
-                print(f"Received invalid packet: {packet}")
-                return None, None
-            if isinstance(packet, AuthorizedPacket):
-                if packet.token is None or packet.token not in [other_client.token for other_client in self.clients]:
-                    print(f"Received packet from unauthorized client: {packet}")
-                    return None, None
-            return packet, addr
-        except BlockingIOError:
-            # no packet was received
-            return None, None
-        except ConnectionResetError:
-            # the client probably disconnected
-            return None, None
+                self.traffic_filter.drop("invalid packet", len(packet_data))
+                continue
+            if isinstance(packet, AuthorizedPacket) and not authorized:
+                self.traffic_filter.drop("unauthorized packet", len(packet_data))
+                continue
+            if isinstance(packet, PlayerPacket) and not player:
+                self.traffic_filter.drop("spectator packet", len(packet_data))
+                continue
+            packets.append(packet)
+        return packets
 
-    def tick(self):
+    def _receive_loopback(self) -> list[Packet]:
+        """:return: the packets the client of the loopback sent since the last tick"""
+        packets = []
+        while self.loopback.to_server:
+            packet = self.loopback.to_server.popleft()
+            if isinstance(packet, AuthorizedPacket) and not self.get_viewer(LOOPBACK_ADDRESS):
+                continue  # like a packet without a session on the UDP path
+            if isinstance(packet, PlayerPacket) and not self.get_client(LOOPBACK_ADDRESS):
+                continue  # like a packet of a spectator on the UDP path
+            packets.append(packet)
+        return packets
+
+    def _dispatch(self, packet: Packet, addr: tuple):
+        """Call the handler registered for the type of a received packet."""
+        if not self.router.dispatch(packet, addr):
+            print(f"Received packet without handler: {packet.__class__.__name__}")
+
+    def receive(self):
+        """
+        Receive all waiting datagrams from the clients, up to MAX_DATAGRAMS_PER_TICK (and the packets of the loopback
+        client) and dispatch their packets to the handlers registered for their type, in the order they arrived.
+        """
+        if self.receiver:
+            received = 0
+            while received < MAX_DATAGRAMS_PER_TICK:
+                datagrams = []
+                reads = self.receiver.drain(datagrams)
+                for data, client_addr in datagrams:
+                    for client_packet in self._decode_datagram(data, client_addr):
+                        self._dispatch(client_packet, client_addr)
+                received += reads
+                if reads < self.receiver.batch_size:
+                    break  # the socket is empty
+        if self.loopback:
+            for client_packet in self._receive_loopback():
+                self._dispatch(client_packet, LOOPBACK_ADDRESS)
+
+    def is_idle(self) -> bool:
         """
-        Tick the server once; this means receiving packets from clients and ticking each mechanic
-        with the received packet (if any).
+        :return: whether nothing happens on the server until a client sends something: nobody is connected (or could
+        resume a session) and the world is empty
         """
-        client_packet, client_addr = self._rcvfrom(1024)
+        return not (self.sessions or self.suspended_clients or self.loopback or self.entities)
 
+    def tick(self):
+        """
+        Tick the server once; this means receiving all waiting datagrams from the clients (and the packets of the
+        loopback client), dispatching their packets to the handlers registered for their type and ticking each
+        mechanic.
+        """
+        self.receive()
         for mechanics in self.mechanics:
             # tick each mechanic
-            mechanics.tick(client_packet, client_addr)
+            mechanics.tick()
+
+        self.flush()  # send the packets of this tick
 
 
 def main():
@@ -111,29 +387,36 @@ def main():
 
     # when running the server with the --debug flag, exceptions will not be caught
     debug = "--debug" in sys.argv
+    # when running the server with the --json flag, all packets are sent as (human-readable) json
+    codecs = (networking.CODEC_JSON,) if "--json" in sys.argv else networking.CODECS
+    # when running the server with the --no-compression flag, no packets are compressed
+    compressions = () if "--no-compression" in sys.argv else compression.COMPRESSIONS
+    # the maximum datagram size can be changed with --mtu <bytes>
+    mtu = int(sys.argv[sys.argv.index("--mtu") + 1]) if "--mtu" in sys.argv else networking.DEFAULT_MTU
+    # clients get the entities up to --interest-radius <tiles> around their player
+    interest_radius = float(sys.argv[sys.argv.index("--interest-radius") + 1]) if "--interest-radius" in sys.argv \
+        else InterestManager.DEFAULT_RADIUS
+    # the server receives the packets and steps the game --tick-rate <ticks> times per second
+    tick_rate = float(sys.argv[sys.argv.index("--tick-rate") + 1]) if "--tick-rate" in sys.argv \
+        else server_loop.ServerLoop.TICK_RATE
 
     print(f"Booting... ({VERSION})") if not debug else print(f"Booting... ({VERSION}) (debug mode)")
     try:
-        server = Server()
+        server = Server(codecs, mtu, interest_radius, compressions)
     except OSError as e:
         # OSError will be raised when the port is already in use
         print("Could not initialize server. Is it already running?")
         raise e
 
     print("Starting main loop...")
-    while True:
-        try:
-            server.tick()  # non-blocking tick call; does not wait for client packets
-        except KeyboardInterrupt:
-            break  # exit the main loop when the user presses Ctrl+C
-        except Exception as e:
-            if debug:
-                raise e
-            # we don't want to crash the server when an unexpected exception occurs; only do this in debug mode
-            print("Exception in main loop:")
-            print(e)
+    tick_stats = server_loop.run(server, tick_rate, debug)  # sleeps until the next tick is due
 
     print("Shutting down...")
+    print(f"Ticks: {tick_stats}")
+    print(f"Traffic filter: {server.traffic_filter}")
+    print("Packet handler statistics:")
+    for stats in server.router.hot_handlers():
+        print(f"  {stats}")
 
 
 if __name__ == '__main__':
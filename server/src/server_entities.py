@@ -0,0 +1,84 @@
+"""
+Server-side entity classes. For rendering etc. see client/src/entities.py.
+"""
+from time import time
+
+from pygame import Vector2
+
+from common.src.direction import Dir2
+from common.src.entities import EntityType
+from connection_stats import ConnectionStats
+
+
+class ServerEntity:
+    """Represents an entity in the game world. Can be a player or hostile creature."""
+
+    def __init__(self, entity_id: int, entity_type: EntityType, position: Vector2 = Vector2(), health: int = 50):
+        self.entity_id = entity_id  # unique identifier of entity, see entity_ids.py
+        self.entity_type = entity_type  # type of entity -> used for sprites, animations etc.
+        self.position = position  # tile position of entity
+        self.health = health  # health points of entity
+        self.max_health = health  # the maximum health of the entity
+        self.direction = Dir2.ZERO  # direction of entity input (facing direction)
+        self.last_direction = Dir2.ZERO  # last direction of entity input, only ZERO at start
+        self.attacking: bool = False  # whether the entity is attacking
+        self.last_move_time: float = 0  # last move time of the entity for handling tile movement speed
+
+
+class ServerPlayer(ServerEntity):
+    """Represents a user/client connected to the *server*."""
+
+    def __init__(self, name: str, addr, entity_id, session_id: int, session_key: bytes, resume_token: bytes,
+                 position: Vector2 = Vector2(), health: int = 50):
+        """
+        :param name: the name of the player
+        :param addr: the address (ip, port) of the player
+        :param entity_id: the public unique identifier of the player (entity id)
+        :param session_id: the id the client identifies itself with in the session header of its datagrams
+        :param session_key: the private key for the MACs in the session header
+        :param resume_token: the private token the client resumes its session with after a disconnect
+        """
+        super().__init__(entity_id, EntityType.KNIGHT, position, health)
+        self.name = name
+        self.addr = addr
+        self.session_id = session_id
+        self.session_key = session_key
+        self.resume_token = resume_token
+        self.suspended_since: float | None = None  # time the connection broke off, while the session can be resumed
+        self.last_ping = time()
+        self.connection = ConnectionStats()  # round trip time, loss and bandwidth budget of the client's connection
+        self.input_sequence = 0  # sequence number of the last input the server applied; 0 if none
+        self.acked_snapshot = 0  # tick of the last entity snapshot the client acknowledged; 0 if none
+        self.sent_snapshots = {}  # tick -> entity snapshot sent to the client; the baselines for its deltas
+        self.known_entities: set[int] = set()  # ids of the entities in the client's area of interest
+        self.joined = False  # whether the client got the entities around its player; see InterestManager
+        self.tiles_synced = False  # whether the client got all tile changes of the current map; see TileManager
+
+
+class ServerSpectator:
+    """
+    Represents a client that only watches the game (see HelloPacket.spectator), e.g. a relay (see relay.py). It has no
+    player, so it isn't part of the world and can't send inputs; it gets all entities, wherever they are.
+    """
+
+    def __init__(self, name: str, addr, session_id: int, session_key: bytes, map_hashes: list[str] = (),
+                 generator_versions: list[int] = ()):
+        """
+        See ServerPlayer.
+        :param map_hashes: hashes of the maps the client has cached (see HelloPacket); a later map that is one of
+        them is announced without sending its chunks (see PlayerManager.send_map())
+        :param generator_versions: map generator versions the client supports (see HelloPacket); the same for them
+        """
+        self.name = name
+        self.addr = addr
+        self.session_id = session_id
+        self.session_key = session_key
+        self.last_ping = time()
+        self.connection = ConnectionStats()  # round trip time, loss and bandwidth budget of the client's connection
+        self.acked_snapshot = 0  # tick of the last entity snapshot the client acknowledged; 0 if none
+        self.sent_snapshots = {}  # tick -> entity snapshot sent to the client; the baselines for its deltas
+        self.known_entities: set[int] = set()  # ids of the entities the client knows; all entities after joining
+        self.joined = False  # whether the client got all entities; see InterestManager
+        self.tiles_synced = False  # whether the client got all tile changes of the current map; see TileManager
+        self.map_hashes = map_hashes
+        self.generator_versions = generator_versions
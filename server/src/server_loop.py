@@ -0,0 +1,166 @@
+"""
+Event loop of a dedicated server: runs the server with asyncio instead of polling its socket in a busy loop.
+"""
+import asyncio
+import sys
+
+
+class TickStats:
+    """
+    Statistics of the ticks of a ServerLoop. A tick overruns when it takes longer than the tick interval; then the next
+    tick starts late, and the tick boundaries that passed in the meantime are skipped.
+
+    New overruns are reported every REPORT_INTERVAL seconds (not one by one, as printing is slow, too).
+    """
+    REPORT_INTERVAL = 10
+
+    def __init__(self, interval: float):
+        self.interval = interval  # seconds between two ticks
+        self.ticks = 0
+        self.overruns = 0  # ticks that took longer than the interval
+        self.skipped = 0  # tick boundaries skipped because of overruns
+        self.total_time = 0.0  # seconds spent in all ticks
+        self.max_time = 0.0  # seconds spent in the longest tick
+        self.max_lateness = 0.0  # the most seconds a tick started after its boundary
+        self.max_datagrams = 0  # the most datagrams received in one tick
+        self._last_report = 0.0
+        self._reported_overruns = 0
+
+    def record(self, now: float, duration: float, lateness: float, datagrams: int):
+        """
+        Record a tick.
+        :param now: the loop time the tick ended
+        :param duration: seconds the tick took
+        :param lateness: seconds the tick started after its boundary
+        :param datagrams: number of datagrams received in the tick
+        """
+        self.ticks += 1
+        self.total_time += duration
+        self.max_time = max(self.max_time, duration)
+        self.max_lateness = max(self.max_lateness, lateness)
+        self.max_datagrams = max(self.max_datagrams, datagrams)
+        if duration > self.interval:
+            self.overruns += 1
+        if now - self._last_report > self.REPORT_INTERVAL:
+            self._last_report = now
+            if self.overruns != self._reported_overruns:
+                print(f"Ticks: {self}")
+                self._reported_overruns = self.overruns
+
+    def __str__(self):
+        if not self.ticks:
+            return "no ticks"
+        return (f"{self.ticks} ticks at {1 / self.interval:g} per second, {self.total_time / self.ticks * 1000:.2f} ms "
+                f"avg, {self.max_time * 1000:.2f} ms max ({self.max_time / self.interval:.0%} of the interval); "
+                f"{self.overruns} overruns ({self.overruns / self.ticks:.2%}), {self.skipped} ticks skipped, "
+                f"started up to {self.max_lateness * 1000:.2f} ms late; up to {self.max_datagrams} datagrams per tick")
+
+
+class ServerLoop:
+    """
+    Runs a server (see server.py) with a fixed timestep on an asyncio event loop. Each tick drains the socket, applies
+    the received packets in the order they arrived, steps the mechanics once and flushes the packets to send (see
+    Server.tick()); then the loop sleeps until the next tick boundary. A tick that overruns its interval delays the next
+    one (see TickStats); the ticks never catch up in a burst.
+
+    An idle server (see Server.is_idle()) only ticks IDLE_TICK_RATE times per second. Meanwhile, its socket is watched
+    with add_reader(), so the first datagram wakes it up for a tick right away, and the ticks are back at the tick rate.
+
+    The datagrams are received by the tick itself (see DatagramReceiver), not by a DatagramProtocol of an asyncio
+    datagram endpoint that queues them for the next tick: the event loop calls a protocol once per readiness event of
+    the socket and receives a single datagram each time. That costs about 25 µs per datagram, against 1.8 µs for
+    draining the socket with recvfrom() in a loop (see tools/receive_benchmark.py), which is more than decoding the
+    datagram. So a loaded server would spend most of its time between the ticks on the event loop, and a flood of
+    datagrams would be received at a fraction of the rate the traffic filter can drop them. add_reader() is only used
+    while the server is idle, to be woken up by the first datagram.
+
+    Exceptions of the server are printed and the loop goes on, unless it runs in debug mode; then run() raises them.
+    """
+    TICK_RATE = 60  # ticks per second; the mechanics act in intervals of at least 50 ms (e.g. the snapshots)
+    IDLE_TICK_RATE = 1  # ticks per second of an idle server
+
+    def __init__(self, server, tick_rate: float = TICK_RATE, debug: bool = False):
+        self.server = server
+        self.debug = debug
+        self.interval = 1 / tick_rate  # seconds between two ticks
+        self.stats = TickStats(self.interval)
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.next_tick = 0.0  # loop time of the next tick boundary
+        self.tick_handle: asyncio.TimerHandle | None = None
+        self.watching = False  # whether the socket is watched for waking up an idle server
+        self.stopped: asyncio.Future | None = None  # done when the loop stops; its exception is the one of run()
+
+    async def run(self):
+        """Run the server until the task is cancelled (e.g. by Ctrl+C), or an exception occurs in debug mode."""
+        self.loop = asyncio.get_running_loop()
+        self.stopped = self.loop.create_future()
+        self.next_tick = self.loop.time()
+        self.tick_handle = self.loop.call_at(self.next_tick, self._tick)
+        try:
+            await self.stopped
+        finally:
+            self._watch(False)
+            self.tick_handle.cancel()
+
+    def _watch(self, watching: bool):
+        """Start or stop watching the socket of the server for datagrams."""
+        if watching == self.watching or not self.server.socket:
+            return
+        if watching:
+            self.loop.add_reader(self.server.socket, self._on_readable)
+        else:
+            self.loop.remove_reader(self.server.socket)
+        self.watching = watching
+
+    def _tick(self):
+        start = self.loop.time()
+        received = self.server.receiver.received if self.server.receiver else 0
+        try:
+            self.server.tick()
+        except Exception as e:
+            if self.debug:
+                self.stopped.set_exception(e)
+                return
+            # we don't want to crash the server when an unexpected exception occurs; only do this in debug mode
+            print("Exception in main loop:")
+            print(e)
+        now = self.loop.time()
+        datagrams = (self.server.receiver.received if self.server.receiver else 0) - received
+        self.stats.record(now, now - start, max(start - self.next_tick, 0.0), datagrams)
+
+        if self.server.is_idle():
+            # nothing to do until a datagram arrives (see _on_readable()), but the mechanics may still have timeouts
+            self._watch(True)
+            self.next_tick = now + 1 / self.IDLE_TICK_RATE
+        else:
+            self._watch(False)  # the datagrams wait for the next tick
+            self.next_tick += self.interval
+            if self.next_tick < now:
+                # overrun: skip the boundaries that have passed, so the ticks stay on their schedule
+                skipped = int((now - self.next_tick) / self.interval) + 1
+                self.stats.skipped += skipped
+                self.next_tick += skipped * self.interval
+        self.tick_handle = self.loop.call_at(self.next_tick, self._tick)
+
+    def _on_readable(self):
+        # an idle server got a datagram; the tick receives it
+        self._watch(False)
+        self.tick_handle.cancel()
+        self.next_tick = self.loop.time()
+        self.tick_handle = self.loop.call_at(self.next_tick, self._tick)
+
+
+def run(server, tick_rate: float = ServerLoop.TICK_RATE, debug: bool = False) -> TickStats:
+    """
+    Run the server on a new event loop until Ctrl+C is pressed (or an exception occurs in debug mode).
+    :return: the statistics of the ticks
+    """
+    if sys.platform == "win32":
+        # the default event loop on Windows (proactor) can't watch sockets with add_reader() (see ServerLoop)
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    server_loop = ServerLoop(server, tick_rate, debug)
+    try:
+        asyncio.run(server_loop.run())
+    except KeyboardInterrupt:
+        pass
+    return server_loop.stats
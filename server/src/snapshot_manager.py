@@ -0,0 +1,90 @@
+"""
+Synchronize the entity state (position, health, direction, attacking) with the clients using delta snapshots.
+"""
+from time import time
+
+from common.src.packets import EntitySnapshotPacket, SnapshotAckPacket
+from common.src.snapshots import EntityState, encode_delta
+from mechanics import Mechanics
+
+_EMPTY_SNAPSHOT: dict[int, EntityState] = {}  # baseline of full snapshots
+
+
+class SnapshotManager(Mechanics):
+    """
+    Builds a snapshot of all entity states every SNAPSHOT_INTERVAL seconds and sends each client the delta against
+    the last snapshot it acknowledged. Until a client acknowledges a newer snapshot, it keeps getting deltas against
+    the same baseline, so lost datagrams are repaired by the next delta.
+
+    Each client only gets the entities in its area of interest (see InterestManager), so the snapshots sent to it
+    are kept per client as its baselines.
+    """
+    SNAPSHOT_INTERVAL = 0.05  # build/send snapshots 20 times per second
+    # number of snapshots kept as baselines, besides the acknowledged one; older acknowledgements result in a full
+    # snapshot
+    HISTORY_SIZE = 64
+
+    def __init__(self, server):
+        super().__init__(server)
+        self.last_snapshot_time = time()
+        self.tick_number = 0  # tick of the newest snapshot; 0 means no snapshot (baseline of a full snapshot)
+        server.router.register(SnapshotAckPacket, self.on_snapshot_ack)
+
+    def _build_snapshot(self) -> dict[int, EntityState]:
+        """:return: the current state of all entities on the server"""
+        return {
+            entity.entity_id: EntityState(int(entity.position.x), int(entity.position.y), entity.health,
+                                     entity.direction.value, entity.attacking)
+            for entity in self.server.entities
+        }
+
+    def tick(self):
+        if time() - self.last_snapshot_time < self.SNAPSHOT_INTERVAL:
+            return
+        self.last_snapshot_time = time()
+
+        snapshot = self._build_snapshot()
+        # clients that know the same entities share their snapshot (and the delta, if they have the same baseline)
+        filtered: dict[frozenset, dict[int, EntityState]] = {}  # known entities -> snapshot of these entities
+        client_snapshots = []
+        for client in self.server.viewers:
+            known = frozenset(client.known_entities)
+            client_snapshot = filtered.get(known)
+            if client_snapshot is None:
+                client_snapshot = filtered[known] = {entity_id: state for entity_id, state in snapshot.items() if entity_id in known}
+            client_snapshots.append((client, client_snapshot))
+        if any(client.sent_snapshots.get(self.tick_number) != client_snapshot
+               for client, client_snapshot in client_snapshots):
+            # only create a new snapshot when something changed for a client; otherwise we resend the newest one to
+            # clients that didn't acknowledge it yet
+            self.tick_number += 1
+
+        deltas: dict[tuple, bytes | None] = {}  # (id of baseline, id of snapshot) -> delta
+        for client, client_snapshot in client_snapshots:
+            if self.tick_number not in client.sent_snapshots:
+                client.sent_snapshots[self.tick_number] = client_snapshot
+                self._prune(client)
+            client_snapshot = client.sent_snapshots[self.tick_number]
+            base_tick = client.acked_snapshot if client.acked_snapshot in client.sent_snapshots else 0
+            base = client.sent_snapshots.get(base_tick, _EMPTY_SNAPSHOT)
+            key = (id(base), id(client_snapshot))  # both are kept alive by sent_snapshots
+            if key not in deltas:
+                deltas[key] = encode_delta(base, client_snapshot)
+            delta = deltas[key]
+            if delta is not None:
+                self.server.send_packet(EntitySnapshotPacket(self.tick_number, base_tick, delta), client.addr)
+
+    def _prune(self, client):
+        """
+        Forget the snapshots sent to the client that are older than the history, except for its baseline; e.g. the
+        baseline of a resumed session can be older (see PlayerManager._restore_client_state()).
+        """
+        oldest = self.tick_number - self.HISTORY_SIZE
+        for tick in [tick for tick in client.sent_snapshots if tick <= oldest and tick != client.acked_snapshot]:
+            del client.sent_snapshots[tick]
+
+    def on_snapshot_ack(self, packet: SnapshotAckPacket, client_addr):
+        """Use the acknowledged snapshot as the new baseline for the client."""
+        user = self.server.get_viewer(client_addr)
+        if user and user.acked_snapshot < packet.tick <= self.tick_number:
+            user.acked_snapshot = packet.tick
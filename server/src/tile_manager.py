@@ -0,0 +1,58 @@
+"""
+Synchronization of the tiles of the current map that change while the game runs.
+"""
+from common.src import networking
+from common.src.packets import TileChangePacket
+from mechanics import Mechanics
+
+
+class TileManager(Mechanics):
+    """
+    Sends the tile changes of the current map to the clients. The changes of a tick (see Server.set_tile()) are sent
+    to all clients at once, in as few TileChangePackets as fit into a frame each (see Server.mtu); a tile that changed
+    multiple times in the tick is only sent with its last tile.
+
+    The map the clients get (see Server.map_transfer) is the map as it was announced, so its hash stays the same and
+    clients can still generate it from its seed or load it from their cache. This is why all changes since are kept,
+    and sent to every client that gets the map (or resumes its session and might have missed some).
+
+    All tile change packets are sent here; other mechanics just change tiles with Server.set_tile().
+    """
+    def __init__(self, server):
+        super().__init__(server)
+        self.changes: dict[tuple[int, int], str] = {}  # all changes of the current map: (x, y) -> tile
+
+    def _packets(self, changes: dict[tuple[int, int], str], addrs) -> list[TileChangePacket]:
+        """
+        :param addrs: addresses of the clients the packets are sent to; each packet fits into a frame in their codecs
+        :return: the packets with the tile changes
+        """
+        codecs = {self.server.peer_codecs.get(addr, networking.CODEC_JSON) for addr in addrs}
+        return self._batch(list(changes.items()), codecs, self.server.mtu - networking.RELIABLE_FRAME_OVERHEAD)
+
+    def _batch(self, items: list, codecs: set[str], max_size: int) -> list[TileChangePacket]:
+        """:return: the packets with the changes (items of `changes`), each at most max_size bytes in the codecs"""
+        packet = TileChangePacket([x for (x, _), _ in items], [y for (_, y), _ in items], [tile for _, tile in items])
+        size = max((len(networking.serialize(packet, codec)) for codec in codecs), default=0)
+        if size <= max_size or len(items) == 1:
+            return [packet]
+        # split into as many batches of the same size as needed; the changes differ in size, so split again if needed
+        batch_size = -(-len(items) // -(-size // max_size))
+        return [packet for start in range(0, len(items), batch_size)
+                for packet in self._batch(items[start:start + batch_size], codecs, max_size)]
+
+    def tick(self):
+        changes, self.server.tile_changes = self.server.tile_changes, {}
+        if changes:
+            # clients that didn't get the earlier changes yet get these with them below
+            exclude = tuple(client.addr for client in self.server.viewers if not client.tiles_synced)
+            recipients = [client.addr for client in self.server.viewers if client.tiles_synced]
+            for packet in self._packets(changes, recipients):
+                self.server.send_packet_to_all(packet, exclude)
+            self.changes.update(changes)
+        for client in self.server.viewers:
+            if not client.tiles_synced:
+                # the client just got the map (after the MapChangePacket, as the packets are reliable)
+                for packet in self._packets(self.changes, [client.addr]):
+                    self.server.send_packet(packet, client.addr)
+                client.tiles_synced = True
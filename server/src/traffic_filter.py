@@ -0,0 +1,129 @@
+"""
+Cheap checks of received datagrams before anything is decoded: size cap, header check and rate limits.
+"""
+from collections import Counter
+from time import time
+
+from common.src import networking
+
+
+class TokenBucket:
+    """Allows `rate` events per second on average, and bursts of up to `burst` events."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last_fill = time()
+
+    def take(self, now: float) -> bool:
+        """:return: whether an event is allowed now; if so, it uses up a token"""
+        self.tokens = min(self.tokens + (now - self.last_fill) * self.rate, self.burst)
+        self.last_fill = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class TrafficFilter:
+    """
+    Decides for each received datagram whether the server looks at it at all, using only its size, its first byte and
+    its source address. So a misbehaving or spoofing sender can't keep the server busy with decoding (e.g. json):
+
+    - datagrams bigger than MAX_DATAGRAM_SIZE are dropped; no client sends bigger ones
+    - datagrams without a session header may only be a frame or a json packet (the HelloPacket); everything else
+      needs a session, which is verified by the server before decoding (see Server._decode_datagram())
+    - every source address has a token bucket for its datagrams; addresses of logged in clients get a bigger one.
+      Only MAX_ADDRESSES addresses without a logged in client are tracked; when a new one sends something, the
+      bucket of the one that was silent the longest is evicted (the addresses of logged in clients never are)
+
+    Every dropped datagram is counted by the reason it was dropped for (see `dropped`); the server also counts the
+    datagrams and packets it drops later, e.g. for an invalid session (see drop()).
+    """
+    MAX_DATAGRAM_SIZE = networking.DEFAULT_MTU + 16  # a frame of the client plus its session header
+    CLIENT_RATE = 200  # datagrams per second of a logged in client; it sends inputs, acks and pings
+    CLIENT_BURST = 100
+    UNKNOWN_RATE = 5  # datagrams per second of an address without a logged in client; only logins and pings
+    UNKNOWN_BURST = 10
+    MAX_ADDRESSES = 4096  # number of unknown addresses we keep buckets for; the memory spent on them is limited
+    IDLE_TIMEOUT = 10  # seconds after which the bucket of an address that didn't send anything is forgotten;
+    # also the interval in which the dropped datagrams are reported
+
+    def __init__(self):
+        # source address -> bucket of its datagrams, for addresses without a logged in client; the address that sent
+        # something last comes last, so the first one is evicted when there are too many
+        self._buckets: dict[tuple, TokenBucket] = {}
+        self._client_buckets: dict[tuple, TokenBucket] = {}  # the same for the addresses of logged in clients
+        self._last_cleanup = time()
+        self.dropped: Counter[str] = Counter()  # reason -> number of dropped datagrams
+        self.dropped_bytes = 0  # total size of the dropped datagrams
+        self._reported_drops = 0  # number of dropped datagrams at the last report
+
+    def drop(self, reason: str, size: int):
+        """Count a dropped datagram."""
+        self.dropped[reason] += 1
+        self.dropped_bytes += size
+
+    def accept(self, data: bytes, addr: tuple, known: bool) -> bool:
+        """
+        :param data: the received datagram; up to MAX_DATAGRAM_SIZE + 1 bytes, so oversized ones can be detected
+        :param known: whether a logged in client has the source address
+        :return: whether the datagram should be processed; if not, it was counted as dropped
+        """
+        if not data:
+            self.drop("empty", 0)
+            return False
+        if len(data) > self.MAX_DATAGRAM_SIZE:
+            self.drop("too big", len(data))
+            return False
+        if data[0] not in (networking.SESSION_MARKER, networking.FRAME_MARKER, networking.JSON_MARKER):
+            self.drop("invalid header", len(data))
+            return False
+
+        now = time()
+        if now - self._last_cleanup > self.IDLE_TIMEOUT:
+            self._cleanup(now)
+        if known:
+            bucket = self._client_buckets.get(addr)
+            if bucket is None:
+                # the client with the address logged in
+                bucket = self._buckets.pop(addr, None) or TokenBucket(self.CLIENT_RATE, self.CLIENT_BURST)
+                self._client_buckets[addr] = bucket
+        else:
+            bucket = self._buckets.pop(addr, None) or self._client_buckets.pop(addr, None)
+            if bucket is None:
+                if len(self._buckets) >= self.MAX_ADDRESSES:
+                    del self._buckets[next(iter(self._buckets))]
+                bucket = TokenBucket(self.UNKNOWN_RATE, self.UNKNOWN_BURST)
+            self._buckets[addr] = bucket
+        rate, burst = (self.CLIENT_RATE, self.CLIENT_BURST) if known else (self.UNKNOWN_RATE, self.UNKNOWN_BURST)
+        if bucket.rate != rate:
+            # the client with the address logged in or left
+            bucket.rate, bucket.burst = rate, burst
+            bucket.tokens = min(bucket.tokens, burst)
+        if not bucket.take(now):
+            self.drop("rate limit", len(data))
+            return False
+        return True
+
+    def _cleanup(self, now: float):
+        """
+        Forget the buckets of the addresses that didn't send anything for IDLE_TIMEOUT seconds, and report the
+        dropped datagrams if there are new ones. They are not printed one by one, as printing is slow, too.
+        """
+        self._buckets = {addr: bucket for addr, bucket in self._buckets.items()
+                         if now - bucket.last_fill <= self.IDLE_TIMEOUT}
+        self._client_buckets = {addr: bucket for addr, bucket in self._client_buckets.items()
+                                if now - bucket.last_fill <= self.IDLE_TIMEOUT}
+        self._last_cleanup = now
+        total = sum(self.dropped.values())
+        if total != self._reported_drops:
+            print(f"Traffic filter: {self}")
+            self._reported_drops = total
+
+    def __str__(self):
+        if not self.dropped:
+            return "no datagrams dropped"
+        reasons = ", ".join(f"{reason}: {count}" for reason, count in self.dropped.most_common())
+        return f"{sum(self.dropped.values())} datagrams ({self.dropped_bytes} bytes) dropped ({reasons})"
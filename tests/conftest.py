@@ -0,0 +1,8 @@
+import os
+import sys
+
+# the tests import the shared code as common.src.*, and the server modules by their name, like the server does
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server', 'src'))
+# the client modules by their name, too; appended, so client.src.* still is the package and not client.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'client', 'src'))
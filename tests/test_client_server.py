@@ -0,0 +1,197 @@
+"""
+A client and a server in this process, without sockets: over the loopback of a singleplayer game (see loopback.py),
+and over an in-memory datagram link that loses and reorders datagrams, like the internet does.
+"""
+import os
+import random
+from collections import deque
+from types import SimpleNamespace
+
+import pygame
+import pytest
+
+import client_state
+from client_networking import ClientNetworking
+from common.src import networking
+from common.src.loopback import LOOPBACK_ADDRESS
+from common.src.packets import PingPacket
+from config import ClientConfig
+from datagram_receiver import DatagramReceiver
+from map_cache import MapCache
+from server import Server
+from snapshot_manager import SnapshotManager
+from traffic_filter import TrafficFilter
+
+SERVER_ADDRESS = ("10.0.0.1", 5857)
+CLIENT_ADDRESS = ("10.0.0.2", 40000)
+
+
+class _Link:
+    """
+    Datagram link between a server and one client, in place of their UDP sockets. Each end has the socket methods the
+    server (see DatagramReceiver) and the client (see ClientNetworking) use. The datagrams in flight are delivered in
+    a random order, and a random share of `loss` of them is lost.
+    """
+
+    def __init__(self, loss: float = 0.0, seed: int = 0):
+        self.loss = loss
+        self.random = random.Random(seed)  # the same losses in every run
+        self.lost = 0  # number of lost datagrams
+        self.to_server: deque[bytes] = deque()
+        self.to_client: deque[bytes] = deque()
+        self.server_end = _LinkEnd(self, self.to_server, self.to_client, CLIENT_ADDRESS)
+        self.client_end = _LinkEnd(self, self.to_client, self.to_server, SERVER_ADDRESS)
+
+    def send(self, queue: deque, data):
+        if self.random.random() < self.loss:
+            self.lost += 1
+        else:
+            queue.insert(self.random.randint(0, len(queue)), bytes(data))
+
+
+class _LinkEnd:
+    def __init__(self, link: _Link, inbox: deque, outbox: deque, peer_address: tuple):
+        self.link = link
+        self.inbox = inbox
+        self.outbox = outbox
+        self.peer_address = peer_address
+
+    def sendto(self, data, addr: tuple):
+        self.link.send(self.outbox, data)
+
+    def recvfrom(self, size: int) -> tuple[bytes, tuple]:
+        return self.recv(size), self.peer_address
+
+    def recv(self, size: int) -> bytes:
+        if not self.inbox:
+            raise BlockingIOError()
+        return self.inbox.popleft()[:size]
+
+    def close(self):
+        pass
+
+
+class _Client:
+    """What ClientNetworking uses of the Client (see client.py), without its window."""
+
+    def __init__(self, map_cache: MapCache):
+        self.config = ClientConfig("Player1")
+        self.map_cache = map_cache
+        self.renderer = SimpleNamespace(tilemap=SimpleNamespace(invalidate=lambda x, y: None))
+        self.map = None
+        self.player = None
+        self.player_id = None
+        self.entities = {}
+        self.state = client_state.CONNECTING
+
+    def update_player(self, player):
+        self.player = player
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # the sprites of the entities are converted for the display; it doesn't have to be shown
+    monkeypatch.setenv("SDL_VIDEODRIVER", os.environ.get("SDL_VIDEODRIVER", "dummy"))
+    pygame.display.init()
+    pygame.display.set_mode((1, 1))
+    monkeypatch.setattr(ClientNetworking, "get_public_address", staticmethod(lambda: SERVER_ADDRESS))
+    client = _Client(MapCache(str(tmp_path)))
+    client.networking = ClientNetworking(client)
+    client.networking.socket.close()
+    client.networking.socket = None
+    yield client
+    pygame.display.quit()
+
+
+def _connect(client: _Client, link: _Link) -> Server:
+    """:return: a server the client logs in to over the link"""
+    server = Server(address=None)
+    server.socket = link.server_end
+    server.receiver = DatagramReceiver(server.socket, TrafficFilter.MAX_DATAGRAM_SIZE + 1)
+    client.networking.socket = link.client_end
+    client.networking.current_address = SERVER_ADDRESS
+    client.networking._login()
+    return server
+
+
+def _run(server: Server, client: _Client, ticks: int):
+    snapshot_manager = next(mechanics for mechanics in server.mechanics if isinstance(mechanics, SnapshotManager))
+    for _ in range(ticks):
+        snapshot_manager.last_snapshot_time = 0  # a snapshot every tick
+        server.tick()
+        assert client.networking.tick([], 1 / 60)
+
+
+def _assert_in_game(server: Server, client: _Client, addr: tuple):
+    player = server.get_client(addr)
+    assert client.state == client_state.IN_GAME
+    assert client.player is not None and client.player.entity_id == player.entity_id
+    assert client.map is not None and client.map.tiles == server.current_map.tiles
+    # the snapshots arrive and are acknowledged
+    player.position.x += 1
+    _run(server, client, 5)
+    assert client.player.tile_position == player.position
+    assert 0 < player.acked_snapshot == client.networking.snapshot_tick
+
+
+def test_login_over_the_loopback(client):
+    server = Server(address=None)
+    client.networking.login_loopback(server.connect_loopback())
+    _run(server, client, 5)
+    _assert_in_game(server, client, LOOPBACK_ADDRESS)
+
+
+def test_login_over_datagrams(client):
+    link = _Link()
+    server = _connect(client, link)
+    _run(server, client, 5)
+    assert client.networking.codec == networking.CODEC_BINARY
+    _assert_in_game(server, client, CLIENT_ADDRESS)
+
+
+def test_tile_changes_arrive_in_order_under_loss(client, monkeypatch):
+    monkeypatch.setattr(networking, "RESEND_TIMEOUT", 0)  # resend every tick until acknowledged
+    link = _Link()
+    server = _connect(client, link)
+    _run(server, client, 5)
+    _assert_in_game(server, client, CLIENT_ADDRESS)
+
+    link.loss = 0.3
+    tiles = {server.current_map.get_tile(x, 1) for x in range(server.current_map.width)}
+    for tile in sorted(tiles) * 3:
+        # the same tiles change again and again; the changes of a tile only end up right if they are applied in order
+        for x in range(1, 4):
+            server.set_tile(x, 1, tile)
+        _run(server, client, 1)
+    _run(server, client, 30)
+    assert link.lost
+    assert client.map.tiles == server.current_map.tiles
+    assert not server.channels[CLIENT_ADDRESS].unacked
+
+
+@pytest.mark.parametrize("loss", [0.0, 0.2, 0.5])
+def test_reliable_channel_delivers_in_order_once(loss, monkeypatch):
+    monkeypatch.setattr(networking, "RESEND_TIMEOUT", 0)
+    link = _Link(loss, seed=int(loss * 10))
+    sender, receiver = networking.ReliableChannel(), networking.ReliableChannel()
+    delivered = []
+    for round_number in range(1000):
+        frame_buffer = networking.FrameBuffer(sender)
+        if round_number < 100:
+            frame_buffer.add(networking.serialize(PingPacket(round_number), networking.CODEC_BINARY), True)
+        for frame in frame_buffer.flush():
+            link.client_end.sendto(frame, SERVER_ADDRESS)
+        # some of the datagrams in flight arrive in this round, the others are delayed
+        for _ in range(link.random.randint(0, len(link.to_server))):
+            data, _ = link.server_end.recvfrom(networking.DEFAULT_MTU)
+            delivered.extend(networking.deserialize(packet_data).sequence
+                             for packet_data in networking.split_datagram(data, receiver))
+        for frame in networking.FrameBuffer(receiver).flush():  # the acks
+            link.server_end.sendto(frame, CLIENT_ADDRESS)
+        for _ in range(link.random.randint(0, len(link.to_client))):
+            networking.split_datagram(link.client_end.recv(networking.DEFAULT_MTU), sender)
+        if round_number >= 100 and not sender.unacked:
+            break
+    assert delivered == list(range(100))
+    assert not sender.unacked
+    assert bool(link.lost) == bool(loss)
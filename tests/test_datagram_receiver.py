@@ -0,0 +1,45 @@
+"""
+Draining the socket of the server (see DatagramReceiver and Server.receive()).
+"""
+from collections import deque
+
+from datagram_receiver import DatagramReceiver
+from server import Server
+
+
+class _Socket:
+    """Socket with a queue of datagrams to receive; ConnectionResetError entries are raised like Windows does."""
+
+    def __init__(self, datagrams):
+        self.datagrams = deque(datagrams)
+
+    def recvfrom(self, size: int):
+        if not self.datagrams:
+            raise BlockingIOError()
+        datagram = self.datagrams.popleft()
+        if isinstance(datagram, Exception):
+            raise datagram
+        return datagram
+
+
+def test_drain_counts_skipped_reads():
+    receiver = DatagramReceiver(_Socket([ConnectionResetError(), (b"a", ("127.0.0.1", 1)), ConnectionResetError()]),
+                                100, batch_size=2)
+    datagrams = []
+    assert receiver.drain(datagrams) == 2
+    assert receiver.drain(datagrams) == 1
+    assert receiver.drain(datagrams) == 0
+    assert datagrams == [(b"a", ("127.0.0.1", 1))]
+    assert receiver.received == 1
+
+
+def test_server_drains_past_skipped_reads():
+    server = Server(address=("127.0.0.1", 0))
+    try:
+        sock = _Socket([ConnectionResetError()] * 8 + [(b"\x00", ("127.0.0.1", 1))] * 8)
+        server.receiver = DatagramReceiver(sock, 100, batch_size=4)
+        server.receive()
+        assert not sock.datagrams
+        assert server.receiver.received == 8
+    finally:
+        server.socket.close()
@@ -0,0 +1,65 @@
+"""
+Entity ids with recycled indices and generations (see EntityIdAllocator).
+"""
+import pytest
+
+from entity_ids import EntityIdAllocator
+
+INDEX = EntityIdAllocator.INDEX_MASK
+
+
+def test_ids_are_small_and_never_zero():
+    allocator = EntityIdAllocator()
+    assert [allocator.allocate() for _ in range(3)] == [1, 2, 3]
+
+
+def test_freed_index_is_reused_with_the_next_generation():
+    allocator = EntityIdAllocator()
+    first = allocator.allocate()
+    allocator.allocate()
+    allocator.release(first)
+    reused = allocator.allocate()
+    assert reused & INDEX == first & INDEX
+    assert reused >> EntityIdAllocator.INDEX_BITS == (first >> EntityIdAllocator.INDEX_BITS) + 1
+    assert reused != first
+
+
+def test_releasing_a_stale_id_keeps_the_new_entity():
+    allocator = EntityIdAllocator()
+    first = allocator.allocate()
+    allocator.release(first)
+    reused = allocator.allocate()
+    allocator.release(first)  # e.g. a late packet about the removed entity
+    allocator.release(first)
+    assert allocator.allocate() != reused
+    allocator.release(reused)
+    allocator.release(reused)  # only freed once
+    assert len({allocator.allocate(), allocator.allocate()}) == 2
+
+
+def test_generation_wraps_around():
+    allocator = EntityIdAllocator()
+    first = allocator.allocate()
+    entity_id = first
+    ids = set()
+    for _ in range(EntityIdAllocator.GENERATION_MASK):
+        allocator.release(entity_id)
+        entity_id = allocator.allocate()
+        assert entity_id & INDEX == first & INDEX
+        assert entity_id < 2 ** 32  # ids are u32 on the wire
+        ids.add(entity_id)
+    assert len(ids) == EntityIdAllocator.GENERATION_MASK and first not in ids
+    allocator.release(entity_id)
+    assert allocator.allocate() == first  # the generation starts over
+
+
+def test_exhaustion():
+    allocator = EntityIdAllocator()
+    ids = [allocator.allocate() for _ in range(INDEX)]
+    assert len(set(ids)) == INDEX
+    with pytest.raises(RuntimeError):
+        allocator.allocate()
+    allocator.release(ids[100])
+    assert allocator.allocate() & INDEX == ids[100] & INDEX
+    with pytest.raises(RuntimeError):
+        allocator.allocate()
@@ -0,0 +1,35 @@
+"""
+Frames of the reliability layer (see FrameBuffer and split_datagram()), as received from untrusted senders.
+"""
+import pytest
+
+from common.src import networking
+from common.src.packets import PingPacket
+from server import Server
+
+
+def _frame(reliable: bool) -> bytes:
+    """:return: a frame with one (reliable) packet in it"""
+    frame_buffer = networking.FrameBuffer(networking.ReliableChannel())
+    frame_buffer.add(networking.serialize(PingPacket(), networking.CODEC_BINARY), reliable)
+    frame, = frame_buffer.flush()
+    return frame
+
+
+@pytest.mark.parametrize("reliable", [False, True])
+def test_truncated_frames_are_dropped(reliable):
+    frame = _frame(reliable)
+    assert len(networking.split_datagram(frame, networking.ReliableChannel())) == 1
+    for size in range(1, len(frame)):
+        # cut off in the frame header, an item header, the seq of a reliable packet or the packet itself
+        assert networking.split_datagram(frame[:size], networking.ReliableChannel()) == []
+
+
+def test_truncated_frame_from_unknown_sender():
+    server = Server(address=("127.0.0.1", 0))
+    try:
+        # frames pass the traffic filter without a session; a frame with one byte of an item header
+        assert server._decode_datagram(_frame(False)[:8], ("127.0.0.1", 50000)) == []
+        assert server._decode_datagram(_frame(False), ("127.0.0.1", 50000))
+    finally:
+        server.socket.close()
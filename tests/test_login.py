@@ -0,0 +1,40 @@
+"""
+Logging in with a HelloPacket (see PlayerManager.on_hello()).
+"""
+import pytest
+
+from common.src.packets import HelloPacket, MAX_NAME_LENGTH
+from common.src.snapshots import EntityState, WorldEntity, decode_world, encode_world
+from player_manager import PlayerManager
+from server import Server
+
+
+@pytest.fixture
+def server():
+    server = Server(address=("127.0.0.1", 0))
+    yield server
+    server.socket.close()
+
+
+def _hello(server: Server, name, addr: tuple, spectator: bool = False):
+    player_manager = next(mechanics for mechanics in server.mechanics if isinstance(mechanics, PlayerManager))
+    player_manager.on_hello(HelloPacket(name, ["json"], [], [], [], spectator=spectator), addr)
+
+
+@pytest.mark.parametrize("name", ["", "x" * (MAX_NAME_LENGTH + 1), "ä" * 300, None, 5])
+@pytest.mark.parametrize("spectator", [False, True])
+def test_invalid_name_gets_no_session(server, name, spectator):
+    _hello(server, name, ("127.0.0.1", 40001), spectator)
+    assert not server.sessions
+    assert not server.entities
+
+
+def test_longest_name_logs_in(server):
+    _hello(server, "ä" * MAX_NAME_LENGTH, ("127.0.0.1", 40001))
+    assert server.get_client(("127.0.0.1", 40001)) is not None
+
+
+def test_world_snapshot_with_long_strings():
+    entities = [WorldEntity(1, "player", "ä" * 300, EntityState(1, 2, 100, 0, False)),
+                WorldEntity(2, "goblin", "", EntityState(-3, 4, 5, 1, True))]
+    assert decode_world(encode_world(entities)) == entities
@@ -0,0 +1,28 @@
+"""
+The map cache of the client (see MapCache), with the map hashes the server announces.
+"""
+import os
+
+import pytest
+
+from client.src.map_cache import MapCache
+
+
+@pytest.mark.parametrize("map_hash", ["../victim", "{tmp_path}/victim", "0123456789ABCDEF", "0123456789abcde",
+                                      "0123456789abcdef0", "..", "", None])
+def test_invalid_hash_is_a_cache_miss(tmp_path, map_hash):
+    if map_hash:
+        map_hash = map_hash.format(tmp_path=tmp_path)
+    victim = tmp_path / "victim.map"
+    victim.write_bytes(b"not a map")
+    cache = MapCache(str(tmp_path / "cache"))
+    cache.store(map_hash, b"data")
+    assert cache.load("map", map_hash) is None
+    assert victim.read_bytes() == b"not a map"
+    assert os.listdir(cache.directory) == []
+
+
+def test_valid_hash_is_stored(tmp_path):
+    cache = MapCache(str(tmp_path))
+    cache.store("0123456789abcdef", b"data")
+    assert cache.hashes() == ["0123456789abcdef"]
@@ -0,0 +1,64 @@
+"""
+The server and the clients generate a map from its MapSeed independently (see common/src/map/generation.py), so the
+generation has to give the same tiles for the same seed in every process, whatever else used the random module.
+"""
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+from common.src.map.generation import MapSeed, generate_map
+from common.src.map.transfer import MapTransfer
+
+SEEDS = [0, 1, 42, 1934285326, 2 ** 32 - 1]
+SIZE = 20  # the size of the maps the server generates (see MapManager.generate_map())
+
+_GENERATE = """
+import sys
+sys.path.insert(1, sys.argv[1])
+from common.src.map.generation import MapSeed, generate_map
+from common.src.map.transfer import MapTransfer
+game_map = generate_map(MapSeed(int(sys.argv[2]), int(sys.argv[3])))
+print(MapTransfer(game_map).map_hash)
+print(repr(game_map.tiles))
+"""
+
+
+def _generate(seed: int) -> tuple[str, list[list[str]]]:
+    """:return: the map hash and the tiles of the map generated from the seed"""
+    game_map = generate_map(MapSeed(seed, SIZE))
+    return MapTransfer(game_map).map_hash, game_map.tiles
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_same_seed_same_map(seed):
+    map_hash, tiles = _generate(seed)
+    assert _generate(seed) == (map_hash, tiles)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_independent_of_global_random_state(seed):
+    random.seed(1)
+    expected = _generate(seed)
+    random.seed(2)
+    random.random()
+    assert _generate(seed) == expected
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_same_map_in_fresh_process(seed):
+    map_hash, tiles = _generate(seed)
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    # another hash seed, like another client process; e.g. set iteration order depends on it
+    env = dict(os.environ, PYTHONHASHSEED=str(seed % 1000 + 1))
+    result = subprocess.run([sys.executable, "-c", _GENERATE, root, str(seed), str(SIZE)], env=env,
+                            capture_output=True, text=True, check=True)
+    output_hash, output_tiles = result.stdout.splitlines()
+    assert output_hash == map_hash
+    assert output_tiles == repr(tiles)
+
+
+def test_different_seeds_different_maps():
+    assert len({_generate(seed)[0] for seed in SEEDS}) == len(SEEDS)
@@ -0,0 +1,88 @@
+"""
+Encoding and decoding every packet type with both codecs (see networking.py), and negotiating the codec in the
+handshake (see HelloPacket).
+"""
+import pytest
+from pygame import Vector2
+
+from common.src import compression, networking
+from common.src.packets import HelloPacket, HelloReplyPacket
+from player_manager import PlayerManager
+from server import Server
+
+# values of each field type: the biggest (or longest) ones and the smallest (or empty) ones
+_VALUES = {
+    "bool": (True, False),
+    "u8": (255, 0),
+    "u16": (65535, 0),
+    "u32": (2 ** 32 - 1, 0),
+    "i16": (-32768, 32767),
+    "i32": (-2 ** 31, 2 ** 31 - 1),
+    "f32": (-1.5, 0.0),
+    "f64": (1 / 3, 0.0),
+    "str": ("Spieler ä€🙂", ""),
+    "bytes": (bytes(range(256)), b""),
+    "vec2": (Vector2(1.5, -2.25), Vector2(0, 0)),
+}
+PACKET_CLASSES = sorted(networking._codecs_by_class, key=lambda clazz: clazz.packet_id)
+
+
+def _value(type_name: str, extreme: bool):
+    """:return: a value of a field type (see networking.parse_field_type())"""
+    if type_name.endswith("?"):
+        return _value(type_name[:-1], extreme) if extreme else None
+    if type_name.startswith("list[") and type_name.endswith("]"):
+        return [_value(type_name[5:-1], True), _value(type_name[5:-1], False)] if extreme else []
+    return _VALUES[type_name][0 if extreme else 1]
+
+
+def _packet(clazz: type, extreme: bool):
+    """:return: a packet of the class with a value of each field"""
+    packet = clazz.__new__(clazz)
+    for name, type_name in clazz.fields:
+        setattr(packet, name, _value(type_name, extreme))
+    return packet
+
+
+def test_every_field_type_has_values():
+    assert set(_VALUES) == set(networking._FIELD_TYPES)
+
+
+@pytest.mark.parametrize("extreme", [True, False])
+@pytest.mark.parametrize("codec", networking.CODECS)
+@pytest.mark.parametrize("clazz", PACKET_CLASSES, ids=lambda clazz: clazz.__name__)
+def test_round_trip(clazz, codec, extreme):
+    packet = _packet(clazz, extreme)
+    for compressed in (False, True):
+        decoded = networking.deserialize(networking.encode(packet, codec, compressed).data)
+        assert type(decoded) is clazz
+        assert decoded.__dict__ == packet.__dict__
+
+
+@pytest.mark.parametrize("clazz", PACKET_CLASSES, ids=lambda clazz: clazz.__name__)
+def test_truncated_binary_packet_is_rejected(clazz):
+    data = networking.serialize(_packet(clazz, True), networking.CODEC_BINARY)
+    for size in range(1, len(data)):
+        assert networking.deserialize(data[:size]) is None
+
+
+@pytest.mark.parametrize("server_codecs, client_codecs, codec", [
+    (networking.CODECS, [networking.CODEC_BINARY, networking.CODEC_JSON], networking.CODEC_BINARY),
+    (networking.CODECS, [networking.CODEC_JSON, networking.CODEC_BINARY], networking.CODEC_JSON),
+    ((networking.CODEC_JSON,), [networking.CODEC_BINARY, networking.CODEC_JSON], networking.CODEC_JSON),
+    (networking.CODECS, ["unknown"], networking.CODEC_JSON),  # json is always supported
+    (networking.CODECS, [], networking.CODEC_JSON),
+])
+def test_codec_negotiation(server_codecs, client_codecs, codec):
+    server = Server(server_codecs, address=("127.0.0.1", 0))
+    try:
+        addr = ("127.0.0.1", 40001)
+        player_manager = next(mechanics for mechanics in server.mechanics if isinstance(mechanics, PlayerManager))
+        player_manager.on_hello(HelloPacket("player", client_codecs, list(compression.COMPRESSIONS), [], []), addr)
+        assert server.peer_codecs[addr] == codec
+        replies = [networking.deserialize(data) for _, _, data, _ in server.schedulers[addr]._queue]
+        reply = next(packet for packet in replies if isinstance(packet, HelloReplyPacket))
+        assert reply.codec == codec
+        assert reply.compression == compression.COMPRESSIONS[0]
+    finally:
+        server.socket.close()
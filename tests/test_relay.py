@@ -0,0 +1,39 @@
+"""
+Passing the map of the game server on to the spectators of a relay (see RelayUpstream).
+"""
+import pytest
+
+from common.src import networking
+from common.src.packets import HelloPacket, MapChangePacket, MapChunkPacket
+from relay import RelayServer
+
+
+@pytest.fixture
+def relay():
+    relay = RelayServer(("127.0.0.1", 9), address=("127.0.0.1", 0))
+    relay.upstream.ready = True
+    yield relay
+    relay.socket.close()
+    relay.upstream.socket.close()
+
+
+def _sent_packet_types(relay: RelayServer, addr: tuple) -> list[type]:
+    """:return: the types of the packets queued for the address since the last call"""
+    scheduler = relay.schedulers[addr]
+    packet_types = [networking.deserialize(data).__class__ for _, _, data, _ in scheduler._queue]
+    scheduler._queue.clear()
+    return packet_types
+
+
+def test_spectators_with_the_map_cached_get_no_chunks(relay):
+    cached, uncached = ("127.0.0.1", 40001), ("127.0.0.1", 40002)
+    map_hash = relay.map_transfer.map_hash
+    relay.player_manager.on_hello(HelloPacket("cached", ["json"], [], [map_hash], [], spectator=True), cached)
+    relay.player_manager.on_hello(HelloPacket("uncached", ["json"], [], [], [], spectator=True), uncached)
+    assert MapChunkPacket not in _sent_packet_types(relay, cached)
+    assert MapChunkPacket in _sent_packet_types(relay, uncached)
+
+    # the game server announces the map again, e.g. after the relay logged in again
+    relay.upstream._set_map(relay.current_map)
+    assert _sent_packet_types(relay, cached) == [MapChangePacket]
+    assert MapChunkPacket in _sent_packet_types(relay, uncached)
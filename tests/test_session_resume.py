@@ -0,0 +1,85 @@
+"""
+Resuming a session after the connection broke off (see PlayerManager.on_hello() and HelloPacket).
+"""
+import secrets
+
+import pytest
+
+from common.src import networking
+from common.src.packets import HelloPacket
+from common.src.snapshots import hash_entity_ids
+from player_manager import PlayerManager
+from server import Server
+from traffic_filter import TrafficFilter
+
+MAP_CACHE_ENTRIES = 16  # MapCache.MAX_ENTRIES of the client
+
+
+def _resume_hello(name: str, resume_token: bytes, entity_ids) -> HelloPacket:
+    """:return: the HelloPacket of a resuming client, with as much in it as the client sends"""
+    return HelloPacket(name, list(networking.CODECS), ["zlib"], [secrets.token_hex(8) for _ in range(MAP_CACHE_ENTRIES)],
+                       [1], resume_token, 123456, hash_entity_ids(entity_ids), secrets.token_hex(8))
+
+
+@pytest.fixture
+def server():
+    server = Server(address=("127.0.0.1", 0))
+    yield server
+    server.socket.close()
+
+
+def _player_manager(server: Server) -> PlayerManager:
+    return next(mechanics for mechanics in server.mechanics if isinstance(mechanics, PlayerManager))
+
+
+def _login(server: Server, name: str, addr: tuple):
+    _player_manager(server).on_hello(HelloPacket(name, ["json"], [], [], []), addr)
+    return server.get_client(addr)
+
+
+@pytest.mark.parametrize("entity_count", [0, 80, 1000])
+def test_resume_hello_fits_into_a_datagram(entity_count):
+    # the hello is sent as json, before a codec is negotiated; the server drops bigger datagrams unread
+    packet = _resume_hello("Player123", secrets.token_bytes(16), range(1, entity_count + 1))
+    frame_buffer = networking.FrameBuffer(networking.ReliableChannel())
+    frame_buffer.add(networking.serialize(packet, networking.CODEC_JSON), packet.reliable)
+    frame, = frame_buffer.flush()
+    assert len(frame) <= TrafficFilter.MAX_DATAGRAM_SIZE
+
+
+def test_resume_keeps_known_entities(server):
+    client = _login(server, "resumer", ("127.0.0.1", 40001))
+    client.known_entities = {client.entity_id, 7, 8}
+    client.joined = True
+    server.suspend_client(client)
+    _player_manager(server).on_hello(_resume_hello("resumer", client.resume_token, [client.entity_id, 7, 8]),
+                                   ("127.0.0.1", 40002))
+    assert server.get_client(("127.0.0.1", 40002)) is client
+    assert client.joined and client.known_entities == {client.entity_id, 7, 8}
+
+
+def test_resume_with_other_entities_joins_again(server):
+    client = _login(server, "resumer", ("127.0.0.1", 40001))
+    client.known_entities = {client.entity_id, 7, 8}
+    client.joined = True
+    server.suspend_client(client)
+    # the removal of entity 8 was lost when the connection broke off
+    _player_manager(server).on_hello(_resume_hello("resumer", client.resume_token, [client.entity_id, 7]),
+                                   ("127.0.0.1", 40002))
+    assert server.get_client(("127.0.0.1", 40002)) is client
+    assert not client.joined  # the InterestManager sends a join snapshot with all entities
+
+
+def test_name_of_suspended_session_needs_resume_token(server):
+    client = _login(server, "victim", ("127.0.0.1", 40001))
+    server.suspend_client(client)
+
+    # someone else logs in with the name, without the token (or with a wrong one)
+    assert _login(server, "victim", ("127.0.0.1", 40003)) is None
+    _player_manager(server).on_hello(_resume_hello("victim", secrets.token_bytes(16), []), ("127.0.0.1", 40003))
+    assert server.get_client(("127.0.0.1", 40003)) is None
+    assert server.suspended_clients[client.resume_token] is client
+
+    # the session expired; the name is free again
+    server.remove_client(client)
+    assert _login(server, "victim", ("127.0.0.1", 40003)) is not None
@@ -0,0 +1,148 @@
+"""
+Delta snapshots of the entity state (see snapshots.py and SnapshotManager).
+"""
+import pytest
+
+from common.src import networking
+from common.src.packets import EntitySnapshotPacket, HelloPacket, SnapshotAckPacket
+from common.src.snapshots import EntityState, apply_delta, encode_delta
+from player_manager import PlayerManager
+from server import Server
+from snapshot_manager import SnapshotManager
+
+
+@pytest.fixture
+def server():
+    server = Server(address=("127.0.0.1", 0))
+    yield server
+    server.socket.close()
+
+
+def _mechanics(server: Server, mechanics_class: type):
+    return next(mechanics for mechanics in server.mechanics if isinstance(mechanics, mechanics_class))
+
+
+def _login(server: Server, name: str, addr: tuple):
+    _mechanics(server, PlayerManager).on_hello(HelloPacket(name, ["json"], [], [], []), addr)
+    return server.get_client(addr)
+
+
+def _snapshot_tick(snapshot_manager: SnapshotManager):
+    snapshot_manager.last_snapshot_time = 0  # the interval passed
+    snapshot_manager.tick()
+
+
+def test_old_snapshots_are_pruned_except_for_the_baseline(server):
+    snapshot_manager = _mechanics(server, SnapshotManager)
+    client = _login(server, "player", ("127.0.0.1", 40001))
+    snapshot_manager.tick_number = 200
+    # e.g. a resumed session, whose baseline is older than the history
+    client.sent_snapshots = {5: {}, 100: {}, 150: {}, 190: {}}
+    client.acked_snapshot = 100
+    client.known_entities = {client.entity_id}
+
+    _snapshot_tick(snapshot_manager)
+    assert snapshot_manager.tick_number == 201
+    assert list(client.sent_snapshots) == [100, 150, 190, 201]
+
+    snapshot_manager.on_snapshot_ack(SnapshotAckPacket(201), client.addr)
+    snapshot_manager.tick_number += SnapshotManager.HISTORY_SIZE
+    client.known_entities = set()
+    _snapshot_tick(snapshot_manager)
+    assert list(client.sent_snapshots) == [201, 201 + SnapshotManager.HISTORY_SIZE + 1]
+
+
+BASE = {1: EntityState(1, 2, 50, 0, False), 2: EntityState(5, 5, 20, 3, True), 3: EntityState(-1, 0, 1, 0, False)}
+
+
+def test_delta_with_changed_added_and_removed_entities():
+    current = {1: EntityState(1, 3, 50, 2, False), 3: BASE[3], 4: EntityState(7, 8, 30, 1, True)}
+    snapshot, changed = apply_delta(BASE, encode_delta(BASE, current))
+    assert snapshot == current
+    assert sorted(changed) == [1, 4]
+
+
+def test_delta_only_contains_changed_fields():
+    current = dict(BASE)
+    current[1] = BASE[1]._replace(health=49)
+    assert len(encode_delta(BASE, current)) < len(encode_delta(BASE, {**current, 2: BASE[2]._replace(x=6)}))
+    assert len(encode_delta({}, current)) > len(encode_delta(BASE, current))
+
+
+def test_full_snapshot_and_equal_snapshots():
+    assert apply_delta({}, encode_delta({}, BASE)) == (BASE, list(BASE))
+    assert encode_delta(BASE, dict(BASE)) is None
+    assert apply_delta(BASE, encode_delta(BASE, {}))[0] == {}
+
+
+def test_delta_applied_to_the_wrong_baseline():
+    # the delta only has the fields that changed since its baseline, so a client has to apply it to that baseline
+    # (see EntitySnapshotPacket.base_tick); on another snapshot, the result is wrong
+    newer = {**BASE, 1: BASE[1]._replace(x=4, y=4)}
+    current = {**newer, 1: newer[1]._replace(health=10)}
+    delta = encode_delta(BASE, current)
+    assert apply_delta(BASE, delta)[0] == current
+    assert apply_delta({}, delta)[0] != current
+    assert apply_delta(newer, encode_delta(newer, current))[0] == current
+
+
+def _sent_snapshots(server: Server, addr: tuple) -> list[EntitySnapshotPacket]:
+    """:return: the entity snapshots queued for the address since the last call"""
+    scheduler = server.schedulers[addr]
+    packets = [networking.deserialize(data) for _, _, data, _ in scheduler._queue]
+    scheduler._queue.clear()
+    return [packet for packet in packets if isinstance(packet, EntitySnapshotPacket)]
+
+
+def test_delta_against_the_acknowledged_snapshot(server):
+    snapshot_manager = _mechanics(server, SnapshotManager)
+    client = _login(server, "player", ("127.0.0.1", 40001))
+    client.known_entities = {client.entity_id}
+    _snapshot_tick(snapshot_manager)
+    full, = _sent_snapshots(server, client.addr)
+    assert full.base_tick == 0
+    client_snapshot, _ = apply_delta({}, full.delta)
+
+    # not acknowledged yet: the next delta is still a full snapshot
+    client.position.x += 1
+    _snapshot_tick(snapshot_manager)
+    unacked, = _sent_snapshots(server, client.addr)
+    assert unacked.base_tick == 0 and unacked.tick == full.tick + 1
+
+    # acknowledgements of older or unknown snapshots don't change the baseline
+    snapshot_manager.on_snapshot_ack(SnapshotAckPacket(full.tick), client.addr)
+    snapshot_manager.on_snapshot_ack(SnapshotAckPacket(unacked.tick + 5), client.addr)
+    snapshot_manager.on_snapshot_ack(SnapshotAckPacket(0), client.addr)
+    assert client.acked_snapshot == full.tick
+
+    client.health -= 1
+    _snapshot_tick(snapshot_manager)
+    delta, = _sent_snapshots(server, client.addr)
+    assert delta.base_tick == full.tick
+    snapshot, changed = apply_delta(client_snapshot, delta.delta)
+    assert changed == [client.entity_id]
+    assert snapshot[client.entity_id].x == int(client.position.x)
+    assert snapshot[client.entity_id].health == client.health
+
+    # nothing changed: the newest snapshot is sent again until it is acknowledged
+    _snapshot_tick(snapshot_manager)
+    again, = _sent_snapshots(server, client.addr)
+    assert (again.tick, again.base_tick) == (delta.tick, full.tick)
+    snapshot_manager.on_snapshot_ack(SnapshotAckPacket(delta.tick), client.addr)
+    _snapshot_tick(snapshot_manager)
+    assert _sent_snapshots(server, client.addr) == []
+
+
+def test_baseline_older_than_the_history_results_in_a_full_snapshot(server):
+    snapshot_manager = _mechanics(server, SnapshotManager)
+    client = _login(server, "player", ("127.0.0.1", 40001))
+    client.known_entities = {client.entity_id}
+    _snapshot_tick(snapshot_manager)
+    _sent_snapshots(server, client.addr)
+    client.sent_snapshots.clear()  # e.g. the baseline was pruned
+    client.acked_snapshot = snapshot_manager.tick_number
+    client.position.x += 1
+    _snapshot_tick(snapshot_manager)
+    full, = _sent_snapshots(server, client.addr)
+    assert full.base_tick == 0
+    assert list(apply_delta({}, full.delta)[0]) == [client.entity_id]
@@ -0,0 +1,45 @@
+"""
+Batching the tile changes of the map into TileChangePackets (see TileManager).
+"""
+import pytest
+
+from common.src import networking
+from server import Server
+from tile_manager import TileManager
+
+BINARY_CLIENT = ("127.0.0.1", 40001)
+JSON_CLIENT = ("127.0.0.1", 40002)
+
+
+@pytest.fixture
+def server():
+    server = Server(address=("127.0.0.1", 0))
+    server.peer_codecs[BINARY_CLIENT] = networking.CODEC_BINARY
+    server.peer_codecs[JSON_CLIENT] = networking.CODEC_JSON
+    yield server
+    server.socket.close()
+
+
+def _tile_manager(server: Server) -> TileManager:
+    return next(mechanics for mechanics in server.mechanics if isinstance(mechanics, TileManager))
+
+
+@pytest.mark.parametrize("addrs", [[BINARY_CLIENT], [JSON_CLIENT], [BINARY_CLIENT, JSON_CLIENT]])
+@pytest.mark.parametrize("tile_length", [1, 15, 60])
+def test_every_batch_fits_into_a_frame(server, addrs, tile_length):
+    changes = {(x, y): chr(ord("a") + x % 26) * tile_length for x in range(1000, 1040) for y in range(1000, 1040)}
+    packets = _tile_manager(server)._packets(changes, addrs)
+    assert sum(len(packet.xs) for packet in packets) == len(changes)
+    for addr in addrs:
+        for packet in packets:
+            frame_buffer = networking.FrameBuffer(networking.ReliableChannel(), server.mtu)
+            frame_buffer.add(networking.serialize(packet, server.peer_codecs[addr]), packet.reliable)
+            frame, = frame_buffer.flush()
+            assert len(frame) <= server.mtu
+
+
+def test_batches_are_full(server):
+    changes = {(x, 0): "floor_clear" for x in range(1000)}
+    packets = _tile_manager(server)._packets(changes, [BINARY_CLIENT])
+    size = sum(len(networking.serialize(packet, networking.CODEC_BINARY)) for packet in packets)
+    assert len(packets) <= size // (server.mtu - networking.RELIABLE_FRAME_OVERHEAD) + 2
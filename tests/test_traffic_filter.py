@@ -0,0 +1,35 @@
+"""
+The rate limits of the traffic filter when more addresses send something than it keeps buckets for.
+"""
+from common.src import networking
+from traffic_filter import TrafficFilter
+
+FRAME = bytes((networking.FRAME_MARKER,)) + bytes(6)
+
+
+def test_new_sender_evicts_the_longest_silent_unknown_address(monkeypatch):
+    monkeypatch.setattr(TrafficFilter, "MAX_ADDRESSES", 3)
+    traffic_filter = TrafficFilter()
+    client = ("10.0.0.1", 1)
+    assert traffic_filter.accept(FRAME, client, True)
+    client_bucket = traffic_filter._client_buckets[client]
+    for port in range(1, 4):
+        assert traffic_filter.accept(FRAME, ("10.0.0.2", port), False)
+
+    # a flood of spoofed addresses doesn't lock out new players, nor evict the ones that are logged in
+    for port in range(100, 200):
+        assert traffic_filter.accept(FRAME, ("10.0.0.3", port), False)
+    assert traffic_filter.accept(FRAME, ("10.0.0.4", 1), False)
+    assert traffic_filter._client_buckets[client] is client_bucket
+    assert list(traffic_filter._buckets) == [("10.0.0.3", 198), ("10.0.0.3", 199), ("10.0.0.4", 1)]
+    assert not traffic_filter.dropped
+
+
+def test_longest_silent_address_is_evicted(monkeypatch):
+    monkeypatch.setattr(TrafficFilter, "MAX_ADDRESSES", 2)
+    traffic_filter = TrafficFilter()
+    assert traffic_filter.accept(FRAME, ("10.0.0.2", 1), False)
+    assert traffic_filter.accept(FRAME, ("10.0.0.2", 2), False)
+    assert traffic_filter.accept(FRAME, ("10.0.0.2", 1), False)
+    assert traffic_filter.accept(FRAME, ("10.0.0.2", 3), False)
+    assert list(traffic_filter._buckets) == [("10.0.0.2", 1), ("10.0.0.2", 3)]
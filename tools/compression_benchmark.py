@@ -0,0 +1,89 @@
+"""
+Benchmark of the packet compression (see common/src/compression.py).
+
+Builds typical packets of each type, compresses them the way the server does and reports the compression ratio (with
+and without our preset dictionary) and the CPU time per packet for compressing and decompressing.
+
+Usage: python tools/compression_benchmark.py [--entities <count>] [--map-size <tiles>]
+"""
+import os
+import random
+import sys
+import zlib
+from time import perf_counter
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.src import compression, networking
+from common.src.entities import EntityType
+from common.src.map.generation import MapSeed, generate_map
+from common.src.map.transfer import MapTransfer, encode_map
+from common.src.packets import *
+from common.src.snapshots import EntityState, WorldEntity, encode_delta, encode_world
+
+ROUNDS = 200  # compressions/decompressions per packet for the timing
+
+
+def _sample_packets(entity_count: int, map_size: int) -> list[tuple[str, Packet, str]]:
+    """:return: (description, packet, codec) of typical packets"""
+    rng = random.Random(1)
+    entity_types = [entity_type.value for entity_type in EntityType]
+    states = {entity_id: EntityState(rng.randrange(map_size), rng.randrange(map_size), rng.choice((10, 30, 50)),
+                                     rng.randrange(5), rng.random() < 0.2)
+              for entity_id in range(1, entity_count + 1)}
+    moved = {entity_id: state._replace(x=state.x + 1) if entity_id % 3 == 0 else state
+             for entity_id, state in states.items()}
+    world = encode_world([WorldEntity(entity_id, rng.choice(entity_types), f"player{entity_id}" if entity_id < 4 else "",
+                                      state) for entity_id, state in states.items()])
+    game_map = generate_map(MapSeed(1, map_size))
+    transfer = MapTransfer(game_map)
+    raw_map = encode_map(game_map)
+    return [
+        ("EntitySnapshot (full)", EntitySnapshotPacket(1, 0, encode_delta({}, states)), networking.CODEC_BINARY),
+        ("EntitySnapshot (delta)", EntitySnapshotPacket(2, 1, encode_delta(states, moved)), networking.CODEC_BINARY),
+        ("JoinSnapshot", JoinSnapshotPacket(0, 1, world[:1024]), networking.CODEC_BINARY),
+        ("MapChunk (zlib map data)", MapChunkPacket(transfer.map_hash, 0, transfer.chunks[0]), networking.CODEC_BINARY),
+        ("MapChunk (raw map encoding)", MapChunkPacket(transfer.map_hash, 0, raw_map[:1024]), networking.CODEC_BINARY),
+        ("EntitySpawn", EntitySpawnPacket(1, EntityType.SKELETON.value, (3, 4), 30), networking.CODEC_BINARY),
+        ("EntitySnapshot (json)", EntitySnapshotPacket(1, 0, encode_delta({}, states)), networking.CODEC_JSON),
+        ("MapChange (json)", MapChangePacket(game_map.name, transfer.map_hash, len(transfer.chunks)),
+         networking.CODEC_JSON),
+    ]
+
+
+def _time_per_call(function, *args) -> float:
+    """:return: average seconds per call"""
+    start = perf_counter()
+    for _ in range(ROUNDS):
+        function(*args)
+    return (perf_counter() - start) / ROUNDS
+
+
+def _compress_without_dictionary(data: bytes) -> bytes:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def main():
+    entity_count = int(sys.argv[sys.argv.index("--entities") + 1]) if "--entities" in sys.argv else 50
+    map_size = int(sys.argv[sys.argv.index("--map-size") + 1]) if "--map-size" in sys.argv else 32
+
+    print(f"Compression {compression.COMPRESSION_ZLIB}, dictionary of {len(compression._DICTIONARY)} bytes, "
+          f"threshold {compression.COMPRESSION_THRESHOLD} bytes, {entity_count} entities, map size {map_size}")
+    print(f"{'packet':<28} {'size':>6} {'dict':>6} {'ratio':>6} {'no dict':>8} {'compress':>10} {'decompress':>11}")
+    for description, packet, codec in _sample_packets(entity_count, map_size):
+        data = networking.serialize(packet, codec)
+        compressed = compression.compress(data)
+        without_dictionary = len(_compress_without_dictionary(data)) + 1
+        compress_time = _time_per_call(compression.compress, data)
+        if compressed is data:
+            decompress_time = 0.0  # sent uncompressed
+        else:
+            decompress_time = _time_per_call(compression.decompress, compressed)
+        print(f"{description:<28} {len(data):>6} {len(compressed):>6} {len(compressed) / len(data):>6.2f} "
+              f"{without_dictionary:>8} {compress_time * 1e6:>8.1f}µs {decompress_time * 1e6:>9.1f}µs")
+    print("(sizes in bytes; 'dict' is the size that is sent, the packet itself if compressing doesn't pay off)")
+
+
+if __name__ == '__main__':
+    main()
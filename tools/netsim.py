@@ -0,0 +1,418 @@
+"""
+Simulator of network conditions for testing the networking locally (see common/src/networking.py).
+
+A UDP proxy between clients and a server: clients connect to the proxy instead of the server, and every datagram is
+passed on through a simulated link for its direction - up (client to server) and down (server to client) - which
+delays it (with jitter, from a configurable distribution), loses it (also in bursts), duplicates it, reorders it and
+limits the bandwidth (with a bounded queue, like a router). Each client gets its own socket to the server, so the
+server still tells the clients apart, and its own links, like its own internet connection.
+
+The statistics of both directions are printed every few seconds and on exit, and can be written to a json file for
+comparing networking changes. The proxy can also be used from a script: create a NetworkSimulator, call tick() in a
+loop and change its `up` and `down` LinkConditions while it runs (e.g. to simulate an outage).
+
+Usage: python tools/netsim.py [--listen <port>] [--server <host>[:<port>]] [--profile <name>] [--seed <seed>]
+                              [--stats <seconds>] [--stats-file <path>] [--duration <seconds>] [<condition> ...]
+
+Conditions (for both directions, or with an --up-/--down- prefix for one of them, e.g. --up-loss 0.1):
+    --delay <ms>           one-way delay
+    --jitter <ms>          variation of the delay; its meaning depends on the distribution
+    --distribution <name>  uniform (delay +- jitter), normal (standard deviation jitter) or pareto (long tail)
+    --loss <fraction>      fraction of the datagrams that is lost
+    --loss-burst <count>   average number of datagrams lost in a row
+    --duplicate <fraction> fraction of the datagrams that is delivered twice
+    --reorder <fraction>   fraction of the datagrams that is held back behind the following ones
+    --bandwidth <kbit/s>   bandwidth of the link; 0 is unlimited
+    --queue <bytes>        size of the queue in front of a limited link; datagrams that don't fit are dropped
+
+Profiles: lan, wifi, dsl, mobile and bad; the conditions given as arguments change those of the profile.
+Example: python tools/netsim.py --listen 5859 --profile mobile --down-loss 0.05, then connect the client to port 5859
+"""
+import heapq
+import json
+import random
+import select
+import sys
+from socket import socket, AF_INET, SOCK_DGRAM
+from time import perf_counter
+
+LISTEN_ADDRESS = ('0.0.0.0', 5859)
+SERVER_ADDRESS = ('127.0.0.1', 5857)
+BUFSIZE = 65536
+UDP_OVERHEAD = 28  # bytes of the IP and UDP headers, which count for the bandwidth too
+SESSION_TIMEOUT = 60  # seconds after which the socket of a client that didn't send anything is closed
+STATS_INTERVAL = 5
+UNITS = {"delay": 0.001, "jitter": 0.001, "bandwidth": 1000}  # factors from the units of the arguments and profiles
+
+PROFILES = {  # name -> (conditions up, conditions down); delays in milliseconds, bandwidths in kbit/s
+    "lan": ({"delay": 1}, {"delay": 1}),
+    "wifi": ({"delay": 4, "jitter": 4, "loss": 0.005},
+             {"delay": 4, "jitter": 4, "loss": 0.005}),
+    "dsl": ({"delay": 15, "jitter": 2, "bandwidth": 1000, "queue": 16384},
+            {"delay": 15, "jitter": 2, "bandwidth": 16000, "queue": 65536}),
+    "mobile": ({"delay": 40, "jitter": 20, "distribution": "pareto", "loss": 0.02, "loss_burst": 2,
+                "duplicate": 0.002, "reorder": 0.01, "bandwidth": 2000, "queue": 16384},
+               {"delay": 40, "jitter": 20, "distribution": "pareto", "loss": 0.02, "loss_burst": 2,
+                "duplicate": 0.002, "reorder": 0.01, "bandwidth": 10000, "queue": 32768}),
+    "bad": ({"delay": 120, "jitter": 60, "distribution": "normal", "loss": 0.08, "loss_burst": 3,
+             "duplicate": 0.01, "reorder": 0.03, "bandwidth": 500, "queue": 8192},
+            {"delay": 120, "jitter": 60, "distribution": "normal", "loss": 0.08, "loss_burst": 3,
+             "duplicate": 0.01, "reorder": 0.03, "bandwidth": 2000, "queue": 16384}),
+}
+
+
+class LinkConditions:
+    """
+    The conditions of the links of one direction. Delays are in seconds and bandwidths in bits per second; the
+    conditions can be changed at any time and apply to the datagrams sent from then on.
+    """
+    DISTRIBUTIONS = ("uniform", "normal", "pareto")
+    PARETO_SHAPE = 3  # small enough for a long tail, big enough for a finite variance
+
+    def __init__(self, delay: float = 0.0, jitter: float = 0.0, distribution: str = "uniform", loss: float = 0.0,
+                 loss_burst: float = 1.0, duplicate: float = 0.0, reorder: float = 0.0, bandwidth: float = 0.0,
+                 queue: int = 65536):
+        if distribution not in self.DISTRIBUTIONS:
+            raise ValueError(f"Unknown delay distribution {distribution}; use one of {', '.join(self.DISTRIBUTIONS)}")
+        if not 0 <= loss < 1:
+            raise ValueError(f"Loss has to be at least 0 and less than 1, not {loss}")
+        self.delay = delay
+        self.jitter = jitter
+        self.distribution = distribution
+        self.loss = loss
+        self.loss_burst = max(loss_burst, 1.0)
+        self.duplicate = duplicate
+        self.reorder = reorder
+        self.bandwidth = bandwidth
+        self.queue = queue
+
+    def sample_delay(self, rng: random.Random) -> float:
+        """:return: the delay of a datagram in seconds, drawn from the distribution; never negative"""
+        if self.distribution == "normal":
+            delay = rng.gauss(self.delay, self.jitter)
+        elif self.distribution == "pareto":
+            # shifted so the mean is the delay; most datagrams are a bit faster, a few a lot slower
+            mean = self.PARETO_SHAPE / (self.PARETO_SHAPE - 1)
+            delay = self.delay + self.jitter * (rng.paretovariate(self.PARETO_SHAPE) - mean)
+        else:
+            delay = self.delay + rng.uniform(-self.jitter, self.jitter)
+        return max(delay, 0.0)
+
+    def __str__(self):
+        text = f"delay {self.delay * 1000:.0f} ms"
+        if self.jitter:
+            text += f" ± {self.jitter * 1000:.0f} ms ({self.distribution})"
+        if self.loss:
+            text += f", loss {self.loss:.1%}" + (f" in bursts of {self.loss_burst:g}" if self.loss_burst > 1 else "")
+        if self.duplicate:
+            text += f", duplicate {self.duplicate:.1%}"
+        if self.reorder:
+            text += f", reorder {self.reorder:.1%}"
+        if self.bandwidth:
+            text += f", {self.bandwidth / 1000:g} kbit/s with a queue of {self.queue} bytes"
+        return text
+
+
+class LinkStats:
+    """The statistics of all links of one direction."""
+
+    def __init__(self):
+        self.received = 0  # datagrams passed to the links
+        self.received_bytes = 0
+        self.delivered = 0  # datagrams (including duplicates) sent on to their receiver
+        self.delivered_bytes = 0
+        self.lost = 0  # datagrams dropped by the simulated loss
+        self.queue_drops = 0  # datagrams dropped because the queue of a limited link was full
+        self.duplicated = 0
+        self.reordered = 0  # datagrams delivered after a datagram that was sent later
+        self.delays: list[float] = []  # the delay of each delivered datagram in seconds, including the queueing
+
+    def percentile(self, fraction: float) -> float:
+        """:return: the delay in seconds that the given fraction of the delivered datagrams didn't exceed"""
+        if not self.delays:
+            return 0.0
+        delays = sorted(self.delays)
+        return delays[min(int(fraction * len(delays)), len(delays) - 1)]
+
+    def as_dict(self) -> dict:
+        return {
+            "received": self.received,
+            "received_bytes": self.received_bytes,
+            "delivered": self.delivered,
+            "delivered_bytes": self.delivered_bytes,
+            "lost": self.lost,
+            "queue_drops": self.queue_drops,
+            "duplicated": self.duplicated,
+            "reordered": self.reordered,
+            "delay_avg_ms": sum(self.delays) / len(self.delays) * 1000 if self.delays else 0.0,
+            "delay_p50_ms": self.percentile(0.5) * 1000,
+            "delay_p95_ms": self.percentile(0.95) * 1000,
+            "delay_p99_ms": self.percentile(0.99) * 1000,
+            "delay_max_ms": max(self.delays, default=0.0) * 1000,
+        }
+
+    def __str__(self):
+        stats = self.as_dict()
+        return (f"{self.received} datagrams ({self.received_bytes} bytes) in, {self.delivered} "
+                f"({self.delivered_bytes} bytes) out; lost {self.lost}, queue drops {self.queue_drops}, "
+                f"duplicated {self.duplicated}, reordered {self.reordered}; delay avg {stats['delay_avg_ms']:.1f} ms, "
+                f"p50 {stats['delay_p50_ms']:.1f} ms, p95 {stats['delay_p95_ms']:.1f} ms, "
+                f"p99 {stats['delay_p99_ms']:.1f} ms, max {stats['delay_max_ms']:.1f} ms")
+
+
+class Link:
+    """
+    One direction of the connection of one client. Datagrams are queued until they are due, in the order they are due,
+    so jitter reorders them just like the reorder fraction does.
+
+    The loss follows a two state (Gilbert) model: in the good state a datagram is lost with the probability that gives
+    the configured loss, and then the link stays in the bad state, losing every datagram, for `loss_burst` datagrams on
+    average. A limited bandwidth sends the datagrams one after the other; the time a datagram waits for the ones in
+    front of it is part of its delay.
+    """
+    REORDER_DELAY = 0.02  # seconds a reordered datagram is held back in addition to its delay
+
+    def __init__(self, conditions: LinkConditions, stats: LinkStats, rng: random.Random):
+        self.conditions = conditions
+        self.stats = stats
+        self.rng = rng
+        self.queue: list[tuple[float, int, int, float, bytes]] = []  # heap of (due, order, sequence, sent, datagram)
+        self.order = 0  # tiebreaker of the heap, so datagrams due at the same time keep their order
+        self.sequence = 0  # number of the next datagram passed to the link
+        self.last_delivered = -1  # sequence of the latest datagram delivered
+        self.losing = False  # whether the loss model is in its bad state
+        self.busy_until = 0.0  # time the limited link has sent all datagrams queued for it
+
+    def _lose(self) -> bool:
+        """:return: whether the next datagram is lost"""
+        conditions = self.conditions
+        if not conditions.loss:
+            self.losing = False
+            return False
+        if self.losing:
+            self.losing = self.rng.random() >= 1 / conditions.loss_burst
+        else:
+            # the probability of starting a burst, so that the link is in the bad state `loss` of the time
+            self.losing = self.rng.random() < conditions.loss / conditions.loss_burst / (1 - conditions.loss)
+        return self.losing
+
+    def _push(self, due: float, sequence: int, sent: float, data: bytes):
+        heapq.heappush(self.queue, (due, self.order, sequence, sent, data))
+        self.order += 1
+
+    def send(self, data: bytes, now: float):
+        """Pass a datagram to the link; it is delivered by deliver() when it is due, unless it is lost."""
+        conditions = self.conditions
+        stats = self.stats
+        stats.received += 1
+        stats.received_bytes += len(data)
+        sequence = self.sequence
+        self.sequence += 1
+        if self._lose():
+            stats.lost += 1
+            return
+
+        departure = now
+        if conditions.bandwidth:
+            # the link sends one datagram after the other; those that don't fit into the queue are dropped
+            busy_until = max(self.busy_until, now)
+            if (busy_until - now) * conditions.bandwidth / 8 + len(data) > conditions.queue:
+                stats.queue_drops += 1
+                return
+            departure = busy_until + (len(data) + UDP_OVERHEAD) * 8 / conditions.bandwidth
+            self.busy_until = departure
+
+        due = departure + conditions.sample_delay(self.rng)
+        if self.rng.random() < conditions.reorder:
+            due += self.REORDER_DELAY
+        self._push(due, sequence, now, data)
+        if self.rng.random() < conditions.duplicate:
+            stats.duplicated += 1
+            self._push(departure + conditions.sample_delay(self.rng), sequence, now, data)
+
+    def next_due(self) -> float | None:
+        """:return: the time the next datagram is due, or None if the link is empty"""
+        return self.queue[0][0] if self.queue else None
+
+    def deliver(self, now: float) -> list[bytes]:
+        """:return: the datagrams that are due, in the order they arrive"""
+        stats = self.stats
+        datagrams = []
+        while self.queue and self.queue[0][0] <= now:
+            due, _, sequence, sent, data = heapq.heappop(self.queue)
+            if sequence < self.last_delivered:
+                stats.reordered += 1
+            self.last_delivered = max(self.last_delivered, sequence)
+            stats.delivered += 1
+            stats.delivered_bytes += len(data)
+            stats.delays.append(now - sent)
+            datagrams.append(data)
+        return datagrams
+
+
+class ProxySession:
+    """A client of the proxy: its socket to the server and its links."""
+
+    def __init__(self, addr: tuple, server_address: tuple, up: Link, down: Link, now: float):
+        self.addr = addr  # address of the client
+        self.sock = socket(AF_INET, SOCK_DGRAM)  # socket to the server; the server knows the client by its address
+        self.sock.connect(server_address)
+        self.sock.setblocking(False)
+        self.up = up
+        self.down = down
+        self.last_active = now
+
+
+class NetworkSimulator:
+    """
+    The proxy. Call tick() in a loop; it waits for datagrams up to `max_wait` seconds, or until the next datagram is
+    due. The conditions of both directions are in `up` and `down`, their statistics in `up_stats` and `down_stats`.
+    """
+
+    def __init__(self, listen_address: tuple = LISTEN_ADDRESS, server_address: tuple = SERVER_ADDRESS,
+                 up: LinkConditions = None, down: LinkConditions = None, seed: int = None):
+        self.sock = socket(AF_INET, SOCK_DGRAM)
+        self.sock.bind(listen_address)
+        self.sock.setblocking(False)
+        self.server_address = server_address
+        self.up = up or LinkConditions()
+        self.down = down or LinkConditions()
+        self.up_stats = LinkStats()
+        self.down_stats = LinkStats()
+        self.rng = random.Random(seed)
+        self.sessions: dict[tuple, ProxySession] = {}  # client address -> session
+        self.sessions_by_sock: dict[socket, ProxySession] = {}
+
+    def _session(self, addr: tuple, now: float) -> ProxySession:
+        session = self.sessions.get(addr)
+        if session is None:
+            session = ProxySession(addr, self.server_address, Link(self.up, self.up_stats, self.rng),
+                                   Link(self.down, self.down_stats, self.rng), now)
+            self.sessions[addr] = session
+            self.sessions_by_sock[session.sock] = session
+            print(f"Client {addr[0]}:{addr[1]} connected through port {session.sock.getsockname()[1]}.")
+        return session
+
+    def _remove_idle_sessions(self, now: float):
+        for session in list(self.sessions.values()):
+            if now - session.last_active > SESSION_TIMEOUT and not session.up.queue and not session.down.queue:
+                del self.sessions[session.addr]
+                del self.sessions_by_sock[session.sock]
+                session.sock.close()
+                print(f"Client {session.addr[0]}:{session.addr[1]} timed out.")
+
+    def _receive(self, sock: socket) -> list[tuple[bytes, tuple]]:
+        datagrams = []
+        while True:
+            try:
+                datagrams.append(sock.recvfrom(BUFSIZE))
+            except (BlockingIOError, ConnectionError):
+                # ConnectionError: an ICMP port unreachable of an earlier datagram, e.g. when the server is not up yet
+                return datagrams
+
+    def tick(self, max_wait: float = 0.01):
+        """Receive the waiting datagrams, pass them to their links and send the datagrams that are due."""
+        now = perf_counter()
+        due = [due for session in self.sessions.values() for due in (session.up.next_due(), session.down.next_due())
+               if due is not None]
+        timeout = max(min(min(due, default=now + max_wait), now + max_wait) - now, 0.0)
+        readable, _, _ = select.select([self.sock, *self.sessions_by_sock], [], [], timeout)
+
+        now = perf_counter()
+        for sock in readable:
+            if sock is self.sock:
+                for data, addr in self._receive(sock):
+                    session = self._session(addr, now)
+                    session.last_active = now
+                    session.up.send(data, now)
+            else:
+                session = self.sessions_by_sock[sock]
+                for data, _ in self._receive(sock):
+                    session.down.send(data, now)
+
+        for session in self.sessions.values():
+            for data in session.up.deliver(now):
+                try:
+                    session.sock.send(data)
+                except ConnectionError:
+                    pass  # like a datagram lost on the way
+            for data in session.down.deliver(now):
+                self.sock.sendto(data, session.addr)
+        self._remove_idle_sessions(now)
+
+    def stats(self) -> dict:
+        """:return: the statistics of both directions, e.g. for a json file"""
+        return {"up": {"conditions": str(self.up), **self.up_stats.as_dict()},
+                "down": {"conditions": str(self.down), **self.down_stats.as_dict()}}
+
+    def print_stats(self):
+        print(f"  up:   {self.up_stats}")
+        print(f"  down: {self.down_stats}")
+
+
+def _conditions(profile: dict, direction: str) -> LinkConditions:
+    """:return: the conditions of the profile for the direction ("up" or "down"), changed by the arguments"""
+    values = dict(profile)
+    for option in ("delay", "jitter", "distribution", "loss", "loss-burst", "duplicate", "reorder", "bandwidth",
+                   "queue"):
+        for prefix in ("--", f"--{direction}-"):  # the option of the direction wins
+            if prefix + option in sys.argv:
+                values[option.replace("-", "_")] = sys.argv[sys.argv.index(prefix + option) + 1]
+    conditions = {}
+    for key, value in values.items():
+        if key == "distribution":
+            conditions[key] = value
+        elif key == "queue":
+            conditions[key] = int(value)
+        else:
+            conditions[key] = float(value) * UNITS.get(key, 1)
+    return LinkConditions(**conditions)
+
+
+def main():
+    """The simulator entry point; see the module docstring for the arguments."""
+    if "--help" in sys.argv:
+        print(__doc__)
+        return
+    port = int(sys.argv[sys.argv.index("--listen") + 1]) if "--listen" in sys.argv else LISTEN_ADDRESS[1]
+    server_address = SERVER_ADDRESS
+    if "--server" in sys.argv:
+        host, _, server_port = sys.argv[sys.argv.index("--server") + 1].partition(":")
+        server_address = (host, int(server_port) if server_port else SERVER_ADDRESS[1])
+    profile_name = sys.argv[sys.argv.index("--profile") + 1] if "--profile" in sys.argv else None
+    if profile_name is not None and profile_name not in PROFILES:
+        print(f"Unknown profile {profile_name}; use one of {', '.join(PROFILES)}")
+        return
+    up_profile, down_profile = PROFILES[profile_name] if profile_name else ({}, {})
+    seed = int(sys.argv[sys.argv.index("--seed") + 1]) if "--seed" in sys.argv else None
+    interval = float(sys.argv[sys.argv.index("--stats") + 1]) if "--stats" in sys.argv else STATS_INTERVAL
+    stats_file = sys.argv[sys.argv.index("--stats-file") + 1] if "--stats-file" in sys.argv else None
+    duration = float(sys.argv[sys.argv.index("--duration") + 1]) if "--duration" in sys.argv else None
+
+    simulator = NetworkSimulator((LISTEN_ADDRESS[0], port), server_address, _conditions(up_profile, "up"),
+                                 _conditions(down_profile, "down"), seed)
+    print(f"Simulating the network between port {port} and {server_address[0]}:{server_address[1]}...")
+    print(f"  up:   {simulator.up}")
+    print(f"  down: {simulator.down}")
+
+    start = last_stats = perf_counter()
+    while duration is None or perf_counter() - start < duration:
+        try:
+            simulator.tick()
+        except KeyboardInterrupt:
+            break
+        if perf_counter() - last_stats > interval:
+            last_stats = perf_counter()
+            print(f"After {last_stats - start:.0f} s:")
+            simulator.print_stats()
+
+    print("Shutting down...")
+    simulator.print_stats()
+    if stats_file:
+        with open(stats_file, "w") as file:
+            json.dump(simulator.stats(), file, indent=2)
+        print(f"Wrote the statistics to {stats_file}.")
+
+
+if __name__ == '__main__':
+    main()